@@ -0,0 +1,40 @@
+"""add_sheets_export_outbox
+
+Revision ID: 3f9c2a7d1e04
+Revises: 55443d1dee2b
+Create Date: 2026-10-18 10:12:41.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2a7d1e04'
+down_revision: Union[str, None] = '55443d1dee2b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('sheets_export_outbox',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('application_id', sa.BigInteger(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('exported_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['application_id'], ['applications.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sheets_export_outbox_pending', 'sheets_export_outbox', ['next_attempt_at'],
+                    unique=False, postgresql_where=sa.text('exported_at IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sheets_export_outbox_pending', table_name='sheets_export_outbox',
+                  postgresql_where=sa.text('exported_at IS NULL'))
+    op.drop_table('sheets_export_outbox')
@@ -0,0 +1,34 @@
+"""add_sync_watermarks
+
+Revision ID: 8b1e6d4c0a57
+Revises: 3f9c2a7d1e04
+Create Date: 2026-10-18 13:47:05.118320
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b1e6d4c0a57'
+down_revision: Union[str, None] = '3f9c2a7d1e04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('sync_watermarks',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('last_updated_at', sa.DateTime(), nullable=False),
+    sa.Column('last_id', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_index('ix_applications_updated_at_id', 'applications', ['updated_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_applications_updated_at_id', table_name='applications')
+    op.drop_table('sync_watermarks')
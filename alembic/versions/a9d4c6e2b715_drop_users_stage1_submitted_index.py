@@ -0,0 +1,32 @@
+"""drop_users_stage1_submitted_index
+
+Revision ID: a9d4c6e2b715
+Revises: f3b8d1a6c290
+Create Date: 2026-10-18 23:14:09.361842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d4c6e2b715'
+down_revision: Union[str, None] = 'f3b8d1a6c290'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Ни один запрос не фильтрует по stage1_submitted = 'submitted': индекс только замедлял запись
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_stage1_submitted', table_name='users',
+                      postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_stage1_submitted', 'users', ['telegram_id'], unique=False,
+                        postgresql_where=sa.text("stage1_submitted = 'submitted'"),
+                        postgresql_concurrently=True, if_not_exists=True)
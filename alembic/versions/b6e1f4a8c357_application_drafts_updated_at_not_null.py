@@ -0,0 +1,34 @@
+"""application_drafts_updated_at_not_null
+
+Revision ID: b6e1f4a8c357
+Revises: a9d4c6e2b715
+Create Date: 2026-10-19 00:02:51.604127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6e1f4a8c357'
+down_revision: Union[str, None] = 'a9d4c6e2b715'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Базы, на которых e5a2c7f91b48 успела создать столбец допускающим NULL
+    op.execute("UPDATE application_drafts SET updated_at = now() WHERE updated_at IS NULL")
+    op.alter_column('application_drafts', 'updated_at',
+                    existing_type=sa.DateTime(),
+                    existing_server_default=sa.text('now()'),
+                    nullable=False)
+
+
+def downgrade() -> None:
+    op.alter_column('application_drafts', 'updated_at',
+                    existing_type=sa.DateTime(),
+                    existing_server_default=sa.text('now()'),
+                    nullable=True)
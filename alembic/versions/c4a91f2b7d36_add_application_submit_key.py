@@ -0,0 +1,28 @@
+"""add_application_submit_key
+
+Revision ID: c4a91f2b7d36
+Revises: 8b1e6d4c0a57
+Create Date: 2026-10-18 16:02:19.530114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a91f2b7d36'
+down_revision: Union[str, None] = '8b1e6d4c0a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('applications', sa.Column('submit_key', sa.String(length=100), nullable=True))
+    op.create_index('ix_applications_submit_key', 'applications', ['submit_key'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_applications_submit_key', table_name='applications')
+    op.drop_column('applications', 'submit_key')
@@ -0,0 +1,49 @@
+"""add_hot_query_indexes
+
+Revision ID: d7e3b5a90c12
+Revises: c4a91f2b7d36
+Create Date: 2026-10-18 17:25:43.871902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7e3b5a90c12'
+down_revision: Union[str, None] = 'c4a91f2b7d36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в таблицы на время построения, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_applications_user_id', 'applications', ['user_id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_applications_email', 'applications', ['email'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_applications_phone', 'applications', ['phone'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_users_stage1_submitted', 'users', ['telegram_id'], unique=False,
+                        postgresql_where=sa.text("stage1_submitted = 'submitted'"),
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_sheets_export_outbox_application_id', 'sheets_export_outbox', ['application_id'],
+                        unique=False, postgresql_where=sa.text('exported_at IS NULL'),
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_sheets_export_outbox_application_id', table_name='sheets_export_outbox',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_users_stage1_submitted', table_name='users',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_applications_phone', table_name='applications',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_applications_email', table_name='applications',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_applications_user_id', table_name='applications',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,33 @@
+"""add_application_drafts
+
+Revision ID: e5a2c7f91b48
+Revises: d7e3b5a90c12
+Create Date: 2026-10-18 19:41:07.218463
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a2c7f91b48'
+down_revision: Union[str, None] = 'd7e3b5a90c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('application_drafts',
+    sa.Column('telegram_id', sa.BigInteger(), nullable=False),
+    sa.Column('state', sa.String(length=100), nullable=False),
+    sa.Column('data', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('telegram_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('application_drafts')
@@ -0,0 +1,29 @@
+"""add_sheets_export_outbox_failed_at
+
+Revision ID: f3b8d1a6c290
+Revises: e5a2c7f91b48
+Create Date: 2026-10-18 21:06:52.574190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d1a6c290'
+down_revision: Union[str, None] = 'e5a2c7f91b48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('sheets_export_outbox', sa.Column('failed_at', sa.DateTime(), nullable=True))
+    # В 3f9c2a7d1e04 значения по умолчанию не было: INSERT без attempts падал на NOT NULL
+    op.alter_column('sheets_export_outbox', 'attempts', server_default='0')
+
+
+def downgrade() -> None:
+    op.alter_column('sheets_export_outbox', 'attempts', server_default=None)
+    op.drop_column('sheets_export_outbox', 'failed_at')
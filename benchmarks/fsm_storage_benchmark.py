@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Размер и скорость форматов хранения FSM и контекстов aiogram-dialog
+
+Для каждого доступного формата и сжатия сериализует данные одного пользователя
+в середине анкеты (стек диалогов и контекст с длинными текстами) и печатает байты
+на пользователя и время dumps/loads. С --redis дополнительно замеряет get/set
+через CompactRedisStorage на Redis из .env и время апдейта диалога (чтение состояния,
+стека и контекста, запись контекста и стека) без кеша и с кешем процесса и пакетной
+записью CachedRedisStorage. Ключи удаляются после замера.
+
+Запуск из корня проекта:
+    python -m benchmarks.fsm_storage_benchmark --iterations 2000
+    python -m benchmarks.fsm_storage_benchmark --redis --users 200
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.redis import DefaultKeyBuilder
+from redis.asyncio import Redis
+
+from config.config import load_config
+from utils.fsm_storage import (
+    FsmSerializer, CompactRedisStorage, CachedRedisStorage, available_formats, available_compressions,
+)
+
+BOT_ID = 1
+KEY_BUILDER = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+
+def make_user_records(telegram_id: int) -> dict:
+    """Записи aiogram-dialog одного пользователя: стек и контекст анкеты"""
+    intent_id = uuid.uuid4().hex[:20]
+    stack = {
+        "_id": "",
+        "intents": [uuid.uuid4().hex[:20], intent_id],
+        "last_message_id": 1024,
+        "last_reply_keyboard": False,
+        "last_media_id": None,
+        "last_media_unique_id": None,
+        "last_income_media_group_id": None,
+    }
+    context = {
+        "_intent_id": intent_id,
+        "_stack_id": "",
+        "id": intent_id,
+        "state": "ApplicationSG:motivation",
+        "start_data": None,
+        "dialog_data": {
+            "full_name": "Тестов Тест Тестович",
+            "course": "2_bachelor",
+            "is_from_vsm": True,
+            "is_from_spbu": True,
+            "university": "СПбГУ, Высшая школа менеджмента",
+            "dormitory": False,
+            "email": f"user{telegram_id}@example.com",
+            "phone": "+79990000000",
+            "personal_qualities": "Ответственный, коммуникабельный, умею работать в команде. " * 20,
+            "motivation": "Хочу получить опыт организации крупного мероприятия и помочь команде. " * 20,
+            "logistics_rating": 5,
+            "marketing_rating": 4,
+            "pr_rating": 3,
+            "program_rating": 2,
+            "partners_rating": 1,
+        },
+        "widget_data": {"course_select": "2_bachelor", "ratings": {"logistics": 5, "marketing": 4}},
+        "access_settings": {"user_ids": [telegram_id], "custom": None},
+    }
+    return {"aiogd:stack:": stack, f"aiogd:context:{intent_id}": context}
+
+
+def serializers() -> list[FsmSerializer]:
+    return [FsmSerializer(fmt, compression) for fmt in available_formats() for compression in available_compressions()]
+
+
+def measure_serialization(records: dict, iterations: int):
+    print(f"{'формат':<10} {'сжатие':<8} {'байт/польз.':>12} {'dumps мкс':>10} {'loads мкс':>10}")
+    for serializer in serializers():
+        encoded = {destiny: serializer.dumps(data) for destiny, data in records.items()}
+        size = sum(len(raw) for raw in encoded.values())
+
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for data in records.values():
+                serializer.dumps(data)
+        dumps_time = (time.perf_counter() - started) / iterations
+
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for raw in encoded.values():
+                serializer.loads(raw)
+        loads_time = (time.perf_counter() - started) / iterations
+
+        print(f"{serializer.fmt:<10} {serializer.compression:<8} {size:>12} "
+              f"{dumps_time * 1e6:>10.1f} {loads_time * 1e6:>10.1f}")
+
+
+async def measure_redis(users: int):
+    config = load_config()
+    if config.redis.password:
+        redis = Redis.from_url(f"redis://:{config.redis.password}@{config.redis.host}:{config.redis.port}/0")
+    else:
+        redis = Redis.from_url(f"redis://{config.redis.host}:{config.redis.port}/0")
+
+    print(f"\nRedis {config.redis.host}:{config.redis.port}, {users} пользователей")
+    print(f"{'формат':<10} {'сжатие':<8} {'память/польз.':>14} {'set мс':>8} {'get мс':>8}")
+    try:
+        for serializer in serializers():
+            storage = CompactRedisStorage(redis=redis, serializer=serializer, key_builder=KEY_BUILDER)
+            keys = []
+            for index in range(users):
+                telegram_id = 900000000 + index
+                for destiny, data in make_user_records(telegram_id).items():
+                    key = StorageKey(bot_id=BOT_ID, chat_id=telegram_id, user_id=telegram_id, destiny=destiny)
+                    keys.append((key, data))
+
+            started = time.perf_counter()
+            for key, data in keys:
+                await storage.set_data(key, data)
+            set_time = (time.perf_counter() - started) / len(keys)
+
+            memory = 0
+            for key, _ in keys:
+                memory += await redis.memory_usage(storage.key_builder.build(key, "data")) or 0
+
+            started = time.perf_counter()
+            for key, _ in keys:
+                await storage.get_data(key)
+            get_time = (time.perf_counter() - started) / len(keys)
+
+            await redis.delete(*(storage.key_builder.build(key, "data") for key, _ in keys))
+            print(f"{serializer.fmt:<10} {serializer.compression:<8} {memory // users:>14} "
+                  f"{set_time * 1000:>8.3f} {get_time * 1000:>8.3f}")
+        await measure_updates(redis, users)
+    finally:
+        await redis.aclose()
+
+
+async def emulate_update(storage: CompactRedisStorage, telegram_id: int, records: dict):
+    """Обращения к хранилищу одного нажатия кнопки в анкете"""
+    keys = {
+        destiny: StorageKey(bot_id=BOT_ID, chat_id=telegram_id, user_id=telegram_id, destiny=destiny)
+        for destiny in records
+    }
+    state_key = StorageKey(bot_id=BOT_ID, chat_id=telegram_id, user_id=telegram_id)
+    cached = isinstance(storage, CachedRedisStorage)
+    if cached:
+        storage.begin_update()
+    try:
+        await storage.get_state(state_key)
+        for key in keys.values():
+            await storage.get_data(key)
+        for destiny, data in reversed(records.items()):
+            await storage.set_data(keys[destiny], data)
+        if cached:
+            await storage.flush_update()
+    finally:
+        if cached:
+            storage.end_update()
+
+
+async def measure_updates(redis: Redis, users: int, rounds: int = 5):
+    serializer = FsmSerializer("orjson" if "orjson" in available_formats() else "json")
+    print(f"\nАпдейт диалога ({serializer.fmt}, {users} пользователей x {rounds} нажатий)")
+    print(f"{'хранилище':<20} {'мс/апдейт':>10}")
+    for storage in (
+        CompactRedisStorage(redis=redis, serializer=serializer, key_builder=KEY_BUILDER),
+        CachedRedisStorage(redis=redis, serializer=serializer, key_builder=KEY_BUILDER),
+    ):
+        records = {telegram_id: make_user_records(telegram_id) for telegram_id in range(900000000, 900000000 + users)}
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for telegram_id, user_records in records.items():
+                # Каждый апдейт aiogram обрабатывает в своей задаче
+                await asyncio.create_task(emulate_update(storage, telegram_id, user_records))
+        elapsed = (time.perf_counter() - started) / (rounds * users)
+
+        await redis.delete(*(
+            storage.key_builder.build(
+                StorageKey(bot_id=BOT_ID, chat_id=telegram_id, user_id=telegram_id, destiny=destiny), "data"
+            )
+            for telegram_id, user_records in records.items() for destiny in user_records
+        ))
+        if isinstance(storage, CachedRedisStorage):
+            await redis.delete(*(f"fsm_version:{BOT_ID}:{telegram_id}" for telegram_id in records))
+        print(f"{type(storage).__name__:<20} {elapsed * 1000:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Форматы хранения FSM: размер и скорость")
+    parser.add_argument("--iterations", type=int, default=2000, help="Повторов сериализации")
+    parser.add_argument("--redis", action="store_true", help="Замерить get/set на Redis из .env")
+    parser.add_argument("--users", type=int, default=200, help="Пользователей для замера на Redis")
+    args = parser.parse_args()
+
+    measure_serialization(make_user_records(123456789), args.iterations)
+    if args.redis:
+        asyncio.run(measure_redis(args.users))
+
+
+if __name__ == "__main__":
+    main()
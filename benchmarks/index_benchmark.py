@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Планы горячих запросов к users/applications до и после индексов из миграции d7e3b5a90c12
+
+Создает во временной схеме таблицы проекта, генерирует N пользователей и N заявок,
+печатает EXPLAIN ANALYZE каждого запроса без новых индексов и с ними, затем удаляет схему.
+Подключение берется из .env (DB_*).
+
+Запуск из корня проекта:
+    python -m benchmarks.index_benchmark --rows 100000
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import text
+
+from config.config import load_config
+from database.db import Database
+from database.models import Base
+
+SCHEMA = "index_benchmark"
+
+# Индексы, эффект которых показывает бенчмарк (остальные индексы моделей есть в обоих прогонах)
+BENCHMARK_INDEXES = {
+    "ix_applications_user_id",
+    "ix_applications_email",
+    "ix_applications_phone",
+    "ix_sheets_export_outbox_application_id",
+}
+
+QUERIES = {
+    "Заявки пользователя (get_user_applications)":
+        "SELECT * FROM applications WHERE user_id = :user_id",
+    "Поиск заявки по email":
+        "SELECT * FROM applications WHERE email = :email",
+    "Поиск заявки по телефону":
+        "SELECT * FROM applications WHERE phone = :phone",
+    "Upsert пользователя по telegram_id (уникальный индекс есть и до миграции)":
+        "SELECT * FROM users WHERE telegram_id = :telegram_id",
+    # Тот же запрос, что строит ApplicationRepository.get_updated_since (порция сверки с Google Sheets)
+    "Заявки после отметки сверки с признаком ожидания выгрузки (get_updated_since)":
+        "SELECT a.*, EXISTS ("
+        "SELECT * FROM sheets_export_outbox o WHERE o.application_id = a.id "
+        "AND o.exported_at IS NULL AND o.failed_at IS NULL"
+        ") AS pending_export, u.* "
+        "FROM applications a JOIN users u ON u.id = a.user_id "
+        "WHERE (a.updated_at, a.id) > (:updated_at, :application_id) "
+        "ORDER BY a.updated_at, a.id LIMIT 500",
+}
+
+
+async def generate_data(conn, rows: int):
+    """Синтетические данные: каждый 10-й пользователь подал заявку, 1% заявок ждет выгрузки"""
+    await conn.execute(text("""
+        INSERT INTO users (telegram_id, telegram_username, is_alive, is_blocked, stage1_submitted)
+        SELECT 100000000 + g, 'user' || g, true, false,
+               CASE WHEN g % 10 = 0 THEN 'submitted' ELSE 'not_submitted' END
+        FROM generate_series(1, :rows) AS g
+    """), {"rows": rows})
+    await conn.execute(text("""
+        INSERT INTO applications (user_id, full_name, course, email, phone, personal_qualities, motivation,
+                                  logistics_rating, marketing_rating, pr_rating, program_rating, partners_rating,
+                                  updated_at)
+        SELECT id, 'Тестов Тест ' || id, '1_bachelor', 'user' || id || '@example.com',
+               '+7999' || lpad(id::text, 7, '0'), 'Качества', 'Мотивация', 1, 2, 3, 4, 5,
+               now() - (id || ' seconds')::interval
+        FROM users
+    """))
+    await conn.execute(text("""
+        INSERT INTO sheets_export_outbox (application_id, attempts, exported_at)
+        SELECT id, 0, CASE WHEN id % 100 = 0 THEN NULL ELSE now() END FROM applications
+    """))
+
+
+async def explain_all(conn, params: dict):
+    await conn.execute(text("ANALYZE users, applications, sheets_export_outbox"))
+    for title, query in QUERIES.items():
+        result = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"), params)
+        print(f"\n--- {title}")
+        for (line,) in result:
+            print(f"    {line}")
+
+
+async def run(rows: int):
+    config = load_config()
+    db = Database(config)
+    try:
+        async with db.engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            await conn.execute(text(f"SET LOCAL search_path TO {SCHEMA}"))
+
+            schema_conn = await conn.execution_options(schema_translate_map={None: SCHEMA})
+            await schema_conn.run_sync(Base.metadata.create_all)
+            for index in BENCHMARK_INDEXES:
+                await conn.execute(text(f"DROP INDEX {index}"))
+
+            print(f"⏳ Генерация {rows} пользователей и заявок...")
+            await generate_data(conn, rows)
+
+            sample = (await conn.execute(text(
+                "SELECT a.user_id, a.email, a.phone, u.telegram_id, a.id, a.updated_at FROM applications a "
+                "JOIN users u ON u.id = a.user_id ORDER BY a.id OFFSET :offset LIMIT 1"
+            ), {"offset": rows // 2})).one()
+            params = {
+                "user_id": sample.user_id,
+                "email": sample.email,
+                "phone": sample.phone,
+                "telegram_id": sample.telegram_id,
+                "application_id": sample.id,
+                "updated_at": sample.updated_at,
+            }
+
+            print("\n========== БЕЗ ИНДЕКСОВ ==========")
+            await explain_all(conn, params)
+
+            def create_indexes(sync_conn):
+                for table in Base.metadata.sorted_tables:
+                    for index in table.indexes:
+                        if index.name in BENCHMARK_INDEXES:
+                            index.create(sync_conn)
+
+            await schema_conn.run_sync(create_indexes)
+
+            print("\n========== С ИНДЕКСАМИ ==========")
+            await explain_all(conn, params)
+
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Планы запросов до и после индексов")
+    parser.add_argument("--rows", type=int, default=100000, help="Число пользователей и заявок")
+    args = parser.parse_args()
+    asyncio.run(run(args.rows))
+
+
+if __name__ == "__main__":
+    main()
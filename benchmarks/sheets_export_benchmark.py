@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест выгрузки заявок в Google Sheets на локальном эмуляторе (без сети и учетных данных)
+
+Прогоняет через GoogleSheetsService (пакетная запись, лимитеры, повторы, circuit breaker)
+заданное число заявок и печатает пропускную способность и метрики сервиса.
+
+Запуск из корня проекта:
+    python -m benchmarks.sheets_export_benchmark --applications 2000 --latency 0.3 --error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from utils.google_services import GoogleSheetsService, APPLICATION_HEADERS, LAST_COLUMN, USER_ID_COLUMN
+from utils.sheets_backends import InMemorySheetsClient
+
+logger = logging.getLogger(__name__)
+
+
+def make_application(telegram_id: int) -> dict:
+    """Тестовая заявка"""
+    now = datetime.now().isoformat()
+    return {
+        'telegram_id': telegram_id,
+        'telegram_username': f"user{telegram_id}",
+        'full_name': f"Тестов Тест {telegram_id}",
+        'first_name': "Тест",
+        'last_name': "Тестов",
+        'middle_name': "",
+        'course': "2",
+        'is_from_vsm': True,
+        'is_from_spbu': True,
+        'university': "СПбГУ",
+        'dormitory': False,
+        'email': f"user{telegram_id}@example.com",
+        'phone': "+79990000000",
+        'personal_qualities': "Ответственность",
+        'motivation': "Хочу помогать",
+        'logistics_rating': 5,
+        'marketing_rating': 4,
+        'pr_rating': 3,
+        'program_rating': 2,
+        'partners_rating': 1,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+async def run(args):
+    client = InMemorySheetsClient(
+        latency=args.latency,
+        latency_jitter=args.latency / 2,
+        read_requests_per_minute=args.quota,
+        write_requests_per_minute=args.quota,
+        error_rate=args.error_rate,
+    )
+    service = GoogleSheetsService(
+        credentials_path="memory-benchmark",
+        spreadsheet_id="benchmark",
+        max_workers=args.max_workers,
+        write_batch_size=args.batch_size,
+        write_batch_delay=args.batch_delay,
+        read_requests_per_minute=args.limit,
+        write_requests_per_minute=args.limit,
+        client=client,
+    )
+
+    try:
+        # Лист с заголовками, как после setup_google_sheets.py
+        worksheet = await service._get_worksheet()
+        await service.call(worksheet.update, [APPLICATION_HEADERS], f"A1:{LAST_COLUMN}1", quota="write")
+
+        started_at = time.monotonic()
+        # Вторая половина повторяет часть пользователей - проверяем обновление существующих строк
+        user_ids = list(range(1, args.applications + 1))
+        user_ids += user_ids[:int(args.applications * args.update_share)]
+        results = await asyncio.gather(*(
+            service.add_application_to_sheet(make_application(user_id)) for user_id in user_ids
+        ))
+        elapsed = time.monotonic() - started_at
+
+        rows_in_sheet = len(await service.call(worksheet.col_values, USER_ID_COLUMN)) - 1
+        stats = service.get_stats()
+
+        print(f"Заявок отправлено:     {len(user_ids)} ({args.applications} уникальных)")
+        print(f"Успешно записано:      {sum(results)}")
+        print(f"Строк в листе:         {rows_in_sheet}")
+        print(f"Время:                 {elapsed:.1f} с ({len(user_ids) / elapsed:.1f} заявок/с)")
+        print(f"Запросов к эмулятору:  чтение {client.stats['read']}, запись {client.stats['write']}")
+        print(f"Ответы 429 / 503:      {client.stats['quota_errors']} / {client.stats['server_errors']}")
+        print(f"Повторов:              {stats['retried_calls']}, ожиданий квоты: {stats['throttled_calls']}")
+        print(f"Очередь пула (макс.):  {stats['max_queue_depth']}, "
+              f"среднее ожидание потока: {stats['avg_wait_time'] * 1000:.1f} мс")
+        print(f"Circuit breaker:       {stats['breaker_state']}, отклонено {stats['breaker_rejected']}")
+    finally:
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест выгрузки в Google Sheets на эмуляторе")
+    parser.add_argument("--applications", type=int, default=1000, help="Число уникальных заявок")
+    parser.add_argument("--update-share", type=float, default=0.2, help="Доля повторных выгрузок тех же пользователей")
+    parser.add_argument("--latency", type=float, default=0.2, help="Задержка ответа эмулятора (секунды)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 503")
+    parser.add_argument("--quota", type=int, default=60, help="Квота эмулятора, запросов в минуту (0 - без квоты)")
+    parser.add_argument("--limit", type=int, default=60, help="Лимит клиента, запросов в минуту")
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--batch-delay", type=float, default=1.0)
+    parser.add_argument("-v", "--verbose", action="store_true", help="Логи сервиса")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
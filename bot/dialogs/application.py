@@ -6,13 +6,87 @@ from aiogram_dialog.widgets.text import Const, Format
 from aiogram_dialog.widgets.input import TextInput, MessageInput
 
 from bot.states import DepartmentSelectionSG, ApplicationSG, MenuSG
-from database.repositories import UserRepository, ApplicationRepository
-from database.db import Database
+from bot.middlewares import LazySession
+import hashlib
+import json
 import re
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Ответы анкеты, которые сохраняются в черновик
+DRAFT_FIELDS = (
+    "full_name", "course", "course_display", "is_from_vsm", "is_from_spbu", "university",
+    "dormitory", "dormitory_display", "email", "phone", "personal_qualities", "motivation",
+    "logistics_rating", "marketing_rating", "pr_rating", "program_rating", "partners_rating",
+)
+# Без этих ответов анкету нельзя отправить
+REQUIRED_FIELDS = (
+    "full_name", "course", "email", "phone", "personal_qualities", "motivation",
+    "logistics_rating", "marketing_rating", "pr_rating", "program_rating", "partners_rating",
+)
+APPLICATION_STATES = {state.state: state for state in ApplicationSG.__states__}
+
+
+# Черновик анкеты в БД: ответы переживают истечение данных диалога в Redis и UnknownIntent
+def get_draft_snapshot(dialog_manager: DialogManager) -> dict:
+    data = dialog_manager.dialog_data
+    return {field: data[field] for field in DRAFT_FIELDS if field in data}
+
+
+async def save_draft(dialog_manager: DialogManager):
+    """Сохранить ответы и текущий шаг анкеты; без записи в БД, если с прошлого сохранения ничего не изменилось"""
+    db_session: LazySession = dialog_manager.middleware_data.get("db_session")
+    if db_session is None:
+        return
+    user = dialog_manager.event.from_user
+    state = dialog_manager.current_context().state.state
+    snapshot = get_draft_snapshot(dialog_manager)
+    if not snapshot:
+        return
+    
+    draft_hash = hashlib.blake2b(
+        json.dumps([state, snapshot], sort_keys=True, ensure_ascii=False).encode(), digest_size=8
+    ).hexdigest()
+    if dialog_manager.dialog_data.get("_draft_hash") == draft_hash:
+        return
+    await db_session.draft_repo.save(user.id, state, snapshot)
+    dialog_manager.dialog_data["_draft_hash"] = draft_hash
+
+
+async def autosave_draft(dialog_manager: DialogManager, **kwargs):
+    """Геттер всего диалога: черновик сохраняется при показе каждого шага"""
+    await save_draft(dialog_manager)
+    return {}
+
+
+async def on_application_start(start_data, dialog_manager: DialogManager):
+    """Продолжение анкеты с шага черновика"""
+    draft = start_data.get("draft") if isinstance(start_data, dict) else None
+    if draft is None:
+        db_session: LazySession = dialog_manager.middleware_data.get("db_session")
+        if db_session is None:
+            return
+        saved = await db_session.draft_repo.get(dialog_manager.event.from_user.id)
+        if saved is None:
+            return
+        draft = {"state": saved.state, "data": saved.data}
+    
+    dialog_manager.dialog_data.update(draft["data"])
+    logger.debug(f"Анкета продолжена из черновика: {draft['state']}")
+    
+    if all(field in dialog_manager.dialog_data for field in REQUIRED_FIELDS):
+        await dialog_manager.switch_to(ApplicationSG.overview)
+    elif draft["state"] == ApplicationSG.personal_qualities.state and "personal_qualities" in draft["data"]:
+        # Личные качества уже введены - черновик сохранен перед выбором отделов
+        await dialog_manager.start(DepartmentSelectionSG.logistics)
+    else:
+        state = APPLICATION_STATES.get(draft["state"], ApplicationSG.full_name)
+        if state in (ApplicationSG.overview, ApplicationSG.edit_menu):
+            state = ApplicationSG.full_name
+        if state != ApplicationSG.full_name:
+            await dialog_manager.switch_to(state)
+
 
 # Валидация email
 def email_check(text: str) -> str:
@@ -51,6 +125,8 @@ async def on_qualities_input(message: types.Message, widget, dialog_manager: Dia
     if dialog_manager.dialog_data.get("is_editing", False):
         await dialog_manager.switch_to(ApplicationSG.edit_menu)
     else:
+        # Выбор отделов - отдельный диалог, поэтому черновик сохраняем до его запуска
+        await save_draft(dialog_manager)
         # Отправляем сообщение и сразу переходим к выбору отделов
         await message.answer(
             "📊 Теперь оцени свой интерес к каждому отделу от 1 до 5, "
@@ -196,60 +272,46 @@ async def on_submit_application(callback: CallbackQuery, button: Button, dialog_
     # Получаем данные
     data = dialog_manager.dialog_data
     user = dialog_manager.event.from_user
-    db: Database = dialog_manager.middleware_data.get("db")
-    google_sheets_service = dialog_manager.middleware_data.get("google_sheets_service")
-    
-    # Сохраняем в БД
-    session = await db.get_session()
-    try:
-        user_repo = UserRepository(session)
-        app_repo = ApplicationRepository(session, google_sheets_service)
-        
-        # Получаем или создаем пользователя
-        db_user = await user_repo.get_or_create_user(
-            telegram_id=user.id,
-            telegram_username=user.username
-        )
-        
-        # Преобразуем dormitory из строки в bool, если значение есть
-        dormitory_value = data.get("dormitory")
-        dormitory_bool = None
-        if dormitory_value == "yes":
-            dormitory_bool = True
-        elif dormitory_value == "no":
-            dormitory_bool = False
-        
-        # Создаем заявку
-        application_data = {
-            "full_name": data["full_name"],
-            "course": data["course"],
-            "is_from_vsm": data.get("is_from_vsm"),
-            "is_from_spbu": data.get("is_from_spbu"),
-            "university": data.get("university"),
-            "dormitory": dormitory_bool,  # Может быть True, False или None
-            "email": data["email"],
-            "phone": data["phone"],
-            "personal_qualities": data["personal_qualities"],
-            "motivation": data["motivation"],
-            "logistics_rating": data["logistics_rating"],
-            "marketing_rating": data["marketing_rating"],
-            "pr_rating": data["pr_rating"],
-            "program_rating": data["program_rating"],
-            "partners_rating": data["partners_rating"],
-        }
-        
-        # Дополнительные данные пользователя для Google Sheets
-        user_telegram_data = {
-            "telegram_id": user.id,
-            "telegram_username": user.username or "",
-        }
-        
-        await app_repo.create_application(db_user.id, application_data, user_telegram_data)
-        
-        # Обновляем статус пользователя
-        await user_repo.update_stage1_status(user.id, "submitted")
-    finally:
-        await session.close()
+    db_session: LazySession = dialog_manager.middleware_data.get("db_session")
+    
+    # Преобразуем dormitory из строки в bool, если значение есть
+    dormitory_value = data.get("dormitory")
+    dormitory_bool = None
+    if dormitory_value == "yes":
+        dormitory_bool = True
+    elif dormitory_value == "no":
+        dormitory_bool = False
+    
+    # Создаем заявку
+    application_data = {
+        "full_name": data["full_name"],
+        "course": data["course"],
+        "is_from_vsm": data.get("is_from_vsm"),
+        "is_from_spbu": data.get("is_from_spbu"),
+        "university": data.get("university"),
+        "dormitory": dormitory_bool,  # Может быть True, False или None
+        "email": data["email"],
+        "phone": data["phone"],
+        "personal_qualities": data["personal_qualities"],
+        "motivation": data["motivation"],
+        "logistics_rating": data["logistics_rating"],
+        "marketing_rating": data["marketing_rating"],
+        "pr_rating": data["pr_rating"],
+        "program_rating": data["program_rating"],
+        "partners_rating": data["partners_rating"],
+    }
+    
+    # Заявка, задача на выгрузку в Google Sheets и статус пользователя сохраняются одной транзакцией
+    # (выгрузка идет в фоне через очередь). Ключ привязан к экземпляру диалога,
+    # поэтому повторное нажатие "Подтвердить" не создаст вторую заявку
+    submit_key = f"{user.id}:{dialog_manager.current_context().intent_id}"
+    application = await db_session.application_service.submit_application(
+        user.id, user.username, application_data, submit_key=submit_key
+    )
+    if application is None:
+        # Заявка уже подана первым нажатием - ничего не делаем
+        await callback.answer()
+        return
     
     await callback.message.answer(
         "✅ Спасибо, что рассказал(а) о себе!\n"
@@ -602,5 +664,7 @@ application_dialog = Dialog(
         getter=get_edit_menu_data,
     ),
     
+    on_start=on_application_start,
     on_process_result=on_departments_result,
+    getter=autosave_draft,
 )
@@ -1,10 +1,45 @@
 from aiogram import types, Bot
 from aiogram_dialog.api.exceptions import UnknownIntent
 from aiogram.types import ErrorEvent
-from aiogram_dialog import DialogManager
+from aiogram_dialog import DialogManager, StartMode, ShowMode
+from aiogram_dialog.utils import remove_intent_id
+from typing import Optional
+from bot.dialogs.application import application_dialog
+from bot.dialogs.departments import department_selection_dialog
+from bot.states import ApplicationSG, MenuSG
+from database.db import Database
+from database.repositories import ApplicationDraftRepository
 from utils.logging_config import log_error
 
-async def dialog_error_handler(event: ErrorEvent):
+
+async def load_application_draft(db: Optional[Database], user_id: Optional[int]) -> Optional[dict]:
+    """Черновик анкеты пользователя из БД (None, если его нет или БД недоступна)"""
+    if db is None or user_id is None:
+        return None
+    try:
+        session = await db.get_session()
+        try:
+            draft = await ApplicationDraftRepository(session).get(user_id)
+        finally:
+            await session.close()
+    except Exception as e:
+        log_error(e, "Не удалось загрузить черновик анкеты", user_id=user_id)
+        return None
+    return {"state": draft.state, "data": draft.data} if draft else None
+
+
+def is_application_callback(callback_data: Optional[str]) -> bool:
+    """Кнопка из анкеты или выбора отделов: по id виджета после id диалога в callback_data"""
+    if not callback_data:
+        return False
+    _, widget_data = remove_intent_id(callback_data)
+    widget_id = widget_data.split(":", 1)[0]
+    return any(dialog.find(widget_id) is not None
+               for dialog in (application_dialog, department_selection_dialog))
+
+
+async def dialog_error_handler(event: ErrorEvent, dialog_manager: Optional[DialogManager] = None,
+                               db: Optional[Database] = None):
     """Обработчик ошибок диалогов"""
     exception = event.exception
     
@@ -21,7 +56,16 @@ async def dialog_error_handler(event: ErrorEvent):
     log_error(exception, f"Ошибка в диалоге", user_id=user_id)
     
     try:
-        if isinstance(exception, UnknownIntent):
+        draft = None
+        # Черновик продолжаем, только если устарела кнопка самой анкеты, а не меню или другого диалога
+        callback = event.update.callback_query
+        if (isinstance(exception, UnknownIntent) and dialog_manager is not None
+                and callback is not None and is_application_callback(callback.data)):
+            draft = await load_application_draft(db, user_id)
+        
+        if draft is not None:
+            message_text = "Данные диалога устарели, но черновик анкеты сохранен - продолжаем с того же места"
+        elif isinstance(exception, UnknownIntent):
             message_text = "Упс! Что-то сломалось. К сожалению, текущие данные потеряны. Для продолжения работы нажмите /menu"
         else:
             message_text = "Упс! Что-то сломалось попробуйте еще раз. Если бот не работает как надо нажмите /menu чтобы начать сначала и вернуться в главное меню. \n\nТех. поддержка @zobko"
@@ -32,6 +76,11 @@ async def dialog_error_handler(event: ErrorEvent):
         elif event.update.callback_query:
             await event.update.callback_query.message.answer(message_text)
             await event.update.callback_query.answer()
+        
+        if draft is not None:
+            # Меню под анкетой, чтобы "Отмена" вела в него, а анкета продолжается из черновика
+            await dialog_manager.start(MenuSG.main, mode=StartMode.RESET_STACK, show_mode=ShowMode.NO_UPDATE)
+            await dialog_manager.start(ApplicationSG.full_name, data={"draft": draft}, show_mode=ShowMode.SEND)
             
     except Exception as e:
         # Если не удалось отправить сообщение, логируем это
@@ -3,8 +3,7 @@ from aiogram_dialog import Dialog, DialogManager, Window
 from aiogram_dialog.widgets.kbd import Button, Start, SwitchTo
 from aiogram_dialog.widgets.text import Const, Format
 from config.config import Config
-from database.repositories import UserRepository
-from database.db import Database
+from bot.middlewares import LazySession
 
 from bot.states import MenuSG, ApplicationSG
 
@@ -13,30 +12,25 @@ async def get_menu_data(dialog_manager: DialogManager, **kwargs):
     """Геттер данных для главного меню"""
     # Получаем конфигурацию
     config: Config = dialog_manager.middleware_data.get("config")
-    db: Database = dialog_manager.middleware_data.get("db")
+    db_session: LazySession = dialog_manager.middleware_data.get("db_session")
     
     # Получаем информацию о пользователе
     user = dialog_manager.event.from_user
     
-    session = await db.get_session()
-    try:
-        user_repo = UserRepository(session)
-        # Создаем/получаем пользователя (дополнительная защита)
-        db_user = await user_repo.get_or_create_user(
-            telegram_id=user.id,
-            telegram_username=user.username
-        )
-        
-        is_submitted = db_user.stage1_submitted == "submitted"
-        status_text = "Заявка подана" if is_submitted else "Заявка не подана"
-        if is_submitted:
-            # Если заявка подана - показываем когда придут результаты
-            additional_info = f"\n📊 Результаты придут: {config.selection.stages['stage1']['results_date']}"
-        else:
-            # Если заявка не подана - показываем дедлайн
-            additional_info = f"\n⏰ Дедлайн: {config.selection.stages['stage1']['deadline']}"
-    finally:
-        await session.close()
+    # Меню показывается чаще всего - читаем только статус (кеш или SELECT одной строки без записи)
+    stage1_status = await db_session.user_repo.get_stage1_status(
+        telegram_id=user.id,
+        telegram_username=user.username
+    )
+    
+    is_submitted = stage1_status == "submitted"
+    status_text = "Заявка подана" if is_submitted else "Заявка не подана"
+    if is_submitted:
+        # Если заявка подана - показываем когда придут результаты
+        additional_info = f"\n📊 Результаты придут: {config.selection.stages['stage1']['results_date']}"
+    else:
+        # Если заявка не подана - показываем дедлайн
+        additional_info = f"\n⏰ Дедлайн: {config.selection.stages['stage1']['deadline']}"
     
     menu_text = f"""🏠 Личный кабинет кандидата в команду волонтеров МБ 2025
 
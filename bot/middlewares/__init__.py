@@ -1,3 +1,5 @@
 from .logging import LoggingMiddleware
+from .database import DbSessionMiddleware, LazySession
+from .fsm_cache import FsmCacheMiddleware
 
-__all__ = ['LoggingMiddleware']
+__all__ = ['LoggingMiddleware', 'DbSessionMiddleware', 'LazySession', 'FsmCacheMiddleware']
@@ -0,0 +1,118 @@
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Callable, Dict, Any, Awaitable, Optional
+
+from database.db import Database
+from database.repositories import UserRepository, ApplicationRepository, ApplicationDraftRepository
+from database.services import ApplicationService
+from database.user_cache import UserCache
+from database.username_buffer import UsernameWriteBuffer
+from utils.logging_config import log_error
+
+
+class LazySession:
+    """
+    Сессия БД одного апдейта
+
+    Сессия и репозитории создаются при первом обращении, поэтому апдейты,
+    которые не ходят в БД, не берут соединение из пула.
+    """
+
+    def __init__(self, db: Database, user_cache: Optional[UserCache] = None,
+                 username_buffer: Optional[UsernameWriteBuffer] = None):
+        self.db = db
+        self.user_cache = user_cache
+        self.username_buffer = username_buffer
+        self._session: Optional[AsyncSession] = None
+        self._user_repo: Optional[UserRepository] = None
+        self._app_repo: Optional[ApplicationRepository] = None
+        self._draft_repo: Optional[ApplicationDraftRepository] = None
+        self._application_service: Optional[ApplicationService] = None
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self.db.session_factory()
+        return self._session
+
+    @property
+    def user_repo(self) -> UserRepository:
+        if self._user_repo is None:
+            self._user_repo = UserRepository(self.session, cache=self.user_cache,
+                                             username_buffer=self.username_buffer)
+        return self._user_repo
+
+    @property
+    def app_repo(self) -> ApplicationRepository:
+        if self._app_repo is None:
+            self._app_repo = ApplicationRepository(self.session)
+        return self._app_repo
+
+    @property
+    def draft_repo(self) -> ApplicationDraftRepository:
+        if self._draft_repo is None:
+            self._draft_repo = ApplicationDraftRepository(self.session)
+        return self._draft_repo
+
+    @property
+    def application_service(self) -> ApplicationService:
+        if self._application_service is None:
+            self._application_service = ApplicationService(
+                self.session, user_cache=self.user_cache, username_buffer=self.username_buffer
+            )
+        return self._application_service
+
+    async def commit(self):
+        if self._session is not None:
+            await self._session.commit()
+
+    async def rollback(self):
+        if self._session is not None:
+            await self._session.rollback()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Middleware, выдающее апдейту одну сессию БД и фиксирующее транзакцию один раз в конце"""
+
+    def __init__(self, db: Database, user_cache: Optional[UserCache] = None,
+                 username_buffer: Optional[UsernameWriteBuffer] = None):
+        self.db = db
+        self.user_cache = user_cache
+        self.username_buffer = username_buffer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        db_session = LazySession(self.db, self.user_cache, self.username_buffer)
+        data["db_session"] = db_session
+        user = data.get("event_from_user")
+        description = f"{type(event).__name__} от {user.id}" if user else type(event).__name__
+        with self.db.query_stats.track_update(description):
+            try:
+                result = await handler(event, data)
+                await db_session.commit()
+                return result
+            except Exception:
+                try:
+                    await db_session.rollback()
+                except Exception as e:
+                    log_error(e, "Ошибка при откате транзакции")
+                # Кеш мог получить данные из откаченной транзакции
+                if db_session.started and self.user_cache is not None and user is not None:
+                    await self.user_cache.invalidate(user.id)
+                raise
+            finally:
+                await db_session.close()
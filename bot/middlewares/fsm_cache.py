@@ -0,0 +1,29 @@
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from typing import Callable, Dict, Any, Awaitable
+
+from utils.fsm_storage import CachedRedisStorage
+
+
+class FsmCacheMiddleware(BaseMiddleware):
+    """Middleware, ограничивающее проверку версий кеша FSM одним апдейтом и записывающее его изменения пачкой"""
+
+    def __init__(self, storage: CachedRedisStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        self.storage.begin_update()
+        try:
+            return await handler(event, data)
+        finally:
+            try:
+                # Состояние, стек и контекст диалога - одним атомарным скриптом
+                await self.storage.flush_update()
+            finally:
+                # Следующий апдейт в этой же задаче (handle_as_tasks=False) снова сверит версии с Redis
+                self.storage.end_update()
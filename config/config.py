@@ -16,12 +16,42 @@ class DatabaseConfig:
     database: str
     host: str
     port: int = 5432
+    pool_size: int = 10  # Постоянных соединений в пуле
+    max_overflow: int = 10  # Дополнительных соединений сверх pool_size при пиках
+    pool_timeout: float = 10.0  # Сколько ждать свободного соединения (секунды)
+    pool_recycle: int = 1800  # Пересоздавать соединения старше (секунды)
+    pool_pre_ping: bool = True  # Проверять соединение перед выдачей из пула (+1 запрос на выдачу)
+    connect_timeout: float = 10.0  # Таймаут подключения к PostgreSQL (секунды)
+    command_timeout: float = 30.0  # Таймаут выполнения запроса (секунды)
+    statement_cache_size: int = 100  # Кеш подготовленных выражений asyncpg (0 - для pgbouncer)
+    slow_checkout_threshold: float = 1.0  # Предупреждать, если соединение из пула получено дольше (секунды)
+    slow_query_threshold: float = 0.2  # Писать в лог запросы дольше (секунды)
+    max_queries_per_update: int = 10  # Предупреждать, если апдейт сделал больше запросов (N+1)
+    username_flush_interval: float = 5.0  # Пауза между отложенными записями смены username (0 - писать сразу)
+    username_flush_batch_size: int = 500  # Максимум пользователей в одном UPDATE смены username
 
 @dataclass
 class RedisConfig:
     password: Optional[str]
     host: str = "localhost"
     port: int = 6379
+    fsm_format: str = "json"  # Формат данных FSM и диалогов: json, orjson, msgpack
+    fsm_compression: str = "none"  # Сжатие больших значений FSM: none, zlib, zstd
+    fsm_compress_threshold: int = 1024  # Сжимать значения FSM не меньше (байты)
+    fsm_cache_size: int = 10000  # Чатов в кеше FSM процесса (0 - без кеша, каждый раз из Redis)
+    fsm_cache_ttl: float = 300.0  # Время жизни чата в кеше FSM процесса (секунды)
+    fsm_idle_ttl: int = 21600  # Время жизни меню, брошенных диалогов и состояния FSM (секунды)
+    fsm_in_progress_ttl: int = 172800  # Время жизни незаконченной анкеты (секунды)
+    fsm_in_progress_groups: list[str] = field(default_factory=lambda: ["ApplicationSG", "DepartmentSelectionSG"])
+    fsm_sweep_interval: float = 3600.0  # Пауза между проходами очистки брошенных ключей диалогов (0 - отключить)
+    fsm_sweep_min_idle: int = 3600  # Удалять брошенные ключи, к которым не обращались дольше (секунды)
+
+@dataclass
+class CacheConfig:
+    user_cache_size: int = 10000  # Максимум пользователей в кеше процесса
+    user_cache_ttl: float = 60.0  # Время жизни записи в кеше процесса (секунды)
+    user_cache_redis: bool = False  # Второй уровень кеша в Redis (общий для всех процессов)
+    user_cache_redis_ttl: int = 600  # Время жизни записи в Redis (секунды)
 
 @dataclass
 class TgBot:
@@ -35,6 +65,25 @@ class GoogleConfig:
     spreadsheet_name: str = "Заявки КБК26"  # Название таблицы по умолчанию
     drive_folder_name: str = "Резюме_КБК26"  # Название папки по умолчанию
     enable_drive: bool = False  # Включить/выключить Google Drive
+    export_poll_interval: float = 2.0  # Пауза между опросами очереди выгрузки (секунды)
+    export_batch_size: int = 20  # Сколько заявок выгружать за один проход
+    export_max_attempts: int = 10  # Неудачных попыток выгрузки заявки до остановки
+    export_lease: float = 600.0  # На сколько воркер забирает записи очереди (секунды)
+    max_workers: int = 4  # Максимум одновременных запросов к Google Sheets
+    write_batch_size: int = 50  # Максимум строк в одном запросе на запись
+    write_batch_delay: float = 1.0  # Сколько ждать накопления пачки строк (секунды)
+    read_requests_per_minute: int = 60  # Квота Sheets API на чтение для сервисного аккаунта
+    write_requests_per_minute: int = 60  # Квота Sheets API на запись для сервисного аккаунта
+    max_retries: int = 5  # Повторы запроса после 429/5xx
+    request_timeout: float = 15.0  # Таймаут HTTP-запроса к Google (секунды)
+    breaker_failure_threshold: int = 5  # После скольких ошибок подряд приостановить выгрузку
+    breaker_reset_timeout: float = 30.0  # На сколько секунд приостанавливать выгрузку
+    reconcile_interval: float = 300.0  # Пауза между сверками БД с таблицей (секунды, 0 - отключить)
+    reconcile_batch_size: int = 500  # Сколько заявок сверять за один проход
+    sheets_backend: str = "gspread"  # "gspread" - Google Sheets, "memory" - локальный эмулятор
+    memory_latency: float = 0.2  # Эмулятор: средняя задержка ответа (секунды)
+    memory_requests_per_minute: int = 60  # Эмулятор: квота запросов в минуту (0 - без квоты)
+    memory_error_rate: float = 0.0  # Эмулятор: доля ответов 503
 
 @dataclass
 class SelectionConfig:
@@ -50,7 +99,9 @@ class Config:
     redis: RedisConfig
     selection: SelectionConfig
     google: Optional[GoogleConfig] = None
+    cache: CacheConfig = field(default_factory=CacheConfig)
     log_level: str = "INFO"
+    stats_log_interval: float = 300.0  # Пауза между отчетами о метриках в логе (секунды, 0 - только при остановке)
 
 def load_config(path: str = None) -> Config:
     # Загружаем JSON конфигурацию
@@ -69,13 +120,43 @@ def load_config(path: str = None) -> Config:
         password=env.str("DB_PASS"),
         database=env.str("DB_NAME"),
         host=env.str("DB_HOST"),
-        port=env.int("DB_PORT", 5432)
+        port=env.int("DB_PORT", 5432),
+        pool_size=env.int("DB_POOL_SIZE", 10),
+        max_overflow=env.int("DB_MAX_OVERFLOW", 10),
+        pool_timeout=env.float("DB_POOL_TIMEOUT", 10.0),
+        pool_recycle=env.int("DB_POOL_RECYCLE", 1800),
+        pool_pre_ping=env.bool("DB_POOL_PRE_PING", True),
+        connect_timeout=env.float("DB_CONNECT_TIMEOUT", 10.0),
+        command_timeout=env.float("DB_COMMAND_TIMEOUT", 30.0),
+        statement_cache_size=env.int("DB_STATEMENT_CACHE_SIZE", 100),
+        slow_checkout_threshold=env.float("DB_SLOW_CHECKOUT_THRESHOLD", 1.0),
+        slow_query_threshold=env.float("DB_SLOW_QUERY_THRESHOLD", 0.2),
+        max_queries_per_update=env.int("DB_MAX_QUERIES_PER_UPDATE", 10),
+        username_flush_interval=env.float("DB_USERNAME_FLUSH_INTERVAL", 5.0),
+        username_flush_batch_size=env.int("DB_USERNAME_FLUSH_BATCH_SIZE", 500)
     )
 
     redis = RedisConfig(
         host=env.str("REDIS_HOST", "localhost"),
         port=env.int("REDIS_PORT", 6379),
-        password=env.str("REDIS_PASSWORD", None) if env.str("REDIS_PASSWORD", "") else None
+        password=env.str("REDIS_PASSWORD", None) if env.str("REDIS_PASSWORD", "") else None,
+        fsm_format=env.str("REDIS_FSM_FORMAT", "json"),
+        fsm_compression=env.str("REDIS_FSM_COMPRESSION", "none"),
+        fsm_compress_threshold=env.int("REDIS_FSM_COMPRESS_THRESHOLD", 1024),
+        fsm_cache_size=env.int("REDIS_FSM_CACHE_SIZE", 10000),
+        fsm_cache_ttl=env.float("REDIS_FSM_CACHE_TTL", 300.0),
+        fsm_idle_ttl=env.int("REDIS_FSM_IDLE_TTL", 21600),
+        fsm_in_progress_ttl=env.int("REDIS_FSM_IN_PROGRESS_TTL", 172800),
+        fsm_in_progress_groups=env.list("REDIS_FSM_IN_PROGRESS_GROUPS", ["ApplicationSG", "DepartmentSelectionSG"]),
+        fsm_sweep_interval=env.float("REDIS_FSM_SWEEP_INTERVAL", 3600.0),
+        fsm_sweep_min_idle=env.int("REDIS_FSM_SWEEP_MIN_IDLE", 3600)
+    )
+    
+    cache = CacheConfig(
+        user_cache_size=env.int("USER_CACHE_SIZE", 10000),
+        user_cache_ttl=env.float("USER_CACHE_TTL", 60.0),
+        user_cache_redis=env.bool("USER_CACHE_REDIS", False),
+        user_cache_redis_ttl=env.int("USER_CACHE_REDIS_TTL", 600)
     )
     
     # Настройки Google (опциональные)
@@ -84,16 +165,59 @@ def load_config(path: str = None) -> Config:
     spreadsheet_id = env.str("GOOGLE_SPREADSHEET_ID", None)
     drive_folder_id = env.str("GOOGLE_DRIVE_FOLDER_ID", None)
     enable_drive = env.bool("GOOGLE_ENABLE_DRIVE", False)  # По умолчанию Drive отключен
+    export_poll_interval = env.float("GOOGLE_EXPORT_POLL_INTERVAL", 2.0)
+    export_batch_size = env.int("GOOGLE_EXPORT_BATCH_SIZE", 20)
+    export_max_attempts = env.int("GOOGLE_EXPORT_MAX_ATTEMPTS", 10)
+    export_lease = env.float("GOOGLE_EXPORT_LEASE", 600.0)
+    max_workers = env.int("GOOGLE_MAX_WORKERS", 4)
+    write_batch_size = env.int("GOOGLE_WRITE_BATCH_SIZE", 50)
+    write_batch_delay = env.float("GOOGLE_WRITE_BATCH_DELAY", 1.0)
+    read_requests_per_minute = env.int("GOOGLE_READ_REQUESTS_PER_MINUTE", 60)
+    write_requests_per_minute = env.int("GOOGLE_WRITE_REQUESTS_PER_MINUTE", 60)
+    max_retries = env.int("GOOGLE_MAX_RETRIES", 5)
+    request_timeout = env.float("GOOGLE_REQUEST_TIMEOUT", 15.0)
+    breaker_failure_threshold = env.int("GOOGLE_BREAKER_FAILURE_THRESHOLD", 5)
+    breaker_reset_timeout = env.float("GOOGLE_BREAKER_RESET_TIMEOUT", 30.0)
+    reconcile_interval = env.float("GOOGLE_RECONCILE_INTERVAL", 300.0)
+    reconcile_batch_size = env.int("GOOGLE_RECONCILE_BATCH_SIZE", 500)
+    sheets_backend = env.str("GOOGLE_SHEETS_BACKEND", "gspread")
+    memory_latency = env.float("GOOGLE_MEMORY_LATENCY", 0.2)
+    memory_requests_per_minute = env.int("GOOGLE_MEMORY_REQUESTS_PER_MINUTE", 60)
+    memory_error_rate = env.float("GOOGLE_MEMORY_ERROR_RATE", 0.0)
+    
+    if sheets_backend == "memory":
+        # Эмулятору учетные данные не нужны
+        credentials_path = credentials_path or ""
+        spreadsheet_id = spreadsheet_id or "memory"
     
     logger.info(f"Google credentials check: credentials_path={credentials_path}, spreadsheet_id={spreadsheet_id}")
     logger.info(f"Google Drive settings: drive_folder_id={drive_folder_id}, enable_drive={enable_drive}")
     
-    if credentials_path and spreadsheet_id:
+    if (credentials_path or sheets_backend == "memory") and spreadsheet_id:
         google_config = GoogleConfig(
             credentials_path=credentials_path,
             spreadsheet_id=spreadsheet_id,
             drive_folder_id=drive_folder_id,
-            enable_drive=enable_drive
+            enable_drive=enable_drive,
+            export_poll_interval=export_poll_interval,
+            export_batch_size=export_batch_size,
+            export_max_attempts=export_max_attempts,
+            export_lease=export_lease,
+            max_workers=max_workers,
+            write_batch_size=write_batch_size,
+            write_batch_delay=write_batch_delay,
+            read_requests_per_minute=read_requests_per_minute,
+            write_requests_per_minute=write_requests_per_minute,
+            max_retries=max_retries,
+            request_timeout=request_timeout,
+            breaker_failure_threshold=breaker_failure_threshold,
+            breaker_reset_timeout=breaker_reset_timeout,
+            reconcile_interval=reconcile_interval,
+            reconcile_batch_size=reconcile_batch_size,
+            sheets_backend=sheets_backend,
+            memory_latency=memory_latency,
+            memory_requests_per_minute=memory_requests_per_minute,
+            memory_error_rate=memory_error_rate
         )
         logger.info(f"Google config создан: {google_config}")
         logger.info(f"Google Drive {'включен' if enable_drive else 'отключен'}")
@@ -108,6 +232,7 @@ def load_config(path: str = None) -> Config:
     )
     
     log_level = env.str("LOG_LEVEL", "INFO")
+    stats_log_interval = env.float("STATS_LOG_INTERVAL", 300.0)
     
     return Config(
         tg_bot=tg_bot,
@@ -115,5 +240,7 @@ def load_config(path: str = None) -> Config:
         redis=redis,
         selection=selection_config,
         google=google_config,
-        log_level=log_level
+        cache=cache,
+        log_level=log_level,
+        stats_log_interval=stats_log_interval
     )
\ No newline at end of file
@@ -1,23 +1,89 @@
+from sqlalchemy import exc
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from config.config import Config
 from database.models import Base
+from database.query_stats import QueryStats
 import logging
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, Dict, Any
 
 logger = logging.getLogger(__name__)
 
 
+class PoolStats:
+    """Счетчики выдачи соединений из пула"""
+
+    def __init__(self, slow_checkout: float = 1.0):
+        self.slow_checkout = slow_checkout
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий время получения соединения (ожидание в очереди, подключение, pre-ping)"""
+
+    stats: PoolStats
+
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            logger.error(f"❌ Не дождались соединения из пула за {self._timeout:.0f} с: {self.status()}")
+            raise
+        finally:
+            wait_time = time.perf_counter() - started_at
+            self.stats.checkouts += 1
+            self.stats.total_wait_time += wait_time
+            self.stats.max_wait_time = max(self.stats.max_wait_time, wait_time)
+            if wait_time >= self.stats.slow_checkout:
+                logger.warning(f"⏳ Соединение из пула получено за {wait_time:.2f} с: {self.status()}")
+
+    def recreate(self):
+        # После dispose()/обрыва соединений пул пересоздается - счетчики переносим в новый
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
 class Database:
     def __init__(self, config: Config):
         self.config = config
-        db_url = f"postgresql+asyncpg://{config.db.user}:{config.db.password}@{config.db.host}:{config.db.port}/{config.db.database}"
+        db = config.db
+        # Кеш подготовленных выражений SQLAlchemy и asyncpg (0 - отключить, нужно для pgbouncer в режиме transaction)
+        db_url = (
+            f"postgresql+asyncpg://{db.user}:{db.password}@{db.host}:{db.port}/{db.database}"
+            f"?prepared_statement_cache_size={db.statement_cache_size}"
+        )
         
         self.engine = create_async_engine(
             db_url,
             echo=False,
-            pool_pre_ping=True,
-            pool_recycle=300,
+            poolclass=InstrumentedQueuePool,
+            pool_size=db.pool_size,
+            max_overflow=db.max_overflow,
+            pool_timeout=db.pool_timeout,
+            pool_recycle=db.pool_recycle,
+            # Pre-ping - лишний запрос на каждую выдачу соединения, зато обрыв обнаруживается до запроса
+            pool_pre_ping=db.pool_pre_ping,
+            connect_args={
+                "timeout": db.connect_timeout,
+                "command_timeout": db.command_timeout,
+                "statement_cache_size": db.statement_cache_size,
+            },
         )
+        self.engine.pool.stats = PoolStats(slow_checkout=db.slow_checkout_threshold)
+        
+        # Гистограммы задержек, лог медленных запросов и счетчик запросов за апдейт
+        self.query_stats = QueryStats(
+            slow_query_threshold=db.slow_query_threshold,
+            max_queries_per_update=db.max_queries_per_update,
+        )
+        self.query_stats.attach(self.engine.sync_engine)
         
         self.session_factory = async_sessionmaker(
             self.engine,
@@ -39,6 +105,22 @@ class Database:
         """Получение сессии базы данных"""
         return self.session_factory()
 
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Метрики пула соединений"""
+        pool = self.engine.pool
+        stats = pool.stats
+        return {
+            "pool_size": pool.size(),
+            "max_overflow": self.config.db.max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": stats.checkouts,
+            "timeouts": stats.timeouts,
+            "avg_wait_time": stats.total_wait_time / stats.checkouts if stats.checkouts else 0.0,
+            "max_wait_time": stats.max_wait_time,
+        }
+
     async def close(self):
         """Закрытие соединения с базой данных"""
         await self.engine.dispose()
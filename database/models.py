@@ -1,4 +1,5 @@
-from sqlalchemy import BigInteger, String, Boolean, Text, DateTime, ForeignKey
+from sqlalchemy import BigInteger, Integer, String, Boolean, Text, DateTime, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
@@ -53,8 +54,65 @@ class Application(Base):
     program_rating: Mapped[int] = mapped_column(BigInteger, nullable=False)
     partners_rating: Mapped[int] = mapped_column(BigInteger, nullable=False)
     
+    # Ключ идемпотентности подачи (telegram_id + intent диалога): повторное нажатие не создает вторую заявку
+    submit_key: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
 
     # Связь с пользователем
     user: Mapped["User"] = relationship("User", back_populates="applications")
+
+    __table_args__ = (
+        # Сверка с Google Sheets идет по возрастанию (updated_at, id)
+        Index('ix_applications_updated_at_id', 'updated_at', 'id'),
+        Index('ix_applications_submit_key', 'submit_key', unique=True),
+        # Заявки пользователя и поиск кандидата по контактам
+        Index('ix_applications_user_id', 'user_id'),
+        Index('ix_applications_email', 'email'),
+        Index('ix_applications_phone', 'phone'),
+    )
+
+
+class SheetsExportOutbox(Base):
+    """Очередь выгрузки заявок в Google Sheets (transactional outbox)"""
+    __tablename__ = 'sheets_export_outbox'
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    application_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('applications.id'), nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default='0', nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    exported_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # NULL - еще не выгружено
+    failed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # Попытки исчерпаны, выгрузка остановлена
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+
+    # Связь с заявкой
+    application: Mapped["Application"] = relationship("Application")
+
+    __table_args__ = (
+        # Воркер выбирает только невыгруженные записи, готовые к попытке
+        Index('ix_sheets_export_outbox_pending', 'next_attempt_at', postgresql_where=text('exported_at IS NULL')),
+        # Проверка "заявка еще ждет выгрузки" при сверке с Google Sheets
+        Index('ix_sheets_export_outbox_application_id', 'application_id', postgresql_where=text('exported_at IS NULL')),
+    )
+
+
+class SyncWatermark(Base):
+    """Отметка, до которой данные уже синхронизированы (например, сверка с Google Sheets)"""
+    __tablename__ = 'sync_watermarks'
+
+    name: Mapped[str] = mapped_column(String(100), primary_key=True)
+    last_updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    last_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class ApplicationDraft(Base):
+    """Черновик анкеты: ответы и шаг диалога, переживают потерю данных диалога в Redis"""
+    __tablename__ = 'application_drafts'
+
+    telegram_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    state: Mapped[str] = mapped_column(String(100), nullable=False)  # Шаг анкеты, например 'ApplicationSG:email'
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
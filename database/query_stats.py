@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import re
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы задержек (миллисекунды), последняя корзина - все, что дольше
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def normalize_statement(statement: str) -> str:
+    """SQL без лишних пробелов и с одним плейсхолдером вместо раскрытых списков IN"""
+    statement = re.sub(r"\s+", " ", statement).strip()
+    return re.sub(r"\((?:\$\d+(?:::\w+)?,\s*)+\$\d+(?:::\w+)?\)", "(...)", statement)
+
+
+def fingerprint_parameters(parameters: Any) -> str:
+    """
+    Отпечаток параметров запроса без самих значений (в них email, телефоны и т. п.)
+
+    Типы параметров и короткий хеш значений: по нему видно, что медленные запросы
+    повторяются с одними и теми же параметрами.
+    """
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        return f"executemany x{len(parameters)}: {fingerprint_parameters(parameters[0])}"
+    values = list(parameters.values()) if isinstance(parameters, dict) else list(parameters or ())
+    types = ", ".join(
+        f"{type(value).__name__}[{len(value)}]" if isinstance(value, (str, bytes)) else type(value).__name__
+        for value in values
+    )
+    digest = hashlib.blake2b(repr(values).encode(), digest_size=4).hexdigest()
+    return f"({types}) #{digest}"
+
+
+class LatencyHistogram:
+    """Гистограмма задержек запросов"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def add(self, elapsed: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed * 1000)] += 1
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def percentile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает q-й перцентиль (миллисекунды)"""
+        if not self.count:
+            return 0.0
+        threshold = q * self.count
+        seen = 0
+        for bound, bucket in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += bucket
+            if seen >= threshold:
+                return min(float(bound), self.max_time * 1000)
+        return self.max_time * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "avg_ms": self.total_time / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_time * 1000,
+            "buckets": {label: bucket for label, bucket in zip(labels, self.buckets) if bucket},
+        }
+
+
+class UpdateQueryCounter:
+    """Число запросов к БД за обработку одного апдейта"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+
+
+_current_update: ContextVar[Optional[UpdateQueryCounter]] = ContextVar("db_update_queries", default=None)
+
+
+class QueryStats:
+    """
+    Замеры запросов через события SQLAlchemy before/after_cursor_execute
+
+    Собирает гистограммы задержек (общую и по каждому запросу), пишет в лог медленные запросы
+    с отпечатком параметров и считает запросы за апдейт, чтобы ловить N+1.
+    """
+
+    def __init__(self, slow_query_threshold: float = 0.2, max_queries_per_update: int = 10,
+                 max_statements: int = 500):
+        """
+        Args:
+            slow_query_threshold: Запросы дольше этого пишутся в лог (секунды)
+            max_queries_per_update: Предупреждать, если апдейт сделал больше запросов
+            max_statements: Сколько разных запросов хранить в статистике
+        """
+        self.slow_query_threshold = slow_query_threshold
+        self.max_queries_per_update = max_queries_per_update
+        self.max_statements = max_statements
+
+        self.histogram = LatencyHistogram()
+        self.statements: Dict[str, LatencyHistogram] = {}
+        self.slow_queries = 0
+
+    def attach(self, engine: Engine):
+        """Подписаться на события движка (для AsyncEngine - engine.sync_engine)"""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Время начала храним в контексте выполнения, а не в соединении из пула:
+        # у запроса, упавшего с ошибкой, after_cursor_execute не вызывается
+        if context is not None:
+            context._query_started_at = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started_at = getattr(context, "_query_started_at", None)
+        if started_at is None:
+            return
+        self.record(statement, parameters, time.perf_counter() - started_at)
+
+    def record(self, statement: str, parameters: Any, elapsed: float):
+        """Учесть выполненный запрос"""
+        self.histogram.add(elapsed)
+
+        key = normalize_statement(statement)
+        histogram = self.statements.get(key)
+        if histogram is None and len(self.statements) < self.max_statements:
+            histogram = self.statements[key] = LatencyHistogram()
+        if histogram is not None:
+            histogram.add(elapsed)
+
+        counter = _current_update.get()
+        if counter is not None:
+            counter.count += 1
+            counter.total_time += elapsed
+
+        if elapsed >= self.slow_query_threshold:
+            self.slow_queries += 1
+            logger.warning(f"🐢 Медленный запрос {elapsed * 1000:.0f} мс: {key[:500]} "
+                           f"| параметры {fingerprint_parameters(parameters)}")
+
+    @contextmanager
+    def track_update(self, description: str = "") -> Iterator[UpdateQueryCounter]:
+        """Считать запросы внутри обработки одного апдейта"""
+        counter = UpdateQueryCounter()
+        token = _current_update.set(counter)
+        try:
+            yield counter
+        finally:
+            _current_update.reset(token)
+            if counter.count > self.max_queries_per_update:
+                logger.warning(f"🔁 Запросов к БД за один апдейт: {counter.count} "
+                               f"({counter.total_time * 1000:.0f} мс), {description} - возможен N+1")
+
+    def get_stats(self, top: int = 10) -> Dict[str, Any]:
+        """Общая гистограмма и самые тяжелые запросы по суммарному времени"""
+        heaviest = sorted(self.statements.items(), key=lambda item: item[1].total_time, reverse=True)[:top]
+        return {
+            "queries": self.histogram.to_dict(),
+            "slow_queries": self.slow_queries,
+            "top_statements": [
+                {"statement": statement[:200], **histogram.to_dict()} for statement, histogram in heaviest
+            ],
+        }
@@ -1,42 +1,113 @@
-from sqlalchemy import select, update
+from sqlalchemy import select, update, delete, func, exists, tuple_, case, literal_column, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import User, Application
+from sqlalchemy.orm import joinedload
+from database.models import User, Application, SheetsExportOutbox, SyncWatermark, ApplicationDraft
+from database.user_cache import UserCache, UserSnapshot
+from database.username_buffer import UsernameWriteBuffer
+from dataclasses import replace
 from typing import Optional
+from datetime import datetime, timedelta
 from utils.logging_config import log_db_operation, log_error
-from utils.google_services import GoogleSheetsService
 import re
 
 
 class UserRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, cache: Optional[UserCache] = None,
+                 username_buffer: Optional[UsernameWriteBuffer] = None):
         self.session = session
+        self.cache = cache
+        self.username_buffer = username_buffer
+
+    async def get_user_snapshot(self, telegram_id: int, telegram_username: Optional[str] = None) -> UserSnapshot:
+        """
+        Данные пользователя из кеша или SELECT без записи в БД
+        
+        Новый пользователь создается через get_or_create_user. Смена username уходит
+        в буфер отложенной записи, а без буфера пишется сразу.
+        """
+        snapshot = await self._get_cached_or_select(telegram_id)
+        if snapshot is not None and snapshot.telegram_username == telegram_username:
+            return snapshot
+        
+        if snapshot is not None and self.username_buffer is not None:
+            self.username_buffer.add(telegram_id, telegram_username)
+            snapshot = replace(snapshot, telegram_username=telegram_username)
+        else:
+            snapshot = UserSnapshot.from_user(await self.get_or_create_user(telegram_id, telegram_username))
+        if self.cache is not None:
+            await self.cache.set(snapshot)
+        return snapshot
+
+    async def get_stage1_status(self, telegram_id: int, telegram_username: Optional[str] = None) -> str:
+        """
+        Статус первого этапа для главного меню
+        
+        Из кеша, а при промахе - SELECT только нужных колонок без ORM-объекта и без записи в БД.
+        Пользователь создается, только если его еще нет (сразу upsert, без повторного SELECT).
+        """
+        snapshot = await self._get_cached_or_select(telegram_id)
+        if snapshot is None:
+            snapshot = UserSnapshot.from_user(await self.get_or_create_user(telegram_id, telegram_username))
+            if self.cache is not None:
+                await self.cache.set(snapshot)
+        return snapshot.stage1_submitted
+
+    async def _get_cached_or_select(self, telegram_id: int) -> Optional[UserSnapshot]:
+        """Пользователь из кеша, при промахе - SELECT колонок снимка (попадает в кеш); None, если его нет"""
+        if self.cache is not None:
+            snapshot = await self.cache.get(telegram_id)
+            if snapshot is not None:
+                return snapshot
+        
+        result = await self.session.execute(
+            select(User.id, User.telegram_id, User.telegram_username, User.stage1_submitted)
+            .where(User.telegram_id == telegram_id)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        
+        snapshot = UserSnapshot(**row._mapping)
+        if self.cache is not None:
+            await self.cache.set(snapshot)
+        return snapshot
 
-    async def get_or_create_user(self, telegram_id: int, telegram_username: Optional[str] = None) -> User:
-        """Получить или создать пользователя"""
+    async def get_or_create_user(self, telegram_id: int, telegram_username: Optional[str] = None,
+                                 stage1_submitted: Optional[str] = None) -> User:
+        """
+        Получить или создать пользователя (один запрос INSERT ... ON CONFLICT DO UPDATE ... RETURNING)
+        
+        Если передан stage1_submitted, тем же запросом выставляется и статус первого этапа.
+        """
         try:
-            # Попытаемся найти существующего пользователя
-            result = await self.session.execute(
-                select(User).where(User.telegram_id == telegram_id)
-            )
-            user = result.scalar_one_or_none()
+            values = {'telegram_id': telegram_id, 'telegram_username': telegram_username}
+            if stage1_submitted is not None:
+                values['stage1_submitted'] = stage1_submitted
+            stmt = pg_insert(User).values(**values)
             
-            if user is None:
-                # Создаем нового пользователя
-                user = User(
-                    telegram_id=telegram_id,
-                    telegram_username=telegram_username
-                )
-                self.session.add(user)
-                await self.session.commit()
-                await self.session.refresh(user)
+            updated = {key: stmt.excluded[key] for key in values if key != 'telegram_id'}
+            changed = or_(*(getattr(User, key).is_distinct_from(value) for key, value in updated.items()))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={
+                    **updated,
+                    # onupdate в ON CONFLICT не применяется, а время меняем только при реальных изменениях
+                    'updated_at': case((changed, func.now()), else_=User.updated_at),
+                },
+            ).returning(User, literal_column("xmax = 0").label("inserted"))
+            
+            # Одновременные апдейты одного пользователя не падают на уникальном telegram_id
+            result = await self.session.execute(stmt, execution_options={"populate_existing": True})
+            user, inserted = result.one()
+            # username записан этим запросом - после коммита отложенная запись устарела
+            if self.username_buffer is not None:
+                self.username_buffer.discard_after_commit(self.session, telegram_id, telegram_username)
+            
+            if inserted:
                 log_db_operation("CREATE", "users", f"new user created", telegram_id)
             else:
-                # Обновляем username если изменился
-                if user.telegram_username != telegram_username:
-                    user.telegram_username = telegram_username
-                    await self.session.commit()
-                    log_db_operation("UPDATE", "users", f"username updated to {telegram_username}", telegram_id)
-                log_db_operation("SELECT", "users", f"existing user found", telegram_id)
+                log_db_operation("UPSERT", "users", f"existing user found", telegram_id)
             
             return user
         except Exception as e:
@@ -44,14 +115,17 @@ class UserRepository:
             raise
 
     async def update_stage1_status(self, telegram_id: int, status: str):
-        """Обновить статус первого этапа"""
+        """Обновить статус первого этапа (новый статус попадает в кеш после коммита)"""
         try:
-            await self.session.execute(
+            result = await self.session.execute(
                 update(User)
                 .where(User.telegram_id == telegram_id)
                 .values(stage1_submitted=status)
+                .returning(User.id, User.telegram_id, User.telegram_username, User.stage1_submitted)
             )
-            await self.session.commit()
+            row = result.first()
+            if row is not None and self.cache is not None:
+                self.cache.set_after_commit(self.session, UserSnapshot(**row._mapping))
             log_db_operation("UPDATE", "users", f"stage1_status updated to {status}", telegram_id)
         except Exception as e:
             log_error(e, "Ошибка при обновлении статуса этапа 1", telegram_id)
@@ -66,9 +140,8 @@ class UserRepository:
 
 
 class ApplicationRepository:
-    def __init__(self, session: AsyncSession, google_sheets_service: Optional[GoogleSheetsService] = None):
+    def __init__(self, session: AsyncSession):
         self.session = session
-        self.google_sheets_service = google_sheets_service
 
     @staticmethod
     def parse_full_name(full_name: str) -> tuple[str, str, Optional[str]]:
@@ -86,13 +159,21 @@ class ApplicationRepository:
         else:
             return "", "", None
 
-    async def create_application(self, user_id: int, application_data: dict, user_telegram_data: dict = None) -> Application:
-        """Создать заявку"""
+    async def create_application(self, user_id: int, application_data: dict,
+                                 telegram_id: Optional[int] = None,
+                                 submit_key: Optional[str] = None) -> Optional[Application]:
+        """
+        Создать заявку вместе с задачей на выгрузку в Google Sheets
+        
+        id и серверные значения по умолчанию приходят в RETURNING того же INSERT.
+        Если заявка с таким submit_key уже есть, INSERT ничего не делает (ON CONFLICT DO NOTHING)
+        и возвращается None. telegram_id нужен только для лога.
+        """
         try:
             # Разбираем ФИО
             first_name, last_name, middle_name = self.parse_full_name(application_data['full_name'])
             
-            application = Application(
+            stmt = pg_insert(Application).values(
                 user_id=user_id,
                 full_name=application_data['full_name'],
                 first_name=first_name,
@@ -112,71 +193,26 @@ class ApplicationRepository:
                 pr_rating=application_data['pr_rating'],
                 program_rating=application_data['program_rating'],
                 partners_rating=application_data['partners_rating'],
+                submit_key=submit_key,
             )
+            if submit_key is not None:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[Application.submit_key])
             
-            self.session.add(application)
-            await self.session.commit()
-            await self.session.refresh(application)
+            result = await self.session.execute(stmt.returning(Application))
+            application = result.scalar_one_or_none()
+            if application is None:
+                log_db_operation("SKIP", "applications", f"duplicate submit ignored: {submit_key}", telegram_id)
+                return None
             
-            # Получаем telegram_id пользователя для логирования
-            user_result = await self.session.execute(
-                select(User.telegram_id, User.telegram_username).where(User.id == user_id)
-            )
-            user_data = user_result.first()
-            telegram_id = user_data.telegram_id if user_data else None
-            telegram_username = user_data.telegram_username if user_data else None
+            # Задача на выгрузку в Google Sheets пишется в той же транзакции,
+            # саму выгрузку выполняет фоновый SheetsExportWorker
+            self.session.add(SheetsExportOutbox(application_id=application.id))
+            await self.session.flush()
             
             log_db_operation("CREATE", "applications", 
                            f"application created: {application_data['full_name']}, {application_data['email']}", 
                            telegram_id)
             
-            # Сохраняем в Google Sheets если сервис настроен
-            if self.google_sheets_service:
-                try:
-                    # Подготавливаем данные для Google Sheets
-                    sheets_data = {
-                        'telegram_id': telegram_id,
-                        'telegram_username': telegram_username,
-                        'full_name': application.full_name,
-                        'first_name': application.first_name,
-                        'last_name': application.last_name,
-                        'middle_name': application.middle_name,
-                        'course': application.course,
-                        'is_from_vsm': application.is_from_vsm,
-                        'is_from_spbu': application.is_from_spbu,
-                        'university': application.university,
-                        'dormitory': application.dormitory,
-                        'email': application.email,
-                        'phone': application.phone,
-                        'personal_qualities': application.personal_qualities,
-                        'motivation': application.motivation,
-                        'logistics_rating': application.logistics_rating,
-                        'marketing_rating': application.marketing_rating,
-                        'pr_rating': application.pr_rating,
-                        'program_rating': application.program_rating,
-                        'partners_rating': application.partners_rating,
-                        'created_at': application.created_at.isoformat(),
-                        'updated_at': application.updated_at.isoformat(),
-                    }
-                    
-                    # Добавляем данные пользователя Telegram если переданы
-                    if user_telegram_data:
-                        sheets_data.update(user_telegram_data)
-                    
-                    success = await self.google_sheets_service.add_application_to_sheet(sheets_data)
-                    if success:
-                        log_db_operation("GOOGLE_SHEETS", "applications", 
-                                       f"application exported to Google Sheets: {application_data['full_name']}", 
-                                       telegram_id)
-                    else:
-                        log_error(Exception("Google Sheets export failed"), 
-                                "Не удалось экспортировать заявку в Google Sheets", 
-                                telegram_id)
-                        
-                except Exception as e:
-                    log_error(e, "Ошибка при экспорте заявки в Google Sheets", telegram_id)
-                    # Не прерываем выполнение если Google Sheets недоступен
-            
             return application
         except Exception as e:
             log_error(e, "Ошибка при создании заявки")
@@ -188,3 +224,184 @@ class ApplicationRepository:
             select(Application).where(Application.user_id == user_id)
         )
         return list(result.scalars().all())
+
+    async def get_updated_since(self, updated_at: datetime, application_id: int, limit: int) -> list[Application]:
+        """
+        Заявки, измененные после отметки (updated_at, id), по возрастанию отметки
+
+        Порция обрывается на первой заявке, которая еще ждет выгрузки в outbox: ее выгрузит
+        SheetsExportWorker, а отметка сверки не должна уйти дальше нее, иначе заявка
+        не попадет в сверку, если выгрузка так и не удастся. Заявки с исчерпанными
+        попытками выгрузки сверка проверяет сама.
+        """
+        pending_export = exists().where(
+            SheetsExportOutbox.application_id == Application.id,
+            SheetsExportOutbox.exported_at.is_(None),
+            SheetsExportOutbox.failed_at.is_(None),
+        )
+        result = await self.session.execute(
+            select(Application, pending_export.label("pending_export"))
+            .options(joinedload(Application.user, innerjoin=True))
+            .where(tuple_(Application.updated_at, Application.id) > tuple_(updated_at, application_id))
+            .order_by(Application.updated_at, Application.id)
+            .limit(limit)
+        )
+        applications = []
+        for application, is_pending in result.all():
+            if is_pending:
+                break
+            applications.append(application)
+        return applications
+
+
+class SyncWatermarkRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get(self, name: str) -> tuple[datetime, int]:
+        """Отметка синхронизации (updated_at, id); без отметки - самое начало"""
+        result = await self.session.execute(
+            select(SyncWatermark.last_updated_at, SyncWatermark.last_id).where(SyncWatermark.name == name)
+        )
+        row = result.first()
+        return (row.last_updated_at, row.last_id) if row else (datetime.min, 0)
+
+    async def set(self, name: str, last_updated_at: datetime, last_id: int):
+        """Сохранить отметку синхронизации"""
+        stmt = pg_insert(SyncWatermark).values(name=name, last_updated_at=last_updated_at, last_id=last_id)
+        await self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[SyncWatermark.name],
+                set_={
+                    'last_updated_at': stmt.excluded.last_updated_at,
+                    'last_id': stmt.excluded.last_id,
+                    'updated_at': func.now(),
+                },
+            )
+        )
+
+
+class ApplicationDraftRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get(self, telegram_id: int) -> Optional[ApplicationDraft]:
+        """Черновик анкеты пользователя"""
+        result = await self.session.execute(
+            select(ApplicationDraft).where(ApplicationDraft.telegram_id == telegram_id)
+        )
+        return result.scalar_one_or_none()
+
+    async def save(self, telegram_id: int, state: str, data: dict):
+        """Сохранить черновик (INSERT ... ON CONFLICT DO UPDATE, без записи, если ничего не изменилось)"""
+        stmt = pg_insert(ApplicationDraft).values(telegram_id=telegram_id, state=state, data=data)
+        await self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ApplicationDraft.telegram_id],
+                set_={
+                    'state': stmt.excluded.state,
+                    'data': stmt.excluded.data,
+                    'updated_at': func.now(),
+                },
+                where=or_(
+                    ApplicationDraft.state.is_distinct_from(stmt.excluded.state),
+                    ApplicationDraft.data.is_distinct_from(stmt.excluded.data),
+                ),
+            )
+        )
+
+    async def delete(self, telegram_id: int):
+        """Удалить черновик (анкета отправлена)"""
+        await self.session.execute(
+            delete(ApplicationDraft).where(ApplicationDraft.telegram_id == telegram_id)
+        )
+
+
+class SheetsExportOutboxRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def fetch_pending(self, limit: int) -> list[SheetsExportOutbox]:
+        """Получить и заблокировать невыгруженные записи, готовые к попытке"""
+        result = await self.session.execute(
+            select(SheetsExportOutbox)
+            .options(
+                joinedload(SheetsExportOutbox.application, innerjoin=True)
+                .joinedload(Application.user, innerjoin=True)
+            )
+            .where(
+                SheetsExportOutbox.exported_at.is_(None),
+                SheetsExportOutbox.failed_at.is_(None),
+                SheetsExportOutbox.next_attempt_at <= func.now(),
+            )
+            .order_by(SheetsExportOutbox.next_attempt_at)
+            .limit(limit)
+            # SKIP LOCKED позволяет нескольким воркерам разбирать очередь параллельно
+            .with_for_update(skip_locked=True, of=SheetsExportOutbox)
+        )
+        return list(result.scalars().all())
+
+    async def claim_pending(self, limit: int, lease_seconds: float) -> list[SheetsExportOutbox]:
+        """
+        Забрать записи, готовые к попытке, на время аренды
+
+        next_attempt_at сдвигается на lease_seconds: после коммита блокировки сняты,
+        но другие воркеры не возьмут записи, пока аренда не истечет (или воркер
+        не запишет результат). Если процесс упадет, записи вернутся в очередь сами.
+        """
+        entries = await self.fetch_pending(limit)
+        if entries:
+            await self.session.execute(
+                update(SheetsExportOutbox)
+                .where(SheetsExportOutbox.id.in_([entry.id for entry in entries]))
+                .values(next_attempt_at=func.now() + timedelta(seconds=lease_seconds))
+                .execution_options(synchronize_session=False)
+            )
+        return entries
+
+    async def mark_exported(self, entry_ids: list[int]):
+        """Отметить записи как выгруженные"""
+        await self.session.execute(
+            update(SheetsExportOutbox)
+            .where(SheetsExportOutbox.id.in_(entry_ids))
+            .values(exported_at=func.now(), last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def schedule_retry(self, entry_id: int, error: str, delay_seconds: float):
+        """Запланировать повторную попытку выгрузки"""
+        await self.session.execute(
+            update(SheetsExportOutbox)
+            .where(SheetsExportOutbox.id == entry_id)
+            .values(attempts=SheetsExportOutbox.attempts + 1, last_error=error,
+                    next_attempt_at=func.now() + timedelta(seconds=delay_seconds))
+            .execution_options(synchronize_session=False)
+        )
+
+    async def mark_failed(self, entry_id: int, error: str):
+        """Остановить выгрузку записи после последней неудачной попытки"""
+        await self.session.execute(
+            update(SheetsExportOutbox)
+            .where(SheetsExportOutbox.id == entry_id)
+            .values(attempts=SheetsExportOutbox.attempts + 1, last_error=error, failed_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+
+    async def defer(self, entry_ids: list[int], delay_seconds: float):
+        """Отложить выгрузку без учета попытки (Google Sheets временно недоступен)"""
+        await self.session.execute(
+            update(SheetsExportOutbox)
+            .where(SheetsExportOutbox.id.in_(entry_ids))
+            .values(next_attempt_at=func.now() + timedelta(seconds=delay_seconds))
+            .execution_options(synchronize_session=False)
+        )
+
+    async def count_pending(self) -> int:
+        """Количество записей, ожидающих выгрузки"""
+        result = await self.session.execute(
+            select(func.count()).select_from(SheetsExportOutbox).where(
+                SheetsExportOutbox.exported_at.is_(None),
+                SheetsExportOutbox.failed_at.is_(None),
+            )
+        )
+        return result.scalar_one()
@@ -0,0 +1,47 @@
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Application
+from database.repositories import UserRepository, ApplicationRepository, ApplicationDraftRepository
+from database.user_cache import UserCache, UserSnapshot
+from database.username_buffer import UsernameWriteBuffer
+from utils.logging_config import log_error
+
+
+class ApplicationService:
+    """Операции с заявками, затрагивающие несколько таблиц"""
+
+    def __init__(self, session: AsyncSession, user_cache: Optional[UserCache] = None,
+                 username_buffer: Optional[UsernameWriteBuffer] = None):
+        self.session = session
+        self.user_cache = user_cache
+        self.user_repo = UserRepository(session, cache=user_cache, username_buffer=username_buffer)
+        self.app_repo = ApplicationRepository(session)
+        self.draft_repo = ApplicationDraftRepository(session)
+
+    async def submit_application(self, telegram_id: int, telegram_username: Optional[str],
+                                 application_data: dict, submit_key: Optional[str] = None) -> Optional[Application]:
+        """
+        Подача заявки одной транзакцией
+
+        Upsert пользователя сразу со статусом 'submitted' (RETURNING id), INSERT заявки
+        и задачи на выгрузку, удаление черновика анкеты, один коммит. Данные Telegram берутся из апдейта, без повторных SELECT.
+
+        Returns:
+            Заявка или None, если заявка с таким submit_key уже подана (повторное нажатие)
+        """
+        try:
+            user = await self.user_repo.get_or_create_user(telegram_id, telegram_username, stage1_submitted="submitted")
+            application = await self.app_repo.create_application(user.id, application_data, telegram_id, submit_key)
+            await self.draft_repo.delete(telegram_id)
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            log_error(e, "Ошибка при подаче заявки", telegram_id)
+            raise
+
+        # Кеш обновляем только после коммита - меню сразу покажет новый статус без запроса в БД
+        if self.user_cache is not None:
+            await self.user_cache.set(UserSnapshot.from_user(user))
+        return application
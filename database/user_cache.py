@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any
+
+from cachetools import TTLCache
+from redis.asyncio import Redis
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database.models import User
+
+logger = logging.getLogger(__name__)
+
+# Ключ session.info: пользователи, измененные в текущей транзакции сессии
+_CHANGED_KEY = "user_cache_changed"
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Данные пользователя, которые нужны диалогам на каждом апдейте"""
+    id: int
+    telegram_id: int
+    telegram_username: Optional[str]
+    stage1_submitted: str
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            telegram_username=user.telegram_username,
+            stage1_submitted=user.stage1_submitted,
+        )
+
+
+class UserCache:
+    """
+    Кеш пользователей по telegram_id
+
+    Первый уровень - TTL/LRU-кеш в памяти процесса, второй (опционально) - Redis,
+    общий для всех процессов бота. TTL первого уровня стоит держать коротким:
+    инвалидация из другого процесса доходит до него только через Redis.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0,
+                 redis: Optional[Redis] = None, redis_ttl: int = 600):
+        """
+        Args:
+            maxsize: Максимум пользователей в памяти (вытесняются давно не использованные)
+            ttl: Время жизни записи в памяти (секунды)
+            redis: Клиент Redis для второго уровня кеша (опционально)
+            redis_ttl: Время жизни записи в Redis (секунды)
+        """
+        self._local: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.redis = redis
+        self.redis_ttl = redis_ttl
+
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+        # Записи в Redis, запущенные после коммита (ссылки, чтобы задачи не собрал GC)
+        self._redis_writes: set[asyncio.Task] = set()
+
+    @staticmethod
+    def _key(telegram_id: int) -> str:
+        return f"user_cache:{telegram_id}"
+
+    async def get(self, telegram_id: int) -> Optional[UserSnapshot]:
+        """Пользователь из кеша или None"""
+        snapshot = self._local.get(telegram_id)
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(self._key(telegram_id))
+            except Exception as e:
+                logger.warning(f"⚠️ Кеш пользователей в Redis недоступен: {e}")
+                raw = None
+            if raw is not None:
+                snapshot = UserSnapshot(**json.loads(raw))
+                self._local[telegram_id] = snapshot
+                self.redis_hits += 1
+                return snapshot
+
+        self.misses += 1
+        return None
+
+    async def set(self, snapshot: UserSnapshot):
+        """Положить пользователя в кеш"""
+        self._local[snapshot.telegram_id] = snapshot
+        await self._set_redis(snapshot)
+
+    async def _set_redis(self, snapshot: UserSnapshot):
+        if self.redis is not None:
+            try:
+                await self.redis.set(self._key(snapshot.telegram_id), json.dumps(asdict(snapshot)), ex=self.redis_ttl)
+            except Exception as e:
+                logger.warning(f"⚠️ Кеш пользователей в Redis недоступен: {e}")
+
+    def set_after_commit(self, session: AsyncSession, snapshot: UserSnapshot):
+        """
+        Положить пользователя в кеш, когда транзакция, изменившая его, закоммитится
+
+        Старая запись удаляется из памяти процесса сразу. Если до коммита ее снова
+        прочитают из БД и закешируют, после коммита она все равно будет перезаписана.
+        При откате в кеш ничего не пишется.
+        """
+        sync_session = session.sync_session
+        changed = sync_session.info.get(_CHANGED_KEY)
+        if changed is None:
+            changed = sync_session.info[_CHANGED_KEY] = {}
+            event.listen(sync_session, "after_commit", self._after_commit)
+            event.listen(sync_session, "after_rollback", self._after_rollback)
+        changed[snapshot.telegram_id] = snapshot
+        self._local.pop(snapshot.telegram_id, None)
+
+    def _after_commit(self, session: Session):
+        changed = session.info[_CHANGED_KEY]
+        for snapshot in changed.values():
+            self._local[snapshot.telegram_id] = snapshot
+            if self.redis is not None:
+                task = asyncio.get_running_loop().create_task(self._set_redis(snapshot))
+                self._redis_writes.add(task)
+                task.add_done_callback(self._redis_writes.discard)
+        changed.clear()
+
+    @staticmethod
+    def _after_rollback(session: Session):
+        session.info[_CHANGED_KEY].clear()
+
+    async def invalidate(self, telegram_id: int):
+        """Удалить пользователя из кеша (после изменения в БД)"""
+        self._local.pop(telegram_id, None)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self._key(telegram_id))
+            except Exception as e:
+                logger.warning(f"⚠️ Кеш пользователей в Redis недоступен: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кеша пользователей"""
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            "size": len(self._local),
+            "maxsize": self._local.maxsize,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+        }
+
+
+def setup_user_cache(config, redis: Optional[Redis] = None) -> UserCache:
+    """Создание кеша пользователей по настройкам USER_CACHE_*"""
+    return UserCache(
+        maxsize=config.cache.user_cache_size,
+        ttl=config.cache.user_cache_ttl,
+        redis=redis if config.cache.user_cache_redis else None,
+        redis_ttl=config.cache.user_cache_redis_ttl,
+    )
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+from typing import Optional, Dict, Any
+
+from sqlalchemy import values, column, update, func, event, BigInteger, String
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database.db import Database
+from database.models import User
+from utils.logging_config import log_db_operation, log_error
+
+logger = logging.getLogger(__name__)
+
+# Ключ session.info: username, записанные в БД в текущей транзакции сессии
+_WRITTEN_KEY = "username_buffer_written"
+_MISSING = object()
+
+
+class UsernameWriteBuffer:
+    """
+    Отложенная запись смены telegram_username
+
+    Обработчик апдейта только кладет новый username в буфер, а фоновая задача
+    раз в flush_interval секунд пишет все накопленные изменения одним
+    UPDATE ... FROM (VALUES ...), не занимая соединения в пути запроса.
+    Для каждого пользователя хранится только последний username.
+    """
+
+    def __init__(self, db: Database, flush_interval: float = 5.0, batch_size: int = 500):
+        """
+        Args:
+            db: Подключение к базе данных
+            flush_interval: Пауза между записями буфера (секунды)
+            batch_size: Максимум пользователей в одном UPDATE
+        """
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        # telegram_id -> новый username
+        self._pending: Dict[int, Optional[str]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+        self.buffered = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def add(self, telegram_id: int, telegram_username: Optional[str]):
+        """Запомнить новый username пользователя"""
+        self._pending[telegram_id] = telegram_username
+        self.buffered += 1
+
+    def discard_after_commit(self, session: AsyncSession, telegram_id: int, telegram_username: Optional[str]):
+        """
+        Забыть отложенное изменение, когда транзакция, записавшая этот username, закоммитится
+
+        При откате транзакции изменение остается в буфере и будет записано фоновой задачей.
+        """
+        sync_session = session.sync_session
+        written = sync_session.info.get(_WRITTEN_KEY)
+        if written is None:
+            written = sync_session.info[_WRITTEN_KEY] = {}
+            event.listen(sync_session, "after_commit", self._after_commit)
+            event.listen(sync_session, "after_rollback", self._after_rollback)
+        written[telegram_id] = telegram_username
+
+    def _after_commit(self, session: Session):
+        written = session.info[_WRITTEN_KEY]
+        for telegram_id, telegram_username in written.items():
+            # Более новый username, пришедший до коммита, остается в буфере
+            if self._pending.get(telegram_id, _MISSING) == telegram_username:
+                del self._pending[telegram_id]
+        written.clear()
+
+    @staticmethod
+    def _after_rollback(session: Session):
+        session.info[_WRITTEN_KEY].clear()
+
+    def start(self):
+        """Запуск периодической записи в фоне"""
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run(), name="username_write_buffer")
+            logger.info("✏️ Отложенная запись username запущена")
+
+    async def stop(self):
+        """Остановка с записью всего, что осталось в буфере"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        while self._pending:
+            if not await self.flush():
+                break
+        logger.info("✏️ Отложенная запись username остановлена")
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if not self._stopping.is_set():
+                await self.flush()
+
+    async def flush(self) -> int:
+        """Записать очередную порцию буфера, возвращает число записанных пользователей"""
+        async with self._flush_lock:
+            telegram_ids = list(self._pending)[:self.batch_size]
+            if not telegram_ids:
+                return 0
+            batch = {telegram_id: self._pending.pop(telegram_id) for telegram_id in telegram_ids}
+
+            rows = values(
+                column("telegram_id", BigInteger),
+                column("telegram_username", String),
+                name="v",
+            ).data(list(batch.items()))
+            stmt = (
+                update(User)
+                .where(
+                    User.telegram_id == rows.c.telegram_id,
+                    User.telegram_username.is_distinct_from(rows.c.telegram_username),
+                )
+                .values(telegram_username=rows.c.telegram_username, updated_at=func.now())
+            )
+
+            session = await self.db.get_session()
+            try:
+                result = await session.execute(stmt)
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                self.errors += 1
+                log_error(e, f"Ошибка отложенной записи username ({len(batch)} пользователей)")
+                # Возвращаем в буфер, если за это время не пришел более новый username
+                for telegram_id, telegram_username in batch.items():
+                    self._pending.setdefault(telegram_id, telegram_username)
+                return 0
+            finally:
+                await session.close()
+
+            self.flushes += 1
+            self.flushed += result.rowcount
+            log_db_operation("UPDATE", "users", f"usernames flushed: {result.rowcount} of {len(batch)}")
+            return len(batch)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики буфера"""
+        return {
+            "pending": len(self._pending),
+            "buffered": self.buffered,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        }
+
+
+def setup_username_buffer(config, db: Database) -> Optional[UsernameWriteBuffer]:
+    """
+    Создание буфера отложенной записи username
+
+    Returns:
+        UsernameWriteBuffer или None, если DB_USERNAME_FLUSH_INTERVAL <= 0 (username пишется сразу)
+    """
+    if config.db.username_flush_interval <= 0:
+        return None
+
+    return UsernameWriteBuffer(
+        db=db,
+        flush_interval=config.db.username_flush_interval,
+        batch_size=config.db.username_flush_batch_size,
+    )
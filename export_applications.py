@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Скрипт полной выгрузки заявок из PostgreSQL в Google Sheets, CSV или XLSX
+
+Заявки читаются серверным курсором порциями, поэтому расход памяти не зависит от числа заявок.
+
+Примеры:
+    python export_applications.py --target sheets --worksheet APPLICATIONS_EXPORT
+    python export_applications.py --target csv --output applications.csv
+    python export_applications.py --target xlsx --output applications.xlsx  # нужен openpyxl
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from config.config import load_config
+from database.db import Database
+from database.models import Application
+from utils.google_services import (
+    GoogleSheetsService, APPLICATION_HEADERS, LAST_COLUMN, is_not_found_error, setup_google_sheets_service,
+)
+from utils.sheets_export import build_sheets_payload
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Рекомендуемый Google максимум тела запроса Sheets API; длинные ответы анкеты
+# делают порцию из chunk_size строк больше, поэтому она делится на несколько запросов
+MAX_REQUEST_BYTES = 2 * 1024 * 1024
+
+
+class ThroughputMeter:
+    """Подсчет скорости выгрузки"""
+
+    def __init__(self, total: Optional[int] = None):
+        self.total = total
+        self.rows = 0
+        self.started_at = time.monotonic()
+
+    def add(self, rows: int):
+        self.rows += rows
+        elapsed = time.monotonic() - self.started_at
+        progress = f"{self.rows}/{self.total}" if self.total is not None else str(self.rows)
+        logger.info(f"📦 Выгружено {progress} заявок, {self.rows / elapsed if elapsed else 0:.0f} строк/с")
+
+    def report(self):
+        elapsed = time.monotonic() - self.started_at
+        logger.info(f"🎉 Готово: {self.rows} заявок за {elapsed:.1f} с "
+                    f"({self.rows / elapsed if elapsed else 0:.0f} строк/с)")
+
+
+@asynccontextmanager
+async def snapshot_session(db: Database) -> AsyncIterator[AsyncSession]:
+    """Сессия, все запросы которой видят один снимок БД (REPEATABLE READ)"""
+    session = await db.get_session()
+    try:
+        await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        yield session
+    finally:
+        await session.close()
+
+
+async def count_applications(session: AsyncSession) -> int:
+    """Количество заявок"""
+    result = await session.execute(select(func.count()).select_from(Application))
+    return result.scalar_one()
+
+
+async def stream_rows(session: AsyncSession, chunk_size: int) -> AsyncIterator[list[list]]:
+    """Строки листа порциями по chunk_size (серверный курсор, yield_per)"""
+    result = await session.stream_scalars(
+        select(Application)
+        .options(joinedload(Application.user, innerjoin=True))
+        .order_by(Application.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    async for partition in result.partitions():
+        yield [
+            GoogleSheetsService.build_row(build_sheets_payload(application, application.user))
+            for application in partition
+        ]
+        # Объекты порции больше не нужны - не держим их в identity map сессии
+        session.expunge_all()
+
+
+def split_by_payload(rows: list[list], max_bytes: int) -> Iterator[list[list]]:
+    """Разбить порцию на части, каждая из которых помещается в один запрос values.update"""
+    part, part_bytes = [], 0
+    for row in rows:
+        # Размер значений в UTF-8 и разделители JSON на каждую ячейку
+        row_bytes = sum(len(str(cell).encode()) + 4 for cell in row)
+        if part and part_bytes + row_bytes > max_bytes:
+            yield part
+            part, part_bytes = [], 0
+        part.append(row)
+        part_bytes += row_bytes
+    if part:
+        yield part
+
+
+async def export_to_sheets(db: Database, service: GoogleSheetsService, worksheet_name: str, chunk_size: int):
+    """Выгрузка в лист Google Sheets: по одному запросу values.update на порцию (не больше MAX_REQUEST_BYTES)"""
+    # Количество и поток заявок читаются из одного снимка БД: заявки, поданные во время
+    # выгрузки, в нее не попадают, и запись не выходит за подогнанный размер листа
+    async with snapshot_session(db) as session:
+        total = await count_applications(session)
+
+        spreadsheet = await service.call(service.gc.open_by_key, service.spreadsheet_id)
+        try:
+            worksheet = await service.call(spreadsheet.worksheet, worksheet_name)
+            await service.call(worksheet.clear, quota="write")
+            # Размер листа подгоняем один раз, чтобы values.update не выходил за сетку
+            await service.call(worksheet.resize, rows=total + 1, cols=len(APPLICATION_HEADERS), quota="write")
+        except Exception as e:
+            if not is_not_found_error(e):
+                raise
+            logger.info(f"📄 Лист {worksheet_name} не найден, создаем новый...")
+            worksheet = await service.call(spreadsheet.add_worksheet, title=worksheet_name,
+                                           rows=total + 1, cols=len(APPLICATION_HEADERS),
+                                           quota="write", idempotent=False)
+
+        await service.call(worksheet.update, [APPLICATION_HEADERS], f"A1:{LAST_COLUMN}1", quota="write")
+
+        meter = ThroughputMeter(total)
+
+        async def write_rows(rows: list[list], first_row: int):
+            range_name = f"A{first_row}:{LAST_COLUMN}{first_row + len(rows) - 1}"
+            await service.call(worksheet.update, rows, range_name, quota="write")
+            meter.add(len(rows))
+
+        next_row = 2
+        pending_write: Optional[asyncio.Task] = None
+        try:
+            async for chunk in stream_rows(session, chunk_size):
+                for rows in split_by_payload(chunk, MAX_REQUEST_BYTES):
+                    # Пока пишется предыдущая порция, уже читаем следующую (в памяти не больше двух порций)
+                    if pending_write:
+                        await pending_write
+                    pending_write = asyncio.create_task(write_rows(rows, next_row))
+                    next_row += len(rows)
+
+            if pending_write:
+                await pending_write
+        finally:
+            # Чтение из БД упало, пока порция еще пишется - не оставляем запись висеть без ожидания
+            if pending_write and not pending_write.done():
+                pending_write.cancel()
+            if pending_write:
+                error, = await asyncio.gather(pending_write, return_exceptions=True)
+                if isinstance(error, Exception):
+                    logger.error(f"❌ Ошибка записи порции в Google Sheets: {error}")
+        meter.report()
+
+
+async def export_to_csv(db: Database, output: str, chunk_size: int):
+    """Выгрузка в CSV-файл"""
+    meter = ThroughputMeter()
+    with open(output, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(APPLICATION_HEADERS)
+        async with snapshot_session(db) as session:
+            async for rows in stream_rows(session, chunk_size):
+                writer.writerows(rows)
+                meter.add(len(rows))
+    meter.report()
+
+
+async def export_to_xlsx(db: Database, output: str, chunk_size: int):
+    """Выгрузка в XLSX-файл (openpyxl в режиме write_only)"""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        logger.error("❌ Для выгрузки в XLSX установите openpyxl: pip install openpyxl")
+        return
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Applications")
+    sheet.append(APPLICATION_HEADERS)
+
+    meter = ThroughputMeter()
+    async with snapshot_session(db) as session:
+        async for rows in stream_rows(session, chunk_size):
+            for row in rows:
+                sheet.append(row)
+            meter.add(len(rows))
+    workbook.save(output)
+    meter.report()
+
+
+async def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description="Полная выгрузка заявок из БД")
+    parser.add_argument("--target", choices=["sheets", "csv", "xlsx"], default="csv", help="Куда выгружать")
+    parser.add_argument("--output", help="Файл для CSV/XLSX (по умолчанию applications.<target>)")
+    parser.add_argument("--worksheet", default="APPLICATIONS_EXPORT", help="Лист Google Sheets для выгрузки")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Размер порции (строк)")
+    args = parser.parse_args()
+
+    config = load_config()
+    db = Database(config)
+    service = None
+    try:
+        if args.target == "sheets":
+            service = setup_google_sheets_service(config)
+            if not service:
+                logger.error("❌ Не удалось инициализировать Google Sheets сервис")
+                return
+            logger.info(f"🚀 Выгрузка заявок в лист {args.worksheet}...")
+            await export_to_sheets(db, service, args.worksheet, args.chunk_size)
+        else:
+            output = args.output or f"applications.{args.target}"
+            logger.info(f"🚀 Выгрузка заявок в {output}...")
+            if args.target == "csv":
+                await export_to_csv(db, output, args.chunk_size)
+            else:
+                await export_to_xlsx(db, output, args.chunk_size)
+    finally:
+        if service:
+            service.close()
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,22 +3,43 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.redis import RedisStorage, DefaultKeyBuilder
 from aiogram_dialog import setup_dialogs
 from redis.asyncio import Redis
 
 from config.config import load_config
 from database.db import Database
 from database.repositories import UserRepository
+from database.user_cache import setup_user_cache
+from database.username_buffer import setup_username_buffer
 from bot.handlers import router
 from bot.dialogs import start_dialog, menu_dialog, application_dialog, department_selection_dialog
-from bot.middlewares import LoggingMiddleware
+from bot.middlewares import LoggingMiddleware, DbSessionMiddleware, FsmCacheMiddleware
 from bot.keyboards.command_menu import set_main_menu
 from utils.logging_config import setup_logging, log_error, log_user_action
 from utils.google_services import setup_google_sheets_service
+from utils.sheets_export import setup_sheets_export_worker
+from utils.sheets_reconcile import setup_sheets_reconciler
+from utils.fsm_storage import setup_fsm_storage, CachedRedisStorage
+from utils.fsm_sweeper import setup_fsm_sweeper
+from utils.stats_reporter import setup_stats_reporter
+
+
+def log_warm_up_result(task: asyncio.Task):
+    """Записать в лог ошибку фонового прогрева Google Sheets, как только задача завершится"""
+    if not task.cancelled() and task.exception() is not None:
+        log_error(task.exception(), "Ошибка прогрева Google Sheets")
 
 
 async def main():
+    google_sheets_service = None
+    sheets_export_worker = None
+    sheets_reconciler = None
+    user_cache = None
+    username_buffer = None
+    storage = None
+    fsm_sweeper = None
+    warm_up_task = None
+    stats_reporter = None
     try:
         # Загружаем конфигурацию
         config = load_config()
@@ -28,6 +49,9 @@ async def main():
         logger.info("🚀 Запуск бота...")
         logger.info("⚙️ Конфигурация загружена")
         
+        # Метрики компонентов периодически пишутся в лог
+        stats_reporter = setup_stats_reporter(config)
+        
         # Создаем Redis хранилище для FSM
         if config.redis.password:
             redis_client = Redis.from_url(f"redis://:{config.redis.password}@{config.redis.host}:{config.redis.port}/0")
@@ -38,12 +62,12 @@ async def main():
         await redis_client.ping()
         logger.info(f"🔗 Подключение к Redis установлено: {config.redis.host}:{config.redis.port}")
         
-        storage = RedisStorage(
-            redis=redis_client,
-            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
-            state_ttl=86400*2,  # время жизни состояния в секунду (например, 1 день)
-            data_ttl=86400*2   # время жизни данных
-        )
+        storage = setup_fsm_storage(config, redis_client)
+        
+        # Периодически удаляем брошенные стеки и контексты диалогов
+        fsm_sweeper = setup_fsm_sweeper(config, redis_client)
+        if fsm_sweeper:
+            fsm_sweeper.start()
 
         # Создаем бота и диспетчер
         bot = Bot(
@@ -51,6 +75,9 @@ async def main():
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
         dp = Dispatcher(storage=storage)
+        if isinstance(storage, CachedRedisStorage):
+            # Версии кеша FSM проверяются один раз за апдейт, записи уходят в Redis пачкой в конце апдейта
+            dp.update.outer_middleware(FsmCacheMiddleware(storage))
         
         # Проверка подключения к боту
         bot_info = await bot.get_me()
@@ -58,6 +85,20 @@ async def main():
         
         # Создаем подключение к базе данных
         db = Database(config)
+        stats_reporter.add("🗄️ Пул соединений БД", db.get_pool_stats)
+        stats_reporter.add("⏱️ Запросы к БД", db.query_stats.get_stats)
+        # Доступна и в обработчике ошибок (черновики анкет при UnknownIntent)
+        dp["db"] = db
+        
+        # Кеш пользователей перед БД (опционально со вторым уровнем в Redis)
+        user_cache = setup_user_cache(config, redis=redis_client)
+        stats_reporter.add("👥 Кеш пользователей", user_cache.get_stats)
+        
+        # Смена username пишется в БД пачками в фоне, а не в обработчиках
+        username_buffer = setup_username_buffer(config, db)
+        if username_buffer:
+            username_buffer.start()
+            stats_reporter.add("✏️ Отложенная запись username", username_buffer.get_stats)
         
         # Настраиваем меню команд
         await set_main_menu(bot)
@@ -67,16 +108,31 @@ async def main():
         logger.info("🗄️ База данных инициализирована")
         
         # Настраиваем Google Sheets сервис
-        google_sheets_service = setup_google_sheets_service(config)
+        google_sheets_service = setup_google_sheets_service(config, redis=redis_client)
         if google_sheets_service:
             logger.info("📊 Google Sheets сервис настроен")
+            stats_reporter.add("📊 Запросы к Google Sheets", google_sheets_service.get_stats)
+            # Открываем таблицу и лист в фоне, чтобы не задерживать запуск
+            warm_up_task = asyncio.create_task(google_sheets_service.warm_up(), name="google_sheets_warm_up")
+            warm_up_task.add_done_callback(log_warm_up_result)
         else:
             logger.warning("⚠️ Google Sheets сервис не настроен")
         
-        # Создаем middleware для передачи конфигурации, БД и Google Sheets
+        # Запускаем фоновую выгрузку заявок из очереди в Google Sheets
+        sheets_export_worker = setup_sheets_export_worker(config, db, google_sheets_service)
+        if sheets_export_worker:
+            sheets_export_worker.start()
+        
+        # Периодически сверяем БД с таблицей и дозаписываем потерянные строки
+        sheets_reconciler = setup_sheets_reconciler(config, db, google_sheets_service)
+        if sheets_reconciler:
+            sheets_reconciler.start()
+        
+        # Создаем middleware для передачи конфигурации, БД, кеша пользователей и Google Sheets
         async def config_middleware(handler, event, data):
             data["config"] = config
             data["db"] = db
+            data["user_cache"] = user_cache
             data["google_sheets_service"] = google_sheets_service
             return await handler(event, data)
         
@@ -85,6 +141,10 @@ async def main():
         dp.callback_query.middleware(LoggingMiddleware())
         dp.message.middleware(config_middleware)
         dp.callback_query.middleware(config_middleware)
+        # Одна сессия БД на апдейт, коммит один раз в конце обработки
+        db_session_middleware = DbSessionMiddleware(db, user_cache=user_cache, username_buffer=username_buffer)
+        dp.message.middleware(db_session_middleware)
+        dp.callback_query.middleware(db_session_middleware)
         
         # Регистрируем роутеры и диалоги
         dp.include_router(router)
@@ -102,6 +162,7 @@ async def main():
         
         logger.info("🔧 Роутеры и диалоги настроены")
 
+        stats_reporter.start()
         logger.info("✅ Бот готов к работе")
         await dp.start_polling(bot)
         
@@ -110,7 +171,26 @@ async def main():
         raise 
     finally:
         try:
-            # Закрываем соединения
+            # Останавливаем фоновые задачи и закрываем соединения
+            if stats_reporter:
+                await stats_reporter.stop()
+            if fsm_sweeper:
+                await fsm_sweeper.stop()
+            if sheets_reconciler:
+                await sheets_reconciler.stop()
+            if sheets_export_worker:
+                await sheets_export_worker.stop()
+            if warm_up_task and not warm_up_task.done():
+                warm_up_task.cancel()
+                await asyncio.gather(warm_up_task, return_exceptions=True)
+            if google_sheets_service:
+                google_sheets_service.close()
+            if username_buffer:
+                await username_buffer.stop()
+            if stats_reporter:
+                stats_reporter.report()
+            if isinstance(storage, CachedRedisStorage):
+                logger.info(f"🗃️ Кеш FSM: {storage.get_stats()}")
             await db.close()
             await redis_client.aclose()
             await bot.session.close()
@@ -37,22 +37,23 @@ async def setup_sheets():
         logger.info("✅ Google Sheets сервис инициализирован")
         
         # Открываем таблицу
-        spreadsheet = google_sheets_service.gc.open_by_key(google_sheets_service.spreadsheet_id)
+        spreadsheet = await google_sheets_service.call(google_sheets_service.gc.open_by_key, google_sheets_service.spreadsheet_id)
         logger.info(f"📋 Открыта таблица: {google_sheets_service.spreadsheet_id}")
         
         # Получаем или создаем лист Applications
         worksheet_name = "Applications"
         try:
-            worksheet = spreadsheet.worksheet(worksheet_name)
+            worksheet = await google_sheets_service.call(spreadsheet.worksheet, worksheet_name)
             logger.info(f"✅ Лист {worksheet_name} найден")
             
             # Очищаем существующий лист
             logger.info("🧹 Очищаем существующий лист...")
-            worksheet.clear()
+            await google_sheets_service.call(worksheet.clear, quota="write")
             
         except Exception:
             logger.info(f"📄 Лист {worksheet_name} не найден, создаем новый...")
-            worksheet = spreadsheet.add_worksheet(title=worksheet_name, rows=1000, cols=20)
+            worksheet = await google_sheets_service.call(spreadsheet.add_worksheet, title=worksheet_name, rows=1000, cols=20,
+                                                         quota="write", idempotent=False)
         
         # Заголовки согласно нашей системе
         headers = [
@@ -79,7 +80,7 @@ async def setup_sheets():
         ]
         
         logger.info("📋 Добавляем заголовки...")
-        worksheet.append_row(headers)
+        await google_sheets_service.call(worksheet.append_row, headers, quota="write", idempotent=False)
         
         # Добавляем тестовые данные
         test_data = [
@@ -109,16 +110,16 @@ async def setup_sheets():
         
         logger.info("📝 Добавляем тестовые данные...")
         for i, row in enumerate(test_data, 1):
-            worksheet.append_row(row)
+            await google_sheets_service.call(worksheet.append_row, row, quota="write", idempotent=False)
             logger.info(f"✅ Добавлена тестовая запись {i}")
         
         # Форматируем заголовки (делаем их жирными)
         logger.info("🎨 Форматируем заголовки...")
         try:
-            worksheet.format('A1:T1', {
+            await google_sheets_service.call(worksheet.format, 'A1:T1', {
                 'textFormat': {'bold': True},
                 'backgroundColor': {'red': 0.9, 'green': 0.9, 'blue': 0.9}
-            })
+            }, quota="write")
             logger.info("✅ Заголовки отформатированы")
         except Exception as e:
             logger.warning(f"⚠️ Не удалось отформатировать заголовки: {e}")
@@ -144,7 +145,7 @@ async def setup_sheets():
                 }
             ]
             
-            spreadsheet.batch_update({'requests': requests})
+            await google_sheets_service.call(spreadsheet.batch_update, {'requests': requests}, quota="write")
             logger.info("✅ Ширина колонок настроена")
         except Exception as e:
             logger.warning(f"⚠️ Не удалось настроить ширину колонок: {e}")
@@ -0,0 +1,21 @@
+"""
+Продолжение анкеты из черновика при UnknownIntent
+
+Запуск из корня проекта:
+    python -m pytest -q tests
+"""
+
+from aiogram_dialog.utils import intent_callback_data
+
+from bot.dialogs.dialog_error_handler import is_application_callback
+
+
+def test_buttons_of_the_application_dialogs_resume_the_draft():
+    assert is_application_callback(intent_callback_data("abc", "course_radio:1_bachelor"))
+    assert is_application_callback(intent_callback_data("abc", "logistics_rating_radio:5"))
+
+
+def test_buttons_of_other_dialogs_do_not_resume_the_draft():
+    assert not is_application_callback(intent_callback_data("abc", "fill_application"))
+    assert not is_application_callback(intent_callback_data("abc", "to_menu"))
+    assert not is_application_callback(None)
@@ -0,0 +1,257 @@
+"""
+Время жизни ключей aiogram-dialog в хранилищах FSM
+
+Запуск из корня проекта:
+    python -m pytest -q tests
+"""
+
+import asyncio
+import itertools
+
+import pytest
+from aiogram import Dispatcher
+from aiogram.filters import CommandStart
+from aiogram.filters.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.redis import DefaultKeyBuilder
+from aiogram.types import Message
+from aiogram_dialog import Dialog, DialogManager, StartMode, Window, setup_dialogs
+from aiogram_dialog.api.entities import stack as dialog_stack
+from aiogram_dialog.test_tools import BotClient, MockMessageManager
+from aiogram_dialog.test_tools.keyboard import InlineButtonTextLocator
+from aiogram_dialog.widgets.kbd import Cancel, Start
+from aiogram_dialog.widgets.text import Const
+
+from bot.middlewares import FsmCacheMiddleware
+from utils.fsm_storage import (FsmSerializer, FsmTtlPolicy, CompactRedisStorage, CachedRedisStorage,
+                               FsmConflictError)
+
+IDLE_TTL = 6 * 3600
+IN_PROGRESS_TTL = 2 * 86400
+
+
+class RootSG(StatesGroup):
+    main = State()
+
+
+class FormSG(StatesGroup):
+    first = State()
+
+
+class FakeRedis:
+    """Ключи и их время жизни в памяти, время двигается вручную"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.values = {}
+        self.expires_at = {}
+
+    def advance(self, seconds: float):
+        self.now += seconds
+        for key, expires_at in list(self.expires_at.items()):
+            if expires_at <= self.now:
+                self.values.pop(key, None)
+                self.expires_at.pop(key, None)
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value if isinstance(value, bytes) else str(value).encode()
+        if ex:
+            self.expires_at[key] = self.now + ex
+        else:
+            self.expires_at.pop(key, None)
+        return True
+
+    async def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            deleted += self.values.pop(key, None) is not None
+            self.expires_at.pop(key, None)
+        return deleted
+
+    async def expire(self, key, seconds):
+        if key not in self.values:
+            return False
+        self.expires_at[key] = self.now + seconds
+        return True
+
+    async def incr(self, key):
+        value = int(self.values.get(key, b"0")) + 1
+        self.values[key] = str(value).encode()
+        return value
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        # Скрипты CachedRedisStorage, повторенные на Python
+        run = self._flush if "INCR" in script else self._check_version
+
+        async def call(keys, args, client=None):
+            if isinstance(client, FakePipeline):
+                client.commands.append((run, (keys, args), {}))
+                return client
+            return await run(keys, args)
+        return call
+
+    async def _check_version(self, keys, args):
+        version = self.values.get(keys[0], b"0")
+        if version == str(args[0]).encode():
+            return [version]
+        return [version, *(self.values.get(key) for key in keys[1:])]
+
+    async def _flush(self, keys, args):
+        version = self.values.get(keys[0], b"0")
+        if args[0] != "" and version != str(args[0]).encode():
+            return [0, int(version)]
+        for index, key in enumerate(keys[1:]):
+            op, value, ttl = args[2 + 3 * index:5 + 3 * index]
+            if op == "set":
+                await self.set(key, value, ex=ttl or None)
+            elif op == "del":
+                await self.delete(key)
+            else:
+                await self.expire(key, ttl)
+        new_version = await self.incr(keys[0])
+        if args[1] != "":
+            await self.expire(keys[0], args[1])
+        return [1, new_version]
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append((getattr(self.redis, name), args, kwargs))
+            return self
+        return command
+
+    async def execute(self, raise_on_error=True):
+        return [await run(*args, **kwargs) for run, args, kwargs in self.commands]
+
+
+async def start(message: Message, dialog_manager: DialogManager):
+    await dialog_manager.start(RootSG.main, mode=StartMode.RESET_STACK)
+
+
+def make_dispatcher(storage: CompactRedisStorage) -> Dispatcher:
+    dp = Dispatcher(storage=storage)
+    if isinstance(storage, CachedRedisStorage):
+        dp.update.outer_middleware(FsmCacheMiddleware(storage))
+    dp.message.register(start, CommandStart())
+    dp.include_router(Dialog(
+        Window(Const("Меню"), Start(Const("Анкета"), id="form", state=FormSG.first), state=RootSG.main),
+    ))
+    dp.include_router(Dialog(
+        Window(Const("Анкета"), Cancel(Const("Отмена")), state=FormSG.first),
+    ))
+    return dp
+
+
+@pytest.fixture(autouse=True)
+def unique_intent_ids(monkeypatch):
+    # id диалога в aiogram-dialog - текущая секунда и случайное число до 100:
+    # два диалога, открытые за одну секунду, совпадают в 1% запусков
+    counter = itertools.count(1)
+    monkeypatch.setattr(dialog_stack, "new_id", lambda: dialog_stack.id_to_str(next(counter)))
+
+
+@pytest.mark.parametrize("storage_class", [CompactRedisStorage, CachedRedisStorage])
+def test_form_over_idle_aged_root_context_can_be_cancelled(storage_class):
+    async def scenario():
+        redis = FakeRedis()
+        storage = storage_class(
+            redis=redis,
+            serializer=FsmSerializer(),
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+            ttl_policy=FsmTtlPolicy(idle_ttl=IDLE_TTL, in_progress_ttl=IN_PROGRESS_TTL,
+                                    in_progress_groups=("FormSG",)),
+        )
+        dp = make_dispatcher(storage)
+        message_manager = MockMessageManager()
+        setup_dialogs(dp, message_manager=message_manager)
+        client = BotClient(dp)
+
+        await client.send("/start")
+        await client.click(message_manager.last_message(), InlineButtonTextLocator("Анкета"))
+        form_message = message_manager.last_message()
+        assert form_message.text == "Анкета"
+
+        # Контекст меню под анкетой не перезаписывался дольше idle_ttl
+        redis.advance(IDLE_TTL + 60)
+        if isinstance(storage, CachedRedisStorage):
+            # Другой процесс бота: в кеше ничего нет
+            storage._local.clear()
+
+        message_manager.reset_history()
+        await client.click(form_message, InlineButtonTextLocator("Отмена"))
+        assert message_manager.last_message().text == "Меню"
+
+    asyncio.run(scenario())
+
+
+def test_stale_update_does_not_overwrite_newer_write_of_another_process():
+    async def scenario():
+        redis = FakeRedis()
+        first, second = (
+            CachedRedisStorage(redis=redis, serializer=FsmSerializer(),
+                               key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True))
+            for _ in range(2)
+        )
+        key = StorageKey(bot_id=1, chat_id=1, user_id=1, destiny="aiogd:context:abc")
+        await first.set_data(key, {"step": 1})
+
+        first.begin_update()
+        assert await first.get_data(key) == {"step": 1}
+        # Пока апдейт первого процесса не записан, чат меняет второй
+        await second.set_data(key, {"step": 2})
+        await first.set_data(key, {"step": 1, "answer": "old"})
+        with pytest.raises(FsmConflictError):
+            await first.flush_update()
+        first.end_update()
+
+        assert first.conflicts == 1
+        assert await first.get_data(key) == {"step": 2}
+
+    asyncio.run(scenario())
+
+
+def test_update_is_rebased_when_another_process_changed_other_keys_of_the_chat():
+    async def scenario():
+        redis = FakeRedis()
+        first, second = (
+            CachedRedisStorage(redis=redis, serializer=FsmSerializer(),
+                               key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True))
+            for _ in range(2)
+        )
+        context = StorageKey(bot_id=1, chat_id=1, user_id=1, destiny="aiogd:context:abc")
+        state = StorageKey(bot_id=1, chat_id=1, user_id=1)
+        await first.set_data(context, {"step": 1})
+
+        first.begin_update()
+        assert await first.get_data(context) == {"step": 1}
+        # Другой процесс меняет другой ключ того же чата
+        await second.set_state(state, "MenuSG:main")
+        await first.set_data(context, {"step": 2})
+        await first.flush_update()
+        first.end_update()
+
+        assert (first.rebases, first.conflicts) == (1, 0)
+        assert await second.get_data(context) == {"step": 2}
+        assert await first.get_state(state) == "MenuSG:main"
+
+    asyncio.run(scenario())
@@ -0,0 +1,116 @@
+"""
+Очистка брошенных ключей aiogram-dialog на поддельном Redis
+
+Запуск из корня проекта:
+    python -m pytest -q tests
+"""
+
+import asyncio
+import fnmatch
+
+from redis.exceptions import ResponseError
+
+from utils.fsm_storage import FsmSerializer
+from utils.fsm_sweeper import FsmSweeper
+
+SCOPE = "fsm:1:100:100:default"
+STACK = f"{SCOPE}:aiogd:stack::data"
+MENU = f"{SCOPE}:aiogd:context:menu:data"
+ORPHAN = f"{SCOPE}:aiogd:context:orphan:data"
+VERSION = "fsm_version:1:100"
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    async def execute(self, raise_on_error=True):
+        return [getattr(self.redis, name)(*args) for name, args in self.commands]
+
+
+class FakeRedis:
+    """Хранит значения, TTL и простой ключей; lfu - OBJECT IDLETIME отвечает ошибкой"""
+
+    def __init__(self, values: dict, idle: int, ttl: int, lfu: bool = False):
+        self.values = dict(values)
+        self.idle = idle
+        self.ttls = {key: ttl for key in values}
+        self.lfu = lfu
+
+    async def scan_iter(self, match: str, count: int):
+        for key in list(self.values):
+            if fnmatch.fnmatchcase(key, match):
+                yield key.encode()
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+    async def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def memory_usage(self, key):
+        return len(self.values[key])
+
+    def object(self, subcommand, key):
+        if self.lfu:
+            return ResponseError("An LFU maxmemory policy is selected, idle time not tracked.")
+        return self.idle
+
+    def ttl(self, key):
+        return self.ttls.get(key, -2)
+
+    def delete(self, *keys):
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1).encode()
+        return int(self.values[key])
+
+    def expire(self, key, ttl):
+        self.ttls[key] = ttl
+        return True
+
+
+def make_redis(**kwargs) -> FakeRedis:
+    serializer = FsmSerializer()
+    return FakeRedis({
+        STACK: serializer.dumps({"intents": ["menu"]}),
+        MENU: serializer.dumps({"state": "MainMenuSG:main"}),
+        ORPHAN: serializer.dumps({"state": "ApplicationSG:full_name"}),
+        VERSION: b"5",
+    }, **kwargs)
+
+
+def test_orphan_of_a_live_chat_is_evicted_without_bumping_the_version():
+    redis = make_redis(idle=7200, ttl=3600)
+    report = asyncio.run(FsmSweeper(redis, min_idle=3600).run_once(evict=True))
+
+    assert report["evicted"] == 1
+    assert ORPHAN not in redis.values and MENU in redis.values
+    assert redis.values[VERSION] == b"5"
+
+
+def test_lfu_policy_estimates_idle_time_from_ttl():
+    redis = make_redis(idle=0, ttl=3600, lfu=True)
+    report = asyncio.run(FsmSweeper(redis, min_idle=3600, min_key_ttl=21600).run_once(evict=True))
+
+    assert report["evicted"] == 1
+    assert ORPHAN not in redis.values
+
+
+def test_lfu_policy_without_key_ttl_evicts_nothing():
+    redis = make_redis(idle=0, ttl=3600, lfu=True)
+    report = asyncio.run(FsmSweeper(redis, min_idle=3600).run_once(evict=True))
+
+    assert "evicted" not in report
+    assert ORPHAN in redis.values
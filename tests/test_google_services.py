@@ -0,0 +1,53 @@
+"""
+Запись заявок в Google Sheets на локальном эмуляторе
+
+Запуск из корня проекта:
+    python -m pytest -q tests
+"""
+
+import asyncio
+import itertools
+
+from utils.google_services import GoogleSheetsService, APPLICATION_HEADERS, LAST_COLUMN, USER_ID_COLUMN
+from utils.sheets_backends import InMemorySheetsClient
+
+EMAIL_COLUMN = APPLICATION_HEADERS.index('Email')
+
+_credentials = (f"test-google-services-{number}" for number in itertools.count())
+
+
+def make_service() -> GoogleSheetsService:
+    client = InMemorySheetsClient(latency=0, latency_jitter=0, read_requests_per_minute=0,
+                                  write_requests_per_minute=0)
+    return GoogleSheetsService(credentials_path=next(_credentials), spreadsheet_id="test",
+                               write_batch_delay=0.01, client=client)
+
+
+def make_application(telegram_id: int, email: str) -> dict:
+    return {'telegram_id': telegram_id, 'telegram_username': f"user{telegram_id}", 'full_name': "Тестов Тест",
+            'email': email, 'created_at': "2026-01-01T00:00:00", 'updated_at': "2026-01-01T00:00:00"}
+
+
+def test_update_after_manual_sort_writes_the_applicant_row():
+    async def scenario():
+        service = make_service()
+        try:
+            worksheet = await service._get_worksheet()
+            worksheet.update([APPLICATION_HEADERS], f"A1:{LAST_COLUMN}1")
+            for telegram_id in (1, 2, 3):
+                assert await service.add_application_to_sheet(make_application(telegram_id, f"old{telegram_id}@spbu.ru"))
+
+            # Администратор отсортировал лист по убыванию User ID
+            header, *rows = worksheet.get_all_values()
+            worksheet.update([header, *reversed(rows)], "A1")
+
+            assert await service.add_application_to_sheet(make_application(1, "new1@spbu.ru"))
+            values = worksheet.get_all_values()
+        finally:
+            service.close()
+
+        emails = {row[USER_ID_COLUMN - 1]: row[EMAIL_COLUMN] for row in values[1:]}
+        assert emails == {"1": "new1@spbu.ru", "2": "old2@spbu.ru", "3": "old3@spbu.ru"}
+        assert len(values) == 4
+
+    asyncio.run(scenario())
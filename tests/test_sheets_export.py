@@ -0,0 +1,177 @@
+"""
+Воркер выгрузки заявок из outbox в Google Sheets на локальном эмуляторе
+
+Очередь outbox заменена словарем в памяти: проверяется, какой результат воркер
+записывает для каждой записи и что запросы к Google идут без открытой сессии БД.
+
+Запуск из корня проекта:
+    python -m pytest -q tests
+"""
+
+import asyncio
+import itertools
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from database.models import Application, User
+from utils import sheets_export
+from utils.google_services import GoogleSheetsService, CircuitBreaker, USER_ID_COLUMN
+from utils.sheets_backends import InMemorySheetsClient
+from utils.sheets_export import SheetsExportWorker
+
+MAX_ATTEMPTS = 3
+
+# Лимитеры квот общие для сервисов с одними учетными данными - у каждого теста свои
+_credentials = (f"test-sheets-export-{number}" for number in itertools.count())
+
+
+class FakeDatabase:
+    """Сессии считают, сколько их открыто прямо сейчас"""
+
+    def __init__(self):
+        self.entries = {}
+        self.open_sessions = 0
+
+    async def get_session(self):
+        self.open_sessions += 1
+        return FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    async def commit(self):
+        pass
+
+    async def close(self):
+        self.db.open_sessions -= 1
+
+
+class FakeOutboxRepository:
+    """SheetsExportOutboxRepository поверх словаря записей FakeDatabase"""
+
+    def __init__(self, session: FakeSession):
+        self.entries = session.db.entries
+
+    async def claim_pending(self, limit, lease_seconds):
+        claimed = [entry for entry in self.entries.values() if entry.status == "pending"][:limit]
+        for entry in claimed:
+            entry.status = "leased"
+        return [SimpleNamespace(id=entry.id, attempts=entry.attempts, application=entry.application)
+                for entry in claimed]
+
+    async def mark_exported(self, entry_ids):
+        for entry_id in entry_ids:
+            self.entries[entry_id].status = "exported"
+
+    async def schedule_retry(self, entry_id, error, delay_seconds):
+        entry = self.entries[entry_id]
+        entry.status, entry.attempts, entry.last_error = "retry", entry.attempts + 1, error
+
+    async def mark_failed(self, entry_id, error):
+        entry = self.entries[entry_id]
+        entry.status, entry.attempts, entry.last_error = "failed", entry.attempts + 1, error
+
+    async def defer(self, entry_ids, delay_seconds):
+        for entry_id in entry_ids:
+            self.entries[entry_id].status = "deferred"
+
+
+@pytest.fixture(autouse=True)
+def fake_outbox_repository(monkeypatch):
+    monkeypatch.setattr(sheets_export, "SheetsExportOutboxRepository", FakeOutboxRepository)
+
+
+def add_entry(db: FakeDatabase, telegram_id: int, attempts: int = 0):
+    now = datetime.now()
+    application = Application(
+        id=telegram_id, full_name=f"Тестов Тест {telegram_id}", first_name="Тест", last_name="Тестов",
+        course="2", email=f"user{telegram_id}@example.com", phone="+79990000000",
+        personal_qualities="Ответственность", motivation="Хочу помогать",
+        logistics_rating=5, marketing_rating=4, pr_rating=3, program_rating=2, partners_rating=1,
+        created_at=now, updated_at=now,
+        user=User(telegram_id=telegram_id, telegram_username=f"user{telegram_id}"),
+    )
+    db.entries[telegram_id] = SimpleNamespace(id=telegram_id, attempts=attempts, application=application,
+                                              status="pending", last_error=None)
+
+
+def make_worker(db: FakeDatabase, error_rate: float = 0.0, breaker_failure_threshold: int = 5):
+    client = InMemorySheetsClient(latency=0, latency_jitter=0, read_requests_per_minute=0,
+                                  write_requests_per_minute=0, error_rate=error_rate)
+    service = GoogleSheetsService(
+        credentials_path=next(_credentials), spreadsheet_id="test", write_batch_delay=0.01,
+        max_retries=0, breaker_failure_threshold=breaker_failure_threshold, client=client,
+    )
+    return SheetsExportWorker(db=db, google_sheets_service=service, max_attempts=MAX_ATTEMPTS)
+
+
+def test_exported_entries_are_written_without_an_open_session():
+    async def scenario():
+        db = FakeDatabase()
+        add_entry(db, 101)
+        add_entry(db, 102)
+        worker = make_worker(db)
+        service = worker.google_sheets_service
+
+        sessions_during_write = []
+        upsert_rows = service.upsert_rows
+
+        async def tracked_upsert_rows(rows):
+            sessions_during_write.append(db.open_sessions)
+            return await upsert_rows(rows)
+        service.upsert_rows = tracked_upsert_rows
+
+        try:
+            assert await worker.process_batch() == 2
+            worksheet = await service._get_worksheet()
+            user_ids = worksheet.col_values(USER_ID_COLUMN)
+        finally:
+            service.close()
+
+        assert [entry.status for entry in db.entries.values()] == ["exported", "exported"]
+        assert sessions_during_write == [0]
+        assert db.open_sessions == 0
+        assert sorted(user_ids) == ["101", "102"]
+
+    asyncio.run(scenario())
+
+
+def test_failed_export_is_retried_until_max_attempts():
+    async def scenario():
+        db = FakeDatabase()
+        add_entry(db, 101)
+        add_entry(db, 102, attempts=MAX_ATTEMPTS - 1)
+        worker = make_worker(db, error_rate=1.0)
+        try:
+            assert await worker.process_batch() == 2
+        finally:
+            worker.google_sheets_service.close()
+
+        assert worker.google_sheets_service.breaker.state == CircuitBreaker.CLOSED
+        retried, failed = db.entries[101], db.entries[102]
+        assert (retried.status, retried.attempts) == ("retry", 1)
+        assert (failed.status, failed.attempts) == ("failed", MAX_ATTEMPTS)
+        assert failed.last_error
+
+    asyncio.run(scenario())
+
+
+def test_export_is_deferred_without_an_attempt_while_google_is_unavailable():
+    async def scenario():
+        db = FakeDatabase()
+        add_entry(db, 101, attempts=MAX_ATTEMPTS - 1)
+        worker = make_worker(db, error_rate=1.0, breaker_failure_threshold=1)
+        try:
+            assert await worker.process_batch() == 1
+        finally:
+            worker.google_sheets_service.close()
+
+        assert worker.google_sheets_service.breaker.state == CircuitBreaker.OPEN
+        entry = db.entries[101]
+        assert (entry.status, entry.attempts) == ("deferred", MAX_ATTEMPTS - 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,43 @@
+"""
+Запись в кеш пользователей после коммита транзакции
+
+Запуск из корня проекта:
+    python -m pytest -q tests
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from database.user_cache import UserCache, UserSnapshot
+
+OLD = UserSnapshot(id=1, telegram_id=100, telegram_username="user", stage1_submitted="not_submitted")
+NEW = UserSnapshot(id=1, telegram_id=100, telegram_username="user", stage1_submitted="submitted")
+
+
+def run_transaction(cache: UserCache, commit: bool):
+    async def scenario():
+        await cache.set(OLD)
+        with Session(create_engine("sqlite://")) as session:
+            # set_after_commit нужна только sync_session от AsyncSession
+            cache.set_after_commit(SimpleNamespace(sync_session=session), NEW)
+            session.begin()
+            # Параллельный апдейт прочитал из БД старый статус до коммита
+            await cache.set(OLD)
+            if commit:
+                session.commit()
+            else:
+                session.rollback()
+        return await cache.get(OLD.telegram_id)
+
+    return asyncio.run(scenario())
+
+
+def test_new_status_replaces_a_stale_entry_after_commit():
+    assert run_transaction(UserCache(), commit=True) == NEW
+
+
+def test_rolled_back_status_is_not_cached():
+    assert run_transaction(UserCache(), commit=False) == OLD
@@ -0,0 +1,694 @@
+import asyncio
+import json
+import logging
+import zlib
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Mapping, Optional, cast
+from weakref import WeakKeyDictionary, WeakValueDictionary
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import StorageKey, StateType
+from aiogram.fsm.storage.redis import RedisStorage, DefaultKeyBuilder, KeyBuilder
+from cachetools import TTLCache
+from redis.asyncio import Redis
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Первый байт значения: младшие 4 бита - формат, старшие - сжатие.
+# Значения, записанные стандартным RedisStorage, начинаются с "{" и читаются как JSON.
+FORMAT_JSON = 0x01
+FORMAT_ORJSON = 0x02
+FORMAT_MSGPACK = 0x03
+COMPRESSION_NONE = 0x00
+COMPRESSION_ZLIB = 0x10
+COMPRESSION_ZSTD = 0x20
+
+FORMATS = {"json": FORMAT_JSON, "orjson": FORMAT_ORJSON, "msgpack": FORMAT_MSGPACK}
+COMPRESSIONS = {"none": COMPRESSION_NONE, "zlib": COMPRESSION_ZLIB, "zstd": COMPRESSION_ZSTD}
+
+# Начало destiny ключей aiogram-dialog
+CONTEXT_DESTINY = "aiogd:context:"
+STACK_DESTINY = "aiogd:stack:"
+
+# Сколько раз переносить изменения апдейта на новую версию чата, если ее сдвинул другой процесс
+FLUSH_RETRIES = 3
+
+
+class FsmConflictError(Exception):
+    """Изменения FSM не записаны: те же ключи чата уже изменил другой процесс бота"""
+
+
+def _json_dumps(data: Mapping[str, Any]) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_dumps(data: Mapping[str, Any]) -> bytes:
+    return orjson.dumps(data)
+
+
+def _msgpack_dumps(data: Mapping[str, Any]) -> bytes:
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def _msgpack_loads(raw: bytes) -> Any:
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+_DUMPS: Dict[int, Callable[[Mapping[str, Any]], bytes]] = {
+    FORMAT_JSON: _json_dumps,
+    FORMAT_ORJSON: _orjson_dumps,
+    FORMAT_MSGPACK: _msgpack_dumps,
+}
+_LOADS: Dict[int, Callable[[bytes], Any]] = {
+    FORMAT_JSON: json.loads,
+    # orjson пишет обычный JSON, поэтому читается и без orjson
+    FORMAT_ORJSON: orjson.loads if orjson is not None else json.loads,
+    FORMAT_MSGPACK: _msgpack_loads,
+}
+
+
+def available_formats() -> list[str]:
+    """Форматы, библиотеки для которых установлены"""
+    return [name for name, fmt in FORMATS.items()
+            if not (fmt == FORMAT_ORJSON and orjson is None or fmt == FORMAT_MSGPACK and msgpack is None)]
+
+
+def available_compressions() -> list[str]:
+    """Алгоритмы сжатия, библиотеки для которых установлены"""
+    return [name for name in COMPRESSIONS if not (name == "zstd" and zstandard is None)]
+
+
+class FsmSerializer:
+    """
+    Сериализация данных FSM и aiogram-dialog с заголовком формата
+
+    Пишет выбранным форматом, большие значения сжимает, а читает любой формат из заголовка,
+    включая JSON без заголовка от стандартного RedisStorage. Поэтому формат можно менять
+    на работающем боте: старые ключи читаются и перезаписываются новым форматом при изменении.
+    """
+
+    def __init__(self, fmt: str = "json", compression: str = "none",
+                 compress_threshold: int = 1024, compression_level: int = 3):
+        """
+        Args:
+            fmt: Формат данных: json, orjson или msgpack
+            compression: Сжатие больших значений: none, zlib или zstd
+            compress_threshold: Сжимать значения не меньше этого размера (байты)
+            compression_level: Уровень сжатия
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Неизвестный формат FSM: {fmt} (доступны: {', '.join(FORMATS)})")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Неизвестное сжатие FSM: {compression} (доступны: {', '.join(COMPRESSIONS)})")
+        if fmt not in available_formats():
+            logger.warning(f"⚠️ Формат FSM {fmt} недоступен (библиотека не установлена), используется json")
+            fmt = "json"
+        if compression not in available_compressions():
+            logger.warning(f"⚠️ Сжатие FSM {compression} недоступно (библиотека не установлена), используется zlib")
+            compression = "zlib"
+
+        self.fmt = fmt
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        self.compression_level = compression_level
+
+        self._format_id = FORMATS[fmt]
+        self._dumps = _DUMPS[self._format_id]
+        self._compression_id = COMPRESSIONS[compression]
+        self._zstd_compressor = zstandard.ZstdCompressor(level=compression_level) if compression == "zstd" else None
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+    def dumps(self, data: Mapping[str, Any]) -> bytes:
+        payload = self._dumps(data)
+        if self._compression_id != COMPRESSION_NONE and len(payload) >= self.compress_threshold:
+            if self._compression_id == COMPRESSION_ZSTD:
+                payload = self._zstd_compressor.compress(payload)
+            else:
+                payload = zlib.compress(payload, self.compression_level)
+            return bytes((self._format_id | self._compression_id,)) + payload
+        if self._format_id == FORMAT_JSON:
+            # Несжатый JSON пишем без заголовка - его читает и стандартный RedisStorage
+            return payload
+        return bytes((self._format_id,)) + payload
+
+    def loads(self, raw: bytes) -> Dict[str, Any]:
+        header = raw[0]
+        if header == ord("{"):
+            return json.loads(raw)
+
+        payload = raw[1:]
+        compression = header & 0xF0
+        if compression == COMPRESSION_ZSTD:
+            if self._zstd_decompressor is None:
+                raise RuntimeError("Данные FSM сжаты zstd, но пакет zstandard не установлен")
+            payload = self._zstd_decompressor.decompress(payload)
+        elif compression == COMPRESSION_ZLIB:
+            payload = zlib.decompress(payload)
+
+        loads = _LOADS.get(header & 0x0F)
+        if loads is None:
+            raise ValueError(f"Неизвестный заголовок данных FSM: {header:#04x}")
+        return loads(payload)
+
+
+@dataclass(frozen=True)
+class FsmTtlPolicy:
+    """
+    Время жизни ключей FSM по типу записи
+
+    Контексты диалогов из in_progress_groups (незаконченная анкета) и стеки с открытым
+    поверх корневого диалогом живут in_progress_ttl, все остальное (меню, завершенные
+    и брошенные диалоги, состояние FSM) - idle_ttl. TTL продлевается при каждой записи.
+    Контексты всех диалогов такого стека, в том числе меню под анкетой, которое не
+    перезаписывается, пока открыта анкета, продлеваются до in_progress_ttl при записи стека:
+    иначе "Отмена" в анкете не найдет истекший контекст меню.
+    """
+    idle_ttl: int = 6 * 3600
+    in_progress_ttl: int = 2 * 86400
+    in_progress_groups: tuple[str, ...] = ("ApplicationSG", "DepartmentSelectionSG")
+
+    @property
+    def max_ttl(self) -> int:
+        return max(self.idle_ttl, self.in_progress_ttl)
+
+    def data_ttl(self, key: StorageKey, data: Mapping[str, Any]) -> int:
+        if key.destiny.startswith(CONTEXT_DESTINY):
+            group = str(data.get("state", "")).partition(":")[0]
+            return self.in_progress_ttl if group in self.in_progress_groups else self.idle_ttl
+        if key.destiny.startswith(STACK_DESTINY):
+            # В стеке больше одного диалога - поверх меню открыта анкета или ее поддиалог
+            return self.in_progress_ttl if len(data.get("intents") or ()) > 1 else self.idle_ttl
+        return self.idle_ttl
+
+    def stack_context_keys(self, key: StorageKey, data: Mapping[str, Any]) -> list[StorageKey]:
+        """Контексты диалогов стека, которые живут in_progress_ttl вместе с ним"""
+        if not key.destiny.startswith(STACK_DESTINY):
+            return []
+        intents = data.get("intents") or ()
+        if len(intents) <= 1:
+            return []
+        return [replace(key, destiny=f"{CONTEXT_DESTINY}{intent_id}") for intent_id in intents]
+
+
+class CompactRedisStorage(RedisStorage):
+    """RedisStorage, хранящий данные FSM и контексты диалогов через FsmSerializer"""
+
+    def __init__(self, redis: Redis, serializer: FsmSerializer, key_builder: Optional[KeyBuilder] = None,
+                 state_ttl: Optional[int] = None, data_ttl: Optional[int] = None,
+                 ttl_policy: Optional[FsmTtlPolicy] = None):
+        """
+        Args:
+            ttl_policy: Время жизни по типу записи; без нее - state_ttl и data_ttl для всех ключей
+        """
+        if ttl_policy is not None:
+            state_ttl = data_ttl = ttl_policy.idle_ttl
+        super().__init__(redis=redis, key_builder=key_builder, state_ttl=state_ttl, data_ttl=data_ttl)
+        self.serializer = serializer
+        self.ttl_policy = ttl_policy
+
+    def _data_ttl(self, key: StorageKey, data: Mapping[str, Any]) -> Optional[int]:
+        if self.ttl_policy is None:
+            return self.data_ttl
+        return self.ttl_policy.data_ttl(key, data)
+
+    def _touched_keys(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, int]:
+        """Ключи Redis, время жизни которых продлевается вместе с записью key -> TTL"""
+        if self.ttl_policy is None:
+            return {}
+        return {
+            self.key_builder.build(context_key, "data"): self.ttl_policy.in_progress_ttl
+            for context_key in self.ttl_policy.stack_context_keys(key, data)
+        }
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            # Та же ошибка, что и у RedisStorage
+            return await super().set_data(key, data)
+
+        redis_key = self.key_builder.build(key, "data")
+        if not data:
+            await self.redis.delete(redis_key)
+            return
+        touched = self._touched_keys(key, data)
+        if not touched:
+            await self.redis.set(redis_key, self.serializer.dumps(data), ex=self._data_ttl(key, data))
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(redis_key, self.serializer.dumps(data), ex=self._data_ttl(key, data))
+            for touched_key, ttl in touched.items():
+                pipe.expire(touched_key, ttl)
+            await pipe.execute()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        redis_key = self.key_builder.build(key, "data")
+        value = await self.redis.get(redis_key)
+        if value is None:
+            return {}
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        return self.serializer.loads(value)
+
+
+# Версия чата и, если она не совпала с ожидаемой, все переданные ключи - за один запрос
+_CHECK_VERSION_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+if version == ARGV[1] then
+    return {version}
+end
+local result = {version}
+for i = 2, #KEYS do
+    result[i] = redis.call('GET', KEYS[i])
+end
+return result
+"""
+
+
+# Запись ключей чата и увеличение версии, только если версия не изменилась с момента чтения.
+# KEYS[1] - версия чата, KEYS[2..] - ключи. ARGV[1] - ожидаемая версия ('' - не проверять),
+# ARGV[2] - TTL версии ('' - без TTL), дальше по три аргумента на ключ: set/del/expire, значение, TTL.
+# Возвращает {1, новая версия} или {0, текущая версия}, если чат изменил другой процесс.
+_FLUSH_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+if ARGV[1] ~= '' and version ~= ARGV[1] then
+    return {0, tonumber(version)}
+end
+for i = 2, #KEYS do
+    local base = 3 * (i - 1)
+    local op, value, ttl = ARGV[base], ARGV[base + 1], ARGV[base + 2]
+    if op == 'set' then
+        if ttl == '' then
+            redis.call('SET', KEYS[i], value)
+        else
+            redis.call('SET', KEYS[i], value, 'EX', ttl)
+        end
+    elseif op == 'del' then
+        redis.call('DEL', KEYS[i])
+    else
+        redis.call('EXPIRE', KEYS[i], ttl)
+    end
+end
+local new_version = redis.call('INCR', KEYS[1])
+if ARGV[2] ~= '' then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return {1, new_version}
+"""
+
+
+@dataclass
+class _CachedChat:
+    """Значения ключей чата в кеше процесса на момент версии version"""
+    version: Optional[int]
+    values: Dict[str, Optional[bytes]] = field(default_factory=dict)
+    # Измененные в апдейте и еще не записанные в Redis ключи -> TTL
+    dirty: Dict[str, Optional[int]] = field(default_factory=dict)
+    # Измененные ключи -> значение в Redis, которое видел процесс до изменения
+    base: Dict[str, Optional[bytes]] = field(default_factory=dict)
+    # Ключи, время жизни которых нужно продлить при записи -> TTL
+    touched: Dict[str, int] = field(default_factory=dict)
+
+
+class CachedRedisStorage(CompactRedisStorage):
+    """
+    CompactRedisStorage с кешем процесса перед Redis и пакетной записью
+
+    У каждого чата в Redis есть счетчик версий, который увеличивается в одной транзакции
+    с каждой записью состояния, данных, стека или контекста диалога. Значение из кеша
+    отдается, только если его версия совпадает с версией в Redis, поэтому запись
+    из другого процесса бота сбрасывает кеш этого чата.
+
+    В пределах апдейта (FsmCacheMiddleware):
+    - версия чата проверяется один раз, вместе с перечитыванием всех известных ключей чата,
+      если версия изменилась, - одним запросом;
+    - записи копятся в кеше и уходят в Redis одним скриптом в конце апдейта.
+    Вне апдейта (фоновые задачи) каждая запись сразу отправляется в Redis. Задачи, которые
+    работают с хранилищем в обход диспетчера, должны сами вызывать end_update между апдейтами.
+
+    Конец апдейта наступает уже после снятия блокировки событий чата aiogram-dialog,
+    поэтому записи соседних апдейтов одного чата упорядочены блокировкой чата в процессе,
+    а скрипт записи принимает изменения, только если версия чата в Redis не сдвинулась
+    с момента чтения. Если сдвинулась, но другой процесс не трогал ключи, измененные
+    в апдейте, изменения переносятся на новую версию и записываются повторно. Если те же
+    ключи изменены и там, запись отклоняется с FsmConflictError, а кеш чата сбрасывается:
+    снимок апдейта устарел, Redis уже хранит более новые данные другого процесса.
+    """
+
+    def __init__(self, redis: Redis, serializer: FsmSerializer, key_builder: Optional[KeyBuilder] = None,
+                 state_ttl: Optional[int] = None, data_ttl: Optional[int] = None,
+                 ttl_policy: Optional[FsmTtlPolicy] = None, cache_size: int = 10000, cache_ttl: float = 300.0):
+        """
+        Args:
+            cache_size: Максимум чатов в кеше процесса
+            cache_ttl: Время жизни чата в кеше процесса (секунды)
+        """
+        super().__init__(redis=redis, serializer=serializer, key_builder=key_builder,
+                         state_ttl=state_ttl, data_ttl=data_ttl, ttl_policy=ttl_policy)
+        self._local: TTLCache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # Чаты с незаписанными изменениями не должны вытесняться из кеша до записи
+        self._dirty_chats: Dict[str, _CachedChat] = {}
+        # Счетчик версий живет не меньше самих ключей: иначе после его истечения
+        # версии начнутся заново и совпадут с устаревшими записями кеша
+        if ttl_policy is not None:
+            self.version_ttl = ttl_policy.max_ttl
+        else:
+            self.version_ttl = max(state_ttl, data_ttl) if state_ttl and data_ttl else None
+        self._check_version = redis.register_script(_CHECK_VERSION_SCRIPT)
+        self._flush_script = redis.register_script(_FLUSH_SCRIPT)
+        # Чат -> блокировка записи; живет, пока ее кто-то держит или ждет
+        self._flush_locks: WeakValueDictionary = WeakValueDictionary()
+        # Задача апдейта -> версии чатов, проверенные в этом апдейте
+        self._validated: WeakKeyDictionary = WeakKeyDictionary()
+        # Задача апдейта -> чаты, записи в которые ждут конца апдейта
+        self._batches: WeakKeyDictionary = WeakKeyDictionary()
+
+        self.hits = 0
+        self.misses = 0
+        self.version_checks = 0
+        self.flushes = 0
+        self.rebases = 0
+        self.conflicts = 0
+
+    @staticmethod
+    def _version_key(key: StorageKey) -> str:
+        return f"fsm_version:{key.bot_id}:{key.chat_id}"
+
+    def _chat(self, version_key: str) -> Optional[_CachedChat]:
+        return self._dirty_chats.get(version_key) or self._local.get(version_key)
+
+    def _validated_versions(self) -> Optional[Dict[str, int]]:
+        task = asyncio.current_task()
+        if task is None:
+            return None
+        return self._validated.setdefault(task, {})
+
+    def begin_update(self):
+        """Начать апдейт: записи копятся до flush_update"""
+        task = asyncio.current_task()
+        if task is not None:
+            self._batches[task] = set()
+
+    async def flush_update(self):
+        """Записать изменения апдейта в Redis атомарно, по одному скрипту на чат"""
+        task = asyncio.current_task()
+        version_keys = self._batches.pop(task, None) if task is not None else None
+        if version_keys:
+            await self._flush(version_keys)
+
+    def end_update(self):
+        """Забыть проверенные версии текущего апдейта"""
+        task = asyncio.current_task()
+        if task is not None:
+            self._validated.pop(task, None)
+            self._batches.pop(task, None)
+
+    async def _get_raw(self, key: StorageKey, part: str) -> Optional[bytes]:
+        redis_key = self.key_builder.build(key, part)
+        version_key = self._version_key(key)
+        validated = self._validated_versions()
+        cached = self._chat(version_key)
+
+        if cached is not None and cached.dirty and redis_key in cached.values:
+            # Незаписанное изменение этого процесса новее, чем значение в Redis
+            self.hits += 1
+            return cached.values[redis_key]
+
+        if validated is not None and version_key in validated:
+            version = validated[version_key]
+        elif cached is not None and cached.version is not None and redis_key in cached.values:
+            self.version_checks += 1
+            keys = list(cached.values)
+            result = await self._check_version(keys=[version_key, *keys], args=[cached.version])
+            version = int(result[0])
+            if version != cached.version and not cached.dirty:
+                # Чат изменил другой процесс - кеш обновлен тем же запросом
+                cached = self._local[version_key] = _CachedChat(version, dict(zip(keys, result[1:])))
+        else:
+            # Значения в кеше нет - версию и значение читаем за один запрос
+            self.version_checks += 1
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(version_key)
+                pipe.get(redis_key)
+                raw_version, raw = await pipe.execute()
+            version = int(raw_version or 0)
+            self._remember(version_key, version, redis_key, raw, cached, validated)
+            self.misses += 1
+            return raw
+
+        if validated is not None:
+            validated[version_key] = version
+        if cached is not None and cached.version == version and redis_key in cached.values:
+            self.hits += 1
+            return cached.values[redis_key]
+
+        self.misses += 1
+        raw = await self.redis.get(redis_key)
+        self._remember(version_key, version, redis_key, raw, cached, validated)
+        return raw
+
+    def _remember(self, version_key: str, version: int, redis_key: str, raw: Optional[bytes],
+                  cached: Optional[_CachedChat], validated: Optional[Dict[str, int]]):
+        if cached is None or (cached.version != version and not cached.dirty):
+            cached = self._local[version_key] = _CachedChat(version)
+        cached.values.setdefault(redis_key, raw)
+        if validated is not None:
+            validated[version_key] = version
+
+    async def _set_raw(self, key: StorageKey, part: str, raw: Optional[bytes], ex: Optional[int],
+                       touched: Optional[Dict[str, int]] = None):
+        redis_key = self.key_builder.build(key, part)
+        version_key = self._version_key(key)
+        cached = self._chat(version_key)
+        if cached is None:
+            # Версию узнаем при записи
+            cached = self._local[version_key] = _CachedChat(None)
+        if redis_key not in cached.dirty:
+            cached.base[redis_key] = cached.values.get(redis_key)
+        cached.values[redis_key] = raw
+        cached.dirty[redis_key] = ex
+        if touched:
+            cached.touched.update(touched)
+        self._dirty_chats[version_key] = cached
+
+        task = asyncio.current_task()
+        batch = self._batches.get(task) if task is not None else None
+        if batch is not None:
+            batch.add(version_key)
+        else:
+            await self._flush({version_key})
+
+    def _flush_lock(self, version_key: str) -> asyncio.Lock:
+        lock = self._flush_locks.get(version_key)
+        if lock is None:
+            lock = self._flush_locks[version_key] = asyncio.Lock()
+        return lock
+
+    async def _flush(self, version_keys: set):
+        """Записать незаписанные ключи чатов и увеличить их версии, по одному скрипту на чат"""
+        # Блокировки держим в списке, чтобы они не исчезли из WeakValueDictionary до конца записи
+        locks = [self._flush_lock(version_key) for version_key in sorted(version_keys)]
+        async with AsyncExitStack() as stack:
+            for lock in locks:
+                await stack.enter_async_context(lock)
+            await self._flush_locked(version_keys)
+
+    async def _flush_locked(self, version_keys: set):
+        chats = {
+            version_key: chat for version_key in version_keys
+            if (chat := self._dirty_chats.get(version_key)) is not None and chat.dirty
+        }
+        if not chats:
+            return
+
+        # Ключ -> (значение, TTL) на момент отправки; изменения во время записи уйдут следующим сбросом
+        written = {
+            version_key: {redis_key: (chat.values[redis_key], ex) for redis_key, ex in chat.dirty.items()}
+            for version_key, chat in chats.items()
+        }
+        touched = {}
+        for version_key, chat in chats.items():
+            touched[version_key], chat.touched = chat.touched, {}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for version_key, chat in chats.items():
+                keys, args = self._flush_args(version_key, chat.version, written[version_key], touched[version_key])
+                await self._flush_script(keys=keys, args=args, client=pipe)
+            try:
+                results = await pipe.execute()
+            except Exception:
+                # Кеш этих чатов расходится с Redis - забываем их целиком
+                for version_key in chats:
+                    self._forget(version_key)
+                raise
+        self.flushes += 1
+
+        validated = self._validated_versions()
+        conflicts = []
+        for (version_key, chat), (applied, version) in zip(chats.items(), results):
+            version = int(version)
+            rebased = False
+            if not applied:
+                # Чат изменил другой процесс после чтения - переносим изменения на его версию
+                try:
+                    version = await self._rebase(version_key, chat, written[version_key], touched[version_key])
+                except Exception as e:
+                    self._forget(version_key)
+                    if validated is not None:
+                        validated.pop(version_key, None)
+                    conflicts.append(e)
+                    continue
+                rebased = True
+            for redis_key, (raw, _) in written[version_key].items():
+                if chat.values.get(redis_key) is raw:
+                    chat.dirty.pop(redis_key, None)
+                    chat.base.pop(redis_key, None)
+                else:
+                    chat.base[redis_key] = raw
+            if chat.version is None or rebased:
+                # Запись без чтения или поверх чужой версии: остальным значениям кеша верить нельзя
+                chat.values = {redis_key: chat.values[redis_key]
+                               for redis_key in {*written[version_key], *chat.dirty}}
+            chat.version = version
+            if not chat.dirty:
+                self._dirty_chats.pop(version_key, None)
+            self._local[version_key] = chat
+            if validated is not None:
+                validated[version_key] = version
+        if conflicts:
+            raise conflicts[0]
+
+    def _flush_args(self, version_key: str, expected: Optional[int],
+                    written: Dict[str, tuple], touched: Dict[str, int]) -> tuple:
+        """Ключи и аргументы скрипта записи одного чата"""
+        keys = [version_key]
+        args = ["" if expected is None else expected, "" if not self.version_ttl else self.version_ttl]
+        for redis_key, (raw, ex) in written.items():
+            keys.append(redis_key)
+            args.extend(("del", "", "") if raw is None else ("set", raw, "" if ex is None else ex))
+        # Продлеваем после записи: контекст и стек одного апдейта уходят этим же скриптом
+        for redis_key, ttl in touched.items():
+            keys.append(redis_key)
+            args.extend(("expire", "", ttl))
+        return keys, args
+
+    async def _rebase(self, version_key: str, chat: _CachedChat,
+                      written: Dict[str, tuple], touched: Dict[str, int]) -> int:
+        """
+        Повторная запись изменений чата поверх версии другого процесса
+
+        Returns:
+            Новая версия чата
+
+        Raises:
+            FsmConflictError: другой процесс изменил те же ключи или версия менялась при каждой попытке
+        """
+        keys = list(written)
+        for _ in range(FLUSH_RETRIES):
+            # Версия и текущие значения измененных ключей - одним атомарным запросом
+            result = await self._check_version(keys=[version_key, *keys], args=[chat.version])
+            version = int(result[0])
+            changed = [redis_key for redis_key, raw in zip(keys, result[1:]) if raw != chat.base.get(redis_key)]
+            if changed:
+                self.conflicts += 1
+                logger.warning(f"⚠️ Изменения FSM чата {version_key} отклонены: версия {chat.version} "
+                               f"сменилась на {version}, другой процесс изменил {', '.join(changed)}")
+                raise FsmConflictError(f"Ключи {', '.join(changed)} чата {version_key} изменены другим процессом")
+            flush_keys, args = self._flush_args(version_key, version, written, touched)
+            applied, new_version = await self._flush_script(keys=flush_keys, args=args)
+            if applied:
+                self.rebases += 1
+                return int(new_version)
+        self.conflicts += 1
+        logger.warning(f"⚠️ Изменения FSM чата {version_key} отклонены: версия менялась при каждой "
+                       f"из {FLUSH_RETRIES} попыток записи")
+        raise FsmConflictError(f"Версия чата {version_key} менялась при каждой попытке записи")
+
+    def _forget(self, version_key: str):
+        self._dirty_chats.pop(version_key, None)
+        self._local.pop(version_key, None)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        if state is not None:
+            state = cast(str, state.state if isinstance(state, State) else state).encode("utf-8")
+        await self._set_raw(key, "state", state, self.state_ttl)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        raw = await self._get_raw(key, "state")
+        return raw.decode("utf-8") if raw is not None else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            # Та же ошибка, что и у RedisStorage
+            return await super().set_data(key, data)
+        if not data:
+            await self._set_raw(key, "data", None, None)
+            return
+        await self._set_raw(key, "data", self.serializer.dumps(data), self._data_ttl(key, data),
+                            self._touched_keys(key, data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        # Кешируются байты, а не словарь: каждый вызов получает свою копию данных
+        raw = await self._get_raw(key, "data")
+        if raw is None:
+            return {}
+        return self.serializer.loads(raw)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кеша FSM"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._local),
+            "maxsize": self._local.maxsize,
+            "dirty": len(self._dirty_chats),
+            "hits": self.hits,
+            "misses": self.misses,
+            "version_checks": self.version_checks,
+            "flushes": self.flushes,
+            "rebases": self.rebases,
+            "conflicts": self.conflicts,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def setup_fsm_storage(config, redis: Redis) -> RedisStorage:
+    """Создание хранилища FSM с форматом, кешем процесса и временем жизни ключей из REDIS_FSM_*"""
+    serializer = FsmSerializer(
+        fmt=config.redis.fsm_format,
+        compression=config.redis.fsm_compression,
+        compress_threshold=config.redis.fsm_compress_threshold,
+    )
+    ttl_policy = FsmTtlPolicy(
+        idle_ttl=config.redis.fsm_idle_ttl,
+        in_progress_ttl=config.redis.fsm_in_progress_ttl,
+        in_progress_groups=tuple(config.redis.fsm_in_progress_groups),
+    )
+    logger.info(f"🗃️ Хранилище FSM: формат {serializer.fmt}, сжатие {serializer.compression} "
+                f"(от {serializer.compress_threshold} байт), кеш процесса на {config.redis.fsm_cache_size} чатов, "
+                f"TTL {ttl_policy.idle_ttl} с / {ttl_policy.in_progress_ttl} с для незаконченных анкет")
+    storage_kwargs = dict(
+        redis=redis,
+        serializer=serializer,
+        key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+        ttl_policy=ttl_policy,
+    )
+    if config.redis.fsm_cache_size <= 0:
+        return CompactRedisStorage(**storage_kwargs)
+    return CachedRedisStorage(
+        **storage_kwargs,
+        cache_size=config.redis.fsm_cache_size,
+        cache_ttl=config.redis.fsm_cache_ttl,
+    )
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Отчет о памяти Redis под FSM и очистка брошенных ключей aiogram-dialog
+
+Брошенные ключи:
+- контекст диалога, на который не ссылается ни один стек чата;
+- стек, ни для одного диалога которого нет контекста.
+Удаляются только ключи, к которым не обращались дольше min_idle секунд.
+
+Разовый запуск из корня проекта (без --evict только отчет):
+    python -m utils.fsm_sweeper --evict
+"""
+
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List
+
+from redis.asyncio import Redis
+
+from utils.fsm_storage import FsmSerializer, CONTEXT_DESTINY, STACK_DESTINY
+from utils.logging_config import log_error
+
+logger = logging.getLogger(__name__)
+
+# Сколько ключей обрабатывать одним конвейером запросов
+BATCH_SIZE = 500
+
+
+@dataclass
+class _FsmKey:
+    key: str
+    kind: str  # context, stack, state, data, lock, version
+    # Ключи одного чата: префикс до destiny (бот, чат, пользователь, тред)
+    scope: str
+    # Чат для счетчика версий кеша FSM
+    bot_id: str
+    chat_id: str
+    # id диалога для контекста, id стека для стека
+    ident: str = ""
+    memory: int = 0
+    idle: int = 0
+
+
+def parse_key(key: str, prefix: str = "fsm", separator: str = ":") -> Optional[_FsmKey]:
+    """Разбор ключа DefaultKeyBuilder(with_bot_id=True, with_destiny=True)"""
+    parts = key.split(separator)
+    if len(parts) < 5 or parts[0] != prefix:
+        return None
+    bot_id, chat_id = parts[1], parts[2]
+    body, _, part = key.rpartition(separator)
+    for destiny, kind in ((CONTEXT_DESTINY, "context"), (STACK_DESTINY, "stack")):
+        position = body.find(separator + destiny)
+        if position != -1:
+            return _FsmKey(key, kind, body[:position], bot_id, chat_id, body[position + 1 + len(destiny):])
+    return _FsmKey(key, part, body, bot_id, chat_id)
+
+
+class FsmSweeper:
+    """Периодический отчет о ключах FSM в Redis и удаление брошенных ключей диалогов"""
+
+    def __init__(self, redis: Redis, interval: float = 3600.0, min_idle: int = 3600,
+                 evict: bool = True, version_ttl: Optional[int] = None, min_key_ttl: Optional[int] = None):
+        """
+        Args:
+            redis: Клиент Redis с хранилищем FSM
+            interval: Пауза между проходами (секунды)
+            min_idle: Удалять только ключи, к которым не обращались дольше (секунды)
+            evict: Удалять брошенные ключи (иначе только отчет)
+            version_ttl: Время жизни счетчика версий кеша FSM (секунды)
+            min_key_ttl: Наименьший TTL, с которым пишутся ключи FSM (секунды). Если Redis не
+                отдает OBJECT IDLETIME (maxmemory-policy *-lfu), простой оценивается по остатку TTL;
+                без min_key_ttl такие ключи не удаляются
+        """
+        self.redis = redis
+        self.interval = interval
+        self.min_idle = min_idle
+        self.evict = evict
+        self.version_ttl = version_ttl
+        self.min_key_ttl = min_key_ttl
+        self.serializer = FsmSerializer()
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        """Запуск периодической очистки в фоне"""
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run(), name="fsm_sweeper")
+            logger.info("🧹 Очистка брошенных диалогов в Redis запущена")
+
+    async def stop(self):
+        """Остановка очистки"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        logger.info("🧹 Очистка брошенных диалогов в Redis остановлена")
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping.is_set():
+                break
+            try:
+                report = await self.run_once()
+                logger.info(f"🧹 Ключи FSM в Redis: {report}")
+            except Exception as e:
+                log_error(e, "Ошибка очистки брошенных диалогов в Redis")
+
+    async def _scan(self) -> List[_FsmKey]:
+        keys = []
+        async for raw_key in self.redis.scan_iter(match="fsm:*", count=BATCH_SIZE):
+            parsed = parse_key(raw_key.decode() if isinstance(raw_key, bytes) else raw_key)
+            if parsed is not None:
+                keys.append(parsed)
+        async for raw_key in self.redis.scan_iter(match="fsm_version:*", count=BATCH_SIZE):
+            raw_key = raw_key.decode() if isinstance(raw_key, bytes) else raw_key
+            _, bot_id, chat_id = raw_key.split(":", 2)
+            keys.append(_FsmKey(raw_key, "version", "", bot_id, chat_id))
+
+        idle_error = None
+        for start in range(0, len(keys), BATCH_SIZE):
+            batch = keys[start:start + BATCH_SIZE]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for item in batch:
+                    pipe.memory_usage(item.key)
+                    pipe.object("idletime", item.key)
+                    pipe.ttl(item.key)
+                results = await pipe.execute(raise_on_error=False)
+            for index, item in enumerate(batch):
+                memory, idle, ttl = results[3 * index:3 * index + 3]
+                item.memory = memory if isinstance(memory, int) else 0
+                if isinstance(idle, int):
+                    item.idle = idle
+                else:
+                    idle_error = idle
+                    item.idle = self._idle_from_ttl(ttl)
+
+        if idle_error is not None:
+            if self.min_key_ttl:
+                logger.warning(f"⚠️ OBJECT IDLETIME недоступен ({idle_error}), вероятно maxmemory-policy *-lfu: "
+                               f"простой ключей FSM оценен по остатку TTL (время с последней записи)")
+            else:
+                logger.warning(f"⚠️ OBJECT IDLETIME недоступен ({idle_error}), вероятно maxmemory-policy *-lfu: "
+                               f"простой ключей FSM неизвестен, брошенные ключи не удаляются")
+        return keys
+
+    def _idle_from_ttl(self, ttl) -> int:
+        """
+        Нижняя оценка простоя по остатку TTL: TTL продлевается при каждой записи ключа,
+        поэтому с последней записи прошло не меньше min_key_ttl - ttl секунд
+        """
+        if not self.min_key_ttl or not isinstance(ttl, int) or ttl < 0:
+            return 0
+        return max(0, self.min_key_ttl - ttl)
+
+    async def _load_stacks(self, stacks: List[_FsmKey]) -> Dict[str, List[str]]:
+        """Ключ стека -> id диалогов в нем"""
+        intents = {}
+        for start in range(0, len(stacks), BATCH_SIZE):
+            batch = stacks[start:start + BATCH_SIZE]
+            values = await self.redis.mget([item.key for item in batch])
+            for item, raw in zip(batch, values):
+                if raw is None:
+                    continue
+                try:
+                    intents[item.key] = list(self.serializer.loads(raw).get("intents") or [])
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось прочитать стек диалогов {item.key}: {e}")
+        return intents
+
+    async def run_once(self, evict: Optional[bool] = None) -> Dict[str, Any]:
+        """Один проход: отчет по типам ключей и удаление брошенных; возвращает отчет"""
+        evict = self.evict if evict is None else evict
+        keys = await self._scan()
+
+        stacks = [item for item in keys if item.kind == "stack"]
+        stack_intents = await self._load_stacks(stacks)
+        live_intents = defaultdict(set)
+        for item in stacks:
+            live_intents[item.scope].update(stack_intents.get(item.key, ()))
+        contexts = defaultdict(set)
+        for item in keys:
+            if item.kind == "context":
+                contexts[item.scope].add(item.ident)
+
+        orphans = []
+        for item in keys:
+            if item.idle < self.min_idle:
+                continue
+            if item.kind == "context" and item.ident not in live_intents[item.scope]:
+                orphans.append(item)
+            elif item.kind == "stack":
+                intents = stack_intents.get(item.key)
+                if intents and not any(intent in contexts[item.scope] for intent in intents):
+                    orphans.append(item)
+
+        report: Dict[str, Any] = {}
+        for item in keys:
+            entry = report.setdefault(item.kind, {"keys": 0, "bytes": 0})
+            entry["keys"] += 1
+            entry["bytes"] += item.memory
+        orphan_report = {"keys": len(orphans), "bytes": sum(item.memory for item in orphans)}
+        for item in orphans:
+            orphan_report[item.kind] = orphan_report.get(item.kind, 0) + 1
+        report["orphans"] = orphan_report
+
+        if evict and orphans:
+            report["evicted"] = await self._evict(orphans, keys)
+        return report
+
+    async def _evict(self, orphans: List[_FsmKey], keys: List[_FsmKey]) -> int:
+        """
+        Удалить брошенные ключи
+
+        Версию чата (сброс кеша FSM процессов бота) меняем, только если удаляются все ключи
+        чата. Иначе чат может быть посреди диалога: новая версия отклонила бы отложенные
+        записи его текущего апдейта, а брошенный ключ живым состоянием в кеше быть не может.
+        """
+        chat_keys = defaultdict(set)
+        for item in keys:
+            if item.kind != "version":
+                chat_keys[(item.bot_id, item.chat_id)].add(item.key)
+        orphan_keys = defaultdict(set)
+        for item in orphans:
+            orphan_keys[(item.bot_id, item.chat_id)].add(item.key)
+
+        evicted = 0
+        for start in range(0, len(orphans), BATCH_SIZE):
+            batch = orphans[start:start + BATCH_SIZE]
+            version_keys = {
+                f"fsm_version:{item.bot_id}:{item.chat_id}" for item in batch
+                if orphan_keys[(item.bot_id, item.chat_id)] >= chat_keys[(item.bot_id, item.chat_id)]
+            }
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(*(item.key for item in batch))
+                for version_key in version_keys:
+                    pipe.incr(version_key)
+                    if self.version_ttl:
+                        pipe.expire(version_key, self.version_ttl)
+                results = await pipe.execute()
+            evicted += results[0]
+        return evicted
+
+
+def setup_fsm_sweeper(config, redis: Redis) -> Optional[FsmSweeper]:
+    """
+    Создание периодической очистки брошенных ключей диалогов
+
+    Returns:
+        FsmSweeper или None, если REDIS_FSM_SWEEP_INTERVAL <= 0
+    """
+    if config.redis.fsm_sweep_interval <= 0:
+        return None
+
+    return FsmSweeper(
+        redis=redis,
+        interval=config.redis.fsm_sweep_interval,
+        min_idle=config.redis.fsm_sweep_min_idle,
+        version_ttl=max(config.redis.fsm_idle_ttl, config.redis.fsm_in_progress_ttl),
+        min_key_ttl=min(config.redis.fsm_idle_ttl, config.redis.fsm_in_progress_ttl),
+    )
+
+
+async def _main(evict: bool, min_idle: Optional[int]):
+    from config.config import load_config
+
+    config = load_config()
+    if config.redis.password:
+        redis = Redis.from_url(f"redis://:{config.redis.password}@{config.redis.host}:{config.redis.port}/0")
+    else:
+        redis = Redis.from_url(f"redis://{config.redis.host}:{config.redis.port}/0")
+    try:
+        sweeper = FsmSweeper(
+            redis=redis,
+            min_idle=config.redis.fsm_sweep_min_idle if min_idle is None else min_idle,
+            version_ttl=max(config.redis.fsm_idle_ttl, config.redis.fsm_in_progress_ttl),
+            min_key_ttl=min(config.redis.fsm_idle_ttl, config.redis.fsm_in_progress_ttl),
+        )
+        report = await sweeper.run_once(evict=evict)
+        for kind, entry in report.items():
+            print(f"{kind:<10} {entry}")
+    finally:
+        await redis.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память Redis под FSM и очистка брошенных диалогов")
+    parser.add_argument("--evict", action="store_true", help="Удалить брошенные ключи (без флага - только отчет)")
+    parser.add_argument("--min-idle", type=int, default=None, help="Минимальный простой ключа (секунды)")
+    args = parser.parse_args()
+    asyncio.run(_main(args.evict, args.min_idle))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,351 @@
 import os
+import re
+import random
+import asyncio
+import threading
+import time
 import gspread
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from google.auth.exceptions import TransportError
 from google.oauth2.service_account import Credentials
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, TypeVar, Iterable, Awaitable
+from redis.asyncio import Redis
 import logging
 from datetime import datetime
 
+from utils.rate_limiter import TokenBucket
+from utils.sheets_backends import create_memory_client
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Ответы Google, после которых запрос имеет смысл повторить
+RETRYABLE_SERVER_STATUSES = {500, 502, 503, 504}
+
+# Квоты считаются на сервисный аккаунт, поэтому лимитеры общие для всех сервисов процесса
+_quota_limiters: Dict[str, Dict[str, TokenBucket]] = {}
+
+
+def get_quota_limiters(credentials_path: str, read_requests_per_minute: int,
+                       write_requests_per_minute: int) -> Dict[str, TokenBucket]:
+    """Лимитеры запросов на чтение и запись для сервисного аккаунта"""
+    if credentials_path not in _quota_limiters:
+        _quota_limiters[credentials_path] = {
+            "read": TokenBucket(read_requests_per_minute),
+            "write": TokenBucket(write_requests_per_minute),
+        }
+    return _quota_limiters[credentials_path]
+
+
+def get_error_status(e: Exception) -> Optional[int]:
+    """HTTP-статус ошибки Google API (если есть)"""
+    return getattr(getattr(e, 'response', None), 'status_code', None)
+
+
+def is_not_found_error(e: Exception) -> bool:
+    """Ошибка означает, что таблица или лист больше не существуют"""
+    if isinstance(e, (gspread.WorksheetNotFound, gspread.SpreadsheetNotFound)):
+        return True
+    status = get_error_status(e)
+    # Запись в удаленный лист Google возвращает 400 "Unable to parse range"
+    return status == 404 or (status == 400 and "Unable to parse range" in str(e))
+
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: Google Sheets временно считается недоступным"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для внешнего API
+    
+    После failure_threshold подряд неудачных запросов размыкается и reset_timeout секунд
+    сразу отклоняет запросы. Затем пропускает один пробный запрос (half-open):
+    успех замыкает цепь, неудача снова размыкает.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self.rejected = 0  # Сколько запросов отклонено без обращения к API
+    
+    @property
+    def is_open(self) -> bool:
+        """Цепь разомкнута и время ожидания еще не вышло"""
+        return self.state == self.OPEN and self.retry_after > 0
+    
+    @property
+    def retry_after(self) -> float:
+        """Через сколько секунд можно будет отправить пробный запрос"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+    
+    def allow_request(self) -> bool:
+        """Можно ли отправить запрос (в half-open пропускается один пробный запрос)"""
+        if self.state == self.CLOSED:
+            return True
+        
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self._opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_started_at = None
+        
+        # Пробный запрос уже идет (зависший пробный запрос не блокирует цепь дольше reset_timeout)
+        if self._probe_started_at is not None and now - self._probe_started_at < self.reset_timeout:
+            self.rejected += 1
+            return False
+        self._probe_started_at = now
+        return True
+    
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("✅ Google Sheets снова доступен, circuit breaker замкнут")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started_at = None
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.error(f"🔌 Google Sheets недоступен ({self.failures} ошибок подряд), "
+                             f"запросы приостановлены на {self.reset_timeout:.0f} с")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_started_at = None
+
+
+# Колонки листа с заявками (формат совместим с существующим листом APPLICATION)
+APPLICATION_HEADERS = [
+    'Timestamp', 'User ID', 'Username', 'Full Name', 'First Name', 'Last Name', 'Middle Name',
+    'Course', 'Dormitory', 'Email', 'Phone', 'Personal Qualities', 'Motivation',
+    'Logistics Rating', 'Marketing Rating', 'PR Rating', 'Program Rating', 'Partners Rating',
+    'Created At', 'Updated At',
+    'Is From VSM', 'Is From SPBU', 'University'  # Новые поля в конце
+]
+LAST_COLUMN = 'W'
+
+# Колонка листа с Telegram ID пользователя ('User ID', колонка B)
+USER_ID_COLUMN = 2
+# Колонка с временем изменения заявки ('Updated At', колонка T)
+UPDATED_AT_COLUMN = APPLICATION_HEADERS.index('Updated At') + 1
+
+
+def column_letter(column: int) -> str:
+    """Буква колонки по номеру (2 -> 'B')"""
+    return gspread.utils.rowcol_to_a1(1, column).rstrip("0123456789")
+
+
+USER_ID_COLUMN_LETTER = column_letter(USER_ID_COLUMN)
+
+
+def parse_updated_row(response: Optional[Dict[str, Any]]) -> Optional[int]:
+    """Номер первой строки из ответа values.append (поле updates.updatedRange)"""
+    if not response:
+        return None
+    updated_range = response.get("updates", {}).get("updatedRange", "")
+    match = re.search(r"![A-Z]+(\d+)", updated_range)
+    return int(match.group(1)) if match else None
+
+
+class SheetsRowIndex:
+    """
+    Индекс telegram_id -> номер строки на листе
+    
+    Хранится в Redis-хеше (общий для всех процессов бота) с копией в памяти.
+    Если индекса еще нет, он строится одним запросом col_values по колонке User ID.
+    Строки могут сдвинуться, если лист отсортируют или отредактируют вручную, поэтому
+    перед записью GoogleSheetsService.upsert_rows сверяет их с колонкой User ID.
+    """
+    
+    BUILT_MARKER = "_built"
+    
+    def __init__(self, key: str, redis: Optional[Redis] = None):
+        """
+        Args:
+            key: Ключ Redis-хеша с индексом
+            redis: Клиент Redis (без него индекс живет только в памяти процесса)
+        """
+        self.key = key
+        self.redis = redis
+        self._rows: Dict[str, int] = {}
+        self._built = False
+        self._lock = asyncio.Lock()
+    
+    async def is_built(self) -> bool:
+        """Построен ли индекс (в памяти или в Redis)"""
+        if self._built:
+            return True
+        if self.redis is not None and await self.redis.hexists(self.key, self.BUILT_MARKER):
+            self._built = True
+        return self._built
+    
+    async def ensure_built(self, load_user_ids: Callable[[], Awaitable[Iterable[Any]]]):
+        """Построить индекс, если его еще нет (load_user_ids читает колонку User ID)"""
+        async with self._lock:
+            if not await self.is_built():
+                await self.rebuild(await load_user_ids())
+    
+    async def get(self, telegram_id: Any) -> Optional[int]:
+        """Номер строки пользователя или None"""
+        telegram_id = str(telegram_id)
+        row = self._rows.get(telegram_id)
+        if row is None and self.redis is not None:
+            value = await self.redis.hget(self.key, telegram_id)
+            if value is not None:
+                row = int(value)
+                self._rows[telegram_id] = row
+        return row
+    
+    async def get_many(self, telegram_ids: Iterable[Any]) -> Dict[str, int]:
+        """Номера строк для нескольких пользователей (одним HMGET для отсутствующих в памяти)"""
+        telegram_ids = [str(telegram_id) for telegram_id in telegram_ids]
+        rows = {telegram_id: self._rows[telegram_id] for telegram_id in telegram_ids if telegram_id in self._rows}
+        missing = [telegram_id for telegram_id in telegram_ids if telegram_id not in rows]
+        if missing and self.redis is not None:
+            values = await self.redis.hmget(self.key, missing)
+            for telegram_id, value in zip(missing, values):
+                if value is not None:
+                    rows[telegram_id] = int(value)
+                    self._rows[telegram_id] = int(value)
+        return rows
+    
+    async def set(self, telegram_id: Any, row: int):
+        """Запомнить строку пользователя"""
+        await self.set_many({telegram_id: row})
+    
+    async def set_many(self, rows: Dict[Any, int]):
+        """Запомнить строки нескольких пользователей"""
+        rows = {str(telegram_id): row for telegram_id, row in rows.items()}
+        self._rows.update(rows)
+        if self.redis is not None and rows:
+            await self.redis.hset(self.key, mapping=rows)
+    
+    async def rebuild(self, user_ids: Iterable[Any]):
+        """
+        Перестроить индекс по значениям колонки User ID
+        
+        Args:
+            user_ids: Значения колонки начиная с первой строки (заголовка)
+        """
+        rows = {}
+        for row, value in enumerate(user_ids, start=1):
+            if row == 1 or not str(value).strip():
+                continue
+            rows[str(value).strip()] = row
+        
+        self._rows = rows
+        self._built = True
+        if self.redis is not None:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self.key)
+                pipe.hset(self.key, mapping={**rows, self.BUILT_MARKER: 1})
+                await pipe.execute()
+        logger.info(f"🗂️ Индекс строк Google Sheets перестроен: {len(rows)} записей")
+    
+    async def invalidate(self):
+        """Сбросить индекс, он будет перестроен при следующем обращении"""
+        self._rows = {}
+        self._built = False
+        if self.redis is not None:
+            await self.redis.delete(self.key)
+
 
 class GoogleSheetsService:
     """Класс для работы с Google Sheets"""
     
-    def __init__(self, credentials_path: str, spreadsheet_id: str):
+    worksheet_name = "APPLICATIONS_NEW"
+    
+    def __init__(self, credentials_path: str, spreadsheet_id: str, max_workers: int = 4,
+                 redis: Optional[Redis] = None, write_batch_size: int = 50, write_batch_delay: float = 1.0,
+                 read_requests_per_minute: int = 60, write_requests_per_minute: int = 60,
+                 max_retries: int = 5, max_backoff: float = 64.0, request_timeout: float = 15.0,
+                 breaker_failure_threshold: int = 5, breaker_reset_timeout: float = 30.0,
+                 client: Optional[Any] = None):
         """
         Инициализация сервиса Google Sheets
         
         Args:
             credentials_path: Путь к файлу с учетными данными сервисного аккаунта
             spreadsheet_id: ID Google Таблицы
+            max_workers: Максимальное число одновременных запросов к Google Sheets
+            redis: Клиент Redis для хранения индекса строк (опционально)
+            write_batch_size: Максимум строк в одном запросе на запись
+            write_batch_delay: Сколько ждать накопления пачки строк (секунды)
+            read_requests_per_minute: Квота Google Sheets на чтение (запросов в минуту)
+            write_requests_per_minute: Квота Google Sheets на запись (запросов в минуту)
+            max_retries: Сколько раз повторять запрос после 429/5xx
+            max_backoff: Максимальная пауза между повторами (секунды)
+            request_timeout: Таймаут HTTP-запроса к Google (секунды)
+            breaker_failure_threshold: После скольких ошибок подряд приостановить запросы
+            breaker_reset_timeout: На сколько секунд приостанавливать запросы
+            client: Готовый клиент вместо gspread (например, эмулятор из utils.sheets_backends)
         """
         self.credentials_path = credentials_path
         self.spreadsheet_id = spreadsheet_id
+        self.max_workers = max_workers
+        self.request_timeout = request_timeout
         
         # Области доступа
         self.scopes = [
             'https://www.googleapis.com/auth/spreadsheets',
         ]
         
-        self._setup_service()
+        # gspread блокирующий, поэтому все запросы выполняются в отдельном пуле потоков,
+        # чтобы не останавливать event loop диспетчера
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="google_sheets")
+        self._stats_lock = threading.Lock()
+        self._queued = 0  # Ждут свободного потока
+        self._in_flight = 0  # Выполняются прямо сейчас
+        self._max_queue_depth = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait_time = 0.0
+        
+        # Ограничение частоты запросов под квоты Google и повторы с экспоненциальной задержкой
+        self.limiters = get_quota_limiters(credentials_path, read_requests_per_minute, write_requests_per_minute)
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self._retried = 0
+        self._quota_errors = 0
+        
+        # При недоступности Google запросы сразу отклоняются, а выгрузки остаются в очереди
+        self.breaker = CircuitBreaker(failure_threshold=breaker_failure_threshold, reset_timeout=breaker_reset_timeout)
+        
+        # Индекс строк по telegram_id вместо полного чтения листа на каждую заявку
+        self.row_index = SheetsRowIndex(
+            key=f"google_sheets:row_index:{spreadsheet_id}:{self.worksheet_name}",
+            redis=redis
+        )
+        
+        # Хендлы таблицы и листа (открываются один раз, см. _get_worksheet)
+        self._spreadsheet = None
+        self._worksheet = None
+        self._handles_lock = asyncio.Lock()
+        self._index_stale = False
+        
+        # Заявки, выгружаемые одновременно, записываются одним запросом
+        self.batch_writer = SheetsBatchWriter(self, max_batch_size=write_batch_size, max_delay=write_batch_delay)
+        
+        if client is not None:
+            self.gc = client
+        else:
+            self._setup_service()
     
     def _setup_service(self):
         """Настройка сервиса Google Sheets"""
@@ -40,211 +358,466 @@ class GoogleSheetsService:
             
             # Настраиваем gspread для работы с Google Sheets
             self.gc = gspread.authorize(credentials)
+            # Без таймаута зависший запрос навсегда занимает поток пула
+            self.gc.http_client.set_timeout(self.request_timeout)
             logger.info("✅ Google Sheets API настроен")
             
         except Exception as e:
             logger.error(f"Ошибка настройки Google Sheets: {e}")
             raise
     
-    async def add_application_to_sheet(self, application_data: Dict[str, Any]) -> bool:
+    async def call(self, func: Callable[..., T], *args, quota: str = "read", idempotent: bool = True, **kwargs) -> T:
         """
-        Добавляет данные заявки в Google Таблицу
+        Выполняет запрос gspread с учетом квот Google Sheets
+        
+        Запрос ждет токена в лимитере своей квоты, а при ответах 429/5xx повторяется
+        с экспоненциальной задержкой и джиттером. Пока circuit breaker разомкнут,
+        запрос сразу завершается CircuitOpenError.
         
         Args:
-            application_data: Словарь с данными заявки
+            func: Блокирующая функция (метод клиента, таблицы или листа)
+            quota: Квота запроса - "read" или "write"
+            idempotent: Можно ли повторять запрос после 5xx (append повторять нельзя - задублирует строки)
             
         Returns:
-            bool: True если успешно, False в случае ошибки
+            Результат вызова func
         """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"Google Sheets недоступен, повтор через {self.breaker.retry_after:.0f} с")
+        
         try:
-            logger.info(f"📊 Начинаем добавление заявки в Google Sheets...")
-            logger.info(f"👤 Пользователь: {application_data.get('telegram_id')} (@{application_data.get('telegram_username')})")
+            result = await self._call_with_retries(func, *args, quota=quota, idempotent=idempotent, **kwargs)
+        except Exception as e:
+            if self._is_unavailable(e):
+                self.breaker.record_failure()
+            else:
+                # Google ответил (пусть и ошибкой) - сервис доступен
+                self.breaker.record_success()
+            raise
+        
+        self.breaker.record_success()
+        return result
+    
+    @staticmethod
+    def _is_unavailable(e: Exception) -> bool:
+        """Ошибка говорит о недоступности Google (сеть, таймаут, 429, 5xx)"""
+        if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, TransportError)):
+            return True
+        status = get_error_status(e)
+        return status == 429 or status in RETRYABLE_SERVER_STATUSES
+    
+    async def _call_with_retries(self, func: Callable[..., T], *args, quota: str, idempotent: bool, **kwargs) -> T:
+        """Запрос с ожиданием квоты и повторами после 429/5xx"""
+        limiter = self.limiters[quota]
+        attempt = 0
+        while True:
+            await limiter.acquire()
+            try:
+                return await self._run_in_executor(func, *args, **kwargs)
+            except Exception as e:
+                status = get_error_status(e)
+                retryable = status == 429 or (idempotent and status in RETRYABLE_SERVER_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                
+                if status == 429:
+                    # Квота исчерпана - притормаживаем всех, кто пользуется этим лимитером
+                    self._quota_errors += 1
+                    limiter.drain()
+                delay = min(self.max_backoff, 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                self._retried += 1
+                logger.warning(f"🔁 Google Sheets ответил {status}, повтор {attempt}/{self.max_retries} через {delay:.1f} с")
+                await asyncio.sleep(delay)
+    
+    async def _run_in_executor(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Выполняет блокирующий вызов gspread в пуле потоков сервиса"""
+        loop = asyncio.get_running_loop()
+        submitted_at = time.monotonic()
+        
+        with self._stats_lock:
+            self._queued += 1
+            queue_depth = self._queued - self._in_flight
+            self._max_queue_depth = max(self._max_queue_depth, queue_depth)
+        
+        if queue_depth > self.max_workers:
+            logger.warning(f"⏳ Очередь запросов к Google Sheets: {queue_depth} ожидают свободного потока")
+        
+        def run():
+            with self._stats_lock:
+                self._in_flight += 1
+                self._total_wait_time += time.monotonic() - submitted_at
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._stats_lock:
+                    self._in_flight -= 1
+                    self._queued -= 1
+        
+        try:
+            result = await loop.run_in_executor(self._executor, run)
+        except Exception:
+            with self._stats_lock:
+                self._failed += 1
+            raise
+        
+        with self._stats_lock:
+            self._completed += 1
+        return result
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики пула запросов к Google Sheets"""
+        with self._stats_lock:
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued - self._in_flight,
+                "in_flight": self._in_flight,
+                "max_queue_depth": self._max_queue_depth,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_time": self._total_wait_time / finished if finished else 0.0,
+                "read_budget": self.limiters["read"].tokens,
+                "write_budget": self.limiters["write"].tokens,
+                "throttled_calls": self.limiters["read"].throttled + self.limiters["write"].throttled,
+                "retried_calls": self._retried,
+                "quota_errors": self._quota_errors,
+                "breaker_state": self.breaker.state,
+                "breaker_rejected": self.breaker.rejected,
+            }
+    
+    def close(self):
+        """Остановка пула потоков"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    async def _get_worksheet(self):
+        """Лист с заявками (хендлы таблицы и листа открываются один раз и кешируются)"""
+        if self._worksheet is not None:
+            return self._worksheet
+        
+        async with self._handles_lock:
+            if self._worksheet is not None:
+                return self._worksheet
             
-            # Открываем таблицу по ID
-            logger.info(f"📋 Открываем таблицу: {self.spreadsheet_id}")
-            spreadsheet = self.gc.open_by_key(self.spreadsheet_id)
+            if self._spreadsheet is None:
+                logger.info(f"📋 Открываем таблицу: {self.spreadsheet_id}")
+                self._spreadsheet = await self.call(self.gc.open_by_key, self.spreadsheet_id)
             
-            # Получаем лист "TEST" для тестирования (или создаем его)
-            worksheet_name = "APPLICATIONS_NEW"
             try:
-                logger.info(f"🔍 Ищем тестовый лист: {worksheet_name}")
-                worksheet = spreadsheet.worksheet(worksheet_name)
-                logger.info(f"✅ Тестовый лист {worksheet_name} найден")
+                worksheet = await self.call(self._spreadsheet.worksheet, self.worksheet_name)
             except gspread.WorksheetNotFound:
-                logger.info(f"📄 Тестовый лист {worksheet_name} не найден, создаем новый...")
-                # Создаем лист если его нет
-                worksheet = spreadsheet.add_worksheet(title=worksheet_name, rows=1000, cols=25)
-                
-            # Определяем формат данных в зависимости от листа
-            if worksheet_name == "TEST":
-                # Новый формат с полными заголовками для тестового листа
-                headers = [
-                    'Timestamp', 'User ID', 'Username', 'Full Name', 'First Name', 'Last Name', 'Middle Name',
-                    'Course', 'Is From VSM', 'Is From SPBU', 'University', 'Dormitory', 'Email', 'Phone', 
-                    'Personal Qualities', 'Motivation',
-                    'Logistics Rating', 'Marketing Rating', 'PR Rating', 'Program Rating', 'Partners Rating',
-                    'Created At', 'Updated At'
-                ]
-            else:
-                # Старый формат для совместимости с существующим листом APPLICATION
-                headers = [
-                    'Timestamp', 'User ID', 'Username', 'Full Name', 'First Name', 'Last Name', 'Middle Name',
-                    'Course', 'Dormitory', 'Email', 'Phone', 'Personal Qualities', 'Motivation',
-                    'Logistics Rating', 'Marketing Rating', 'PR Rating', 'Program Rating', 'Partners Rating',
-                    'Created At', 'Updated At',
-                    'Is From VSM', 'Is From SPBU', 'University'  # Новые поля в конце
-                ]
-                #worksheet.append_row(headers)
-                logger.info(f"✅ Тестовый лист {worksheet_name} создан с заголовками")
+                logger.info(f"📄 Лист {self.worksheet_name} не найден, создаем новый...")
+                worksheet = await self.call(self._spreadsheet.add_worksheet, title=self.worksheet_name, rows=1000, cols=25,
+                                            quota="write", idempotent=False)
+                self._index_stale = True
             
-            # Проверяем, есть ли уже запись для этого пользователя
+            if self._index_stale:
+                # Лист создан заново - индекс перестроится при следующей записи
+                await self.row_index.invalidate()
+                self._index_stale = False
+            self._worksheet = worksheet
+            return worksheet
+    
+    def invalidate_handles(self):
+        """Сбросить закешированные хендлы таблицы и листа"""
+        self._spreadsheet = None
+        self._worksheet = None
+        # Лист удалили или пересоздали - строки из индекса к новому листу не относятся
+        self._index_stale = True
+    
+    async def warm_up(self):
+        """Заранее открыть таблицу, лист и построить индекс строк"""
+        try:
+            worksheet = await self._get_worksheet()
+            await self.row_index.ensure_built(lambda: self.call(worksheet.col_values, USER_ID_COLUMN))
+            logger.info(f"🔥 Google Sheets прогрет: лист {self.worksheet_name} открыт")
+        except Exception as e:
+            self._handle_error(e)
+    
+    @staticmethod
+    def build_row(application_data: Dict[str, Any]) -> list:
+        """Строка листа с заявкой (порядок колонок - APPLICATION_HEADERS)"""
+        # Преобразуем boolean значения в читаемый формат
+        vsm_text = "Да" if application_data.get('is_from_vsm') else "Нет" if application_data.get('is_from_vsm') is not None else ""
+        spbu_text = "Да" if application_data.get('is_from_spbu') else "Нет" if application_data.get('is_from_spbu') is not None else ""
+        
+        # Для поля общежития: показываем только если значение есть (не None)
+        dormitory_value = application_data.get('dormitory')
+        if dormitory_value is True:
+            dormitory_text = "Да"
+        elif dormitory_value is False:
+            dormitory_text = "Нет"
+        else:
+            dormitory_text = "Не применимо"  # Для студентов не из ВШМ
+        
+        return [
+            datetime.now().isoformat(),  # Timestamp
+            application_data.get('telegram_id', ''),  # User ID
+            application_data.get('telegram_username', ''),  # Username
+            application_data.get('full_name', ''),  # Full Name
+            application_data.get('first_name', ''),  # First Name
+            application_data.get('last_name', ''),  # Last Name
+            application_data.get('middle_name', ''),  # Middle Name
+            application_data.get('course', ''),  # Course
+            dormitory_text,  # Dormitory (старая позиция)
+            application_data.get('email', ''),  # Email
+            application_data.get('phone', ''),  # Phone
+            application_data.get('personal_qualities', ''),  # Personal Qualities
+            application_data.get('motivation', ''),  # Motivation
+            application_data.get('logistics_rating', ''),  # Logistics Rating
+            application_data.get('marketing_rating', ''),  # Marketing Rating
+            application_data.get('pr_rating', ''),  # PR Rating
+            application_data.get('program_rating', ''),  # Program Rating
+            application_data.get('partners_rating', ''),  # Partners Rating
+            application_data.get('created_at', ''),  # Created At
+            application_data.get('updated_at', ''),  # Updated At
+            vsm_text,  # Is From VSM (новые поля в конце)
+            spbu_text,  # Is From SPBU
+            application_data.get('university', '')  # University
+        ]
+    
+    async def upsert_rows(self, rows: Dict[str, list]) -> Dict[str, bool]:
+        """
+        Записывает строки заявок: существующие - одним batch_update, новые - одним append
+        
+        Перед обновлением User ID в строках из индекса проверяется одним batch_get,
+        при расхождении индекс перестраивается по колонке User ID.
+        
+        Args:
+            rows: Строки листа по telegram_id
+            
+        Returns:
+            Dict[str, bool]: Успех записи по каждому telegram_id
+        """
+        results = {user_id: False for user_id in rows}
+        try:
+            worksheet = await self._get_worksheet()
+            await self.row_index.ensure_built(lambda: self.call(worksheet.col_values, USER_ID_COLUMN))
+            existing_rows = await self.row_index.get_many(rows.keys())
+            if existing_rows and not await self._rows_match(worksheet, existing_rows):
+                # Строки отсортировали, удалили или вставили вручную - индекс указывает на чужие строки
+                logger.warning("🗂️ Индекс строк Google Sheets не совпадает с листом, перестраиваем")
+                await self.row_index.rebuild(await self.call(worksheet.col_values, USER_ID_COLUMN))
+                existing_rows = await self.row_index.get_many(rows.keys())
+        except Exception as e:
+            self._handle_error(e)
+            return results
+        
+        updates = []
+        updated_ids = []
+        appended_ids = []
+        for user_id, row_data in rows.items():
+            existing_row = existing_rows.get(user_id)
+            if existing_row:
+                updates.append({'range': f'A{existing_row}:{LAST_COLUMN}{existing_row}', 'values': [row_data]})
+                updated_ids.append(user_id)
+            else:
+                appended_ids.append(user_id)
+        
+        if updates:
             try:
-                # Получаем все записи
-                all_records = worksheet.get_all_records()
-                user_id = str(application_data.get('telegram_id'))
-                
-                # Ищем существующую запись
-                existing_row = None
-                for i, record in enumerate(all_records, start=2):  # start=2 because row 1 is headers
-                    if str(record.get('User ID')) == user_id:
-                        existing_row = i
-                        break
+                await self.call(worksheet.batch_update, updates, quota="write")
+                for user_id in updated_ids:
+                    results[user_id] = True
+                logger.info(f"🔄 Обновлено заявок в Google Sheets: {len(updated_ids)}")
+            except Exception as e:
+                self._handle_error(e)
+        
+        if appended_ids:
+            try:
+                response = await self.call(worksheet.append_rows, [rows[user_id] for user_id in appended_ids],
+                                           quota="write", idempotent=False)
+                for user_id in appended_ids:
+                    results[user_id] = True
+                logger.info(f"➕ Добавлено заявок в Google Sheets: {len(appended_ids)}")
                 
-                if existing_row:
-                    logger.info(f"🔄 Обновляем существующую запись в строке {existing_row}")
-                    update_method = "update"
+                # Строки добавляются подряд, начиная с первой строки из ответа
+                first_row = parse_updated_row(response)
+                if first_row:
+                    await self.row_index.set_many({
+                        user_id: first_row + offset for offset, user_id in enumerate(appended_ids)
+                    })
                 else:
-                    logger.info(f"➕ Добавляем новую запись")
-                    update_method = "insert"
-                    
+                    # Не удалось определить строки - индекс будет перестроен при следующей выгрузке
+                    await self.row_index.invalidate()
             except Exception as e:
-                logger.warning(f"⚠️ Не удалось проверить существующие записи: {e}")
-                update_method = "insert"
-            
-            # Подготавливаем данные для записи
-            logger.info(f"📝 Подготавливаем данные для записи...")
-            
-            # Преобразуем boolean значения в читаемый формат
-            vsm_text = "Да" if application_data.get('is_from_vsm') else "Нет" if application_data.get('is_from_vsm') is not None else ""
-            spbu_text = "Да" if application_data.get('is_from_spbu') else "Нет" if application_data.get('is_from_spbu') is not None else ""
-            
-            # Для поля общежития: показываем только если значение есть (не None)
-            dormitory_value = application_data.get('dormitory')
-            if dormitory_value is True:
-                dormitory_text = "Да"
-            elif dormitory_value is False:
-                dormitory_text = "Нет"
-            else:
-                dormitory_text = "Не применимо"  # Для студентов не из ВШМ
-            
-            # Подготавливаем данные в зависимости от формата листа
-            if worksheet_name == "TEST":
-                # Новый формат для TEST листа
-                row_data = [
-                    datetime.now().isoformat(),  # Timestamp
-                    application_data.get('telegram_id', ''),  # User ID
-                    application_data.get('telegram_username', ''),  # Username
-                    application_data.get('full_name', ''),  # Full Name
-                    application_data.get('first_name', ''),  # First Name
-                    application_data.get('last_name', ''),  # Last Name
-                    application_data.get('middle_name', ''),  # Middle Name
-                    application_data.get('course', ''),  # Course
-                    vsm_text,  # Is From VSM
-                    spbu_text,  # Is From SPBU
-                    application_data.get('university', ''),  # University
-                    dormitory_text,  # Dormitory
-                    application_data.get('email', ''),  # Email
-                    application_data.get('phone', ''),  # Phone
-                    application_data.get('personal_qualities', ''),  # Personal Qualities
-                    application_data.get('motivation', ''),  # Motivation
-                    application_data.get('logistics_rating', ''),  # Logistics Rating
-                    application_data.get('marketing_rating', ''),  # Marketing Rating
-                    application_data.get('pr_rating', ''),  # PR Rating
-                    application_data.get('program_rating', ''),  # Program Rating
-                    application_data.get('partners_rating', ''),  # Partners Rating
-                    application_data.get('created_at', ''),  # Created At
-                    application_data.get('updated_at', '')  # Updated At
-                ]
-            else:
-                # Старый формат для APPLICATION листа (совместимость)
-                row_data = [
-                    datetime.now().isoformat(),  # Timestamp
-                    application_data.get('telegram_id', ''),  # User ID
-                    application_data.get('telegram_username', ''),  # Username
-                    application_data.get('full_name', ''),  # Full Name
-                    application_data.get('first_name', ''),  # First Name
-                    application_data.get('last_name', ''),  # Last Name
-                    application_data.get('middle_name', ''),  # Middle Name
-                    application_data.get('course', ''),  # Course
-                    dormitory_text,  # Dormitory (старая позиция)
-                    application_data.get('email', ''),  # Email
-                    application_data.get('phone', ''),  # Phone
-                    application_data.get('personal_qualities', ''),  # Personal Qualities
-                    application_data.get('motivation', ''),  # Motivation
-                    application_data.get('logistics_rating', ''),  # Logistics Rating
-                    application_data.get('marketing_rating', ''),  # Marketing Rating
-                    application_data.get('pr_rating', ''),  # PR Rating
-                    application_data.get('program_rating', ''),  # Program Rating
-                    application_data.get('partners_rating', ''),  # Partners Rating
-                    application_data.get('created_at', ''),  # Created At
-                    application_data.get('updated_at', ''),  # Updated At
-                    vsm_text,  # Is From VSM (новые поля в конце)
-                    spbu_text,  # Is From SPBU
-                    application_data.get('university', '')  # University
-                ]
+                self._handle_error(e)
+        
+        return results
+    
+    async def _rows_match(self, worksheet, rows: Dict[str, int]) -> bool:
+        """Проверить одним batch_get, что в строках из индекса записаны те же User ID"""
+        ranges = [f"{USER_ID_COLUMN_LETTER}{row}" for row in rows.values()]
+        cells = await self.call(worksheet.batch_get, ranges)
+        for user_id, cell in zip_longest(rows, cells, fillvalue=[]):
+            value = str(cell[0][0]).strip() if cell and cell[0] else ""
+            if value != user_id:
+                return False
+        return True
+    
+    async def read_updated_at(self) -> Dict[str, str]:
+        """
+        Значения 'Updated At' по telegram_id для всех строк листа
+        
+        Читаются только две колонки (User ID и Updated At) одним batch_get, а не весь лист.
+        """
+        worksheet = await self._get_worksheet()
+        columns = [column_letter(column) for column in (USER_ID_COLUMN, UPDATED_AT_COLUMN)]
+        user_ids, updated_at = await self.call(worksheet.batch_get, [f"{column}2:{column}" for column in columns])
+        
+        result = {}
+        for user_id_cell, updated_at_cell in zip_longest(user_ids, updated_at, fillvalue=[]):
+            user_id = str(user_id_cell[0]).strip() if user_id_cell else ""
+            if user_id:
+                result[user_id] = str(updated_at_cell[0]) if updated_at_cell else ""
+        return result
+    
+    async def add_application_to_sheet(self, application_data: Dict[str, Any]) -> bool:
+        """
+        Добавляет данные заявки в Google Таблицу
+        
+        Запись идет через SheetsBatchWriter, поэтому заявки, выгружаемые одновременно,
+        попадают в лист одним запросом.
+        
+        Args:
+            application_data: Словарь с данными заявки
             
-            logger.info(f"📤 Отправляем данные в Google Sheets...")
+        Returns:
+            bool: True если успешно, False в случае ошибки
+        """
+        try:
+            logger.info(f"👤 Выгрузка заявки пользователя {application_data.get('telegram_id')} (@{application_data.get('telegram_username')})")
+            row_data = self.build_row(application_data)
+            success = await self.batch_writer.write(str(application_data.get('telegram_id')), row_data)
+            if success:
+                logger.info(f"🎉 Заявка пользователя {application_data.get('telegram_id')} успешно сохранена в Google Sheets")
+            return success
             
-            if update_method == "update" and existing_row:
-                # Обновляем существующую строку
-                worksheet.update(f'A{existing_row}:W{existing_row}', [row_data])
-                logger.info(f"🔄 Заявка пользователя {application_data.get('telegram_id')} обновлена в Google Sheets")
+        except Exception as e:
+            self._handle_error(e)
+            return False
+    
+    def _handle_error(self, e: Exception):
+        """Детальная диагностика ошибок Google Sheets"""
+        if isinstance(e, CircuitOpenError):
+            logger.warning(f"🔌 Запись в Google Sheets отложена: {e}")
+            return
+        
+        error_msg = str(e)
+        logger.error(f"❌ Ошибка записи в Google Sheets: {e}")
+        
+        if is_not_found_error(e):
+            # Таблицу или лист удалили/пересоздали - хендлы откроются заново при следующей записи
+            self.invalidate_handles()
+        
+        # Детальная диагностика ошибок Google Sheets
+        if "quotaExceeded" in error_msg:
+            logger.error("📊 ОШИБКА: Превышены лимиты Google Sheets API")
+            logger.error("💡 РЕШЕНИЕ: Подождите и повторите попытку позже")
+        elif "403" in error_msg:
+            if "Forbidden" in error_msg:
+                logger.error("🚫 ОШИБКА: Нет доступа к Google Sheets (403 Forbidden)")
+                logger.error("💡 РЕШЕНИЕ: Проверьте права доступа Service Account к таблице")
             else:
-                # Добавляем новую строку
-                worksheet.append_row(row_data)
-                logger.info(f"➕ Заявка пользователя {application_data.get('telegram_id')} добавлена в Google Sheets")
-            
-            logger.info(f"🎉 Заявка пользователя {application_data.get('telegram_id')} успешно сохранена в Google Sheets")
-            return True
+                logger.error("🚫 ОШИБКА 403: Доступ запрещен")
+        elif "401" in error_msg:
+            logger.error("🔐 ОШИБКА: Ошибка авторизации Google Sheets (401)")
+            logger.error("💡 РЕШЕНИЕ: Проверьте учетные данные Service Account")
+        elif "404" in error_msg:
+            logger.error("📋 ОШИБКА: Таблица Google Sheets не найдена (404)")
+            logger.error(f"💡 РЕШЕНИЕ: Проверьте ID таблицы: {self.spreadsheet_id}")
+        elif "500" in error_msg:
+            logger.error("🔧 ОШИБКА: Внутренняя ошибка сервера Google (500)")
+            logger.error("💡 РЕШЕНИЕ: Повторите попытку позже")
+        elif "PERMISSION_DENIED" in error_msg:
+            logger.error("🔒 ОШИБКА: Нет прав доступа к таблице")
+            logger.error("💡 РЕШЕНИЕ: Предоставьте Service Account доступ к таблице")
+        else:
+            logger.error(f"❓ НЕИЗВЕСТНАЯ ОШИБКА Google Sheets: {error_msg}")
+
+
+class SheetsBatchWriter:
+    """
+    Копит строки заявок и записывает их в лист пачкой:
+    через max_delay секунд после первой строки или сразу при наборе max_batch_size строк
+    """
+    
+    def __init__(self, service: "GoogleSheetsService", max_batch_size: int = 50, max_delay: float = 1.0):
+        """
+        Args:
+            service: Сервис Google Sheets
+            max_batch_size: Максимум строк в одном запросе
+            max_delay: Сколько ждать накопления пачки (секунды)
+        """
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        
+        # telegram_id -> (строка, ожидающие результата)
+        self._pending: Dict[str, tuple[list, list[asyncio.Future]]] = {}
+        self._batch_full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+    
+    async def write(self, user_id: str, row_data: list) -> bool:
+        """Поставить строку в очередь и дождаться результата записи"""
+        future = asyncio.get_running_loop().create_future()
+        if user_id in self._pending:
+            # Повторная выгрузка того же пользователя - пишем последнюю версию строки
+            _, waiters = self._pending[user_id]
+            self._pending[user_id] = (row_data, waiters + [future])
+        else:
+            self._pending[user_id] = (row_data, [future])
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+        self._ensure_timer()
+        return await future
+    
+    def _ensure_timer(self):
+        if self._pending and (self._timer is None or self._timer.done()):
+            self._timer = asyncio.create_task(self._flush_later())
+    
+    async def _flush_later(self):
+        try:
+            await asyncio.wait_for(self._batch_full.wait(), timeout=self.max_delay)
+        except asyncio.TimeoutError:
+            pass
+        await self.flush()
+        # Строки, пришедшие во время записи, уходят следующей пачкой
+        self._timer = None
+        self._ensure_timer()
+    
+    async def flush(self):
+        """Записать очередную пачку накопленных строк"""
+        async with self._flush_lock:
+            # Берем не больше max_batch_size строк, остальные уйдут следующей пачкой
+            user_ids = list(self._pending)[:self.max_batch_size]
+            batch = {user_id: self._pending.pop(user_id) for user_id in user_ids}
+            if len(self._pending) < self.max_batch_size:
+                self._batch_full.clear()
+            if not batch:
+                return
             
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"❌ Ошибка добавления заявки в Google Sheets: {e}")
+            try:
+                results = await self.service.upsert_rows({user_id: row for user_id, (row, _) in batch.items()})
+            except Exception as e:
+                logger.error(f"❌ Ошибка пакетной записи в Google Sheets: {e}")
+                results = {}
             
-            # Детальная диагностика ошибок Google Sheets
-            if "quotaExceeded" in error_msg:
-                logger.error("📊 ОШИБКА: Превышены лимиты Google Sheets API")
-                logger.error("💡 РЕШЕНИЕ: Подождите и повторите попытку позже")
-            elif "403" in error_msg:
-                if "Forbidden" in error_msg:
-                    logger.error("🚫 ОШИБКА: Нет доступа к Google Sheets (403 Forbidden)")
-                    logger.error("💡 РЕШЕНИЕ: Проверьте права доступа Service Account к таблице")
-                else:
-                    logger.error("🚫 ОШИБКА 403: Доступ запрещен")
-            elif "401" in error_msg:
-                logger.error("🔐 ОШИБКА: Ошибка авторизации Google Sheets (401)")
-                logger.error("💡 РЕШЕНИЕ: Проверьте учетные данные Service Account")
-            elif "404" in error_msg:
-                logger.error("📋 ОШИБКА: Таблица Google Sheets не найдена (404)")
-                logger.error(f"💡 РЕШЕНИЕ: Проверьте ID таблицы: {self.spreadsheet_id}")
-            elif "500" in error_msg:
-                logger.error("🔧 ОШИБКА: Внутренняя ошибка сервера Google (500)")
-                logger.error("💡 РЕШЕНИЕ: Повторите попытку позже")
-            elif "PERMISSION_DENIED" in error_msg:
-                logger.error("🔒 ОШИБКА: Нет прав доступа к таблице")
-                logger.error("💡 РЕШЕНИЕ: Предоставьте Service Account доступ к таблице")
-            else:
-                logger.error(f"❓ НЕИЗВЕСТНАЯ ОШИБКА Google Sheets: {error_msg}")
-                
-            return False
+            for user_id, (_, waiters) in batch.items():
+                for future in waiters:
+                    if not future.done():
+                        future.set_result(results.get(user_id, False))
 
 
-def setup_google_sheets_service(config) -> Optional[GoogleSheetsService]:
+def setup_google_sheets_service(config, redis: Optional[Redis] = None) -> Optional[GoogleSheetsService]:
     """
     Настройка Google Sheets сервиса
     
     Args:
         config: Конфигурация приложения
+        redis: Клиент Redis для индекса строк (опционально)
         
     Returns:
         GoogleSheetsService или None в случае ошибки
@@ -254,14 +827,28 @@ def setup_google_sheets_service(config) -> Optional[GoogleSheetsService]:
             logger.warning("Google Sheets не настроен в конфигурации")
             return None
         
+        client = None
+        if config.google.sheets_backend == "memory":
+            client = create_memory_client(config)
         # Проверяем существование файла учетных данных
-        if not os.path.exists(config.google.credentials_path):
+        elif not os.path.exists(config.google.credentials_path):
             logger.warning(f"Файл учетных данных Google не найден: {config.google.credentials_path}")
             return None
         
         return GoogleSheetsService(
             credentials_path=config.google.credentials_path,
-            spreadsheet_id=config.google.spreadsheet_id
+            spreadsheet_id=config.google.spreadsheet_id,
+            max_workers=config.google.max_workers,
+            redis=redis,
+            write_batch_size=config.google.write_batch_size,
+            write_batch_delay=config.google.write_batch_delay,
+            read_requests_per_minute=config.google.read_requests_per_minute,
+            write_requests_per_minute=config.google.write_requests_per_minute,
+            max_retries=config.google.max_retries,
+            request_timeout=config.google.request_timeout,
+            breaker_failure_threshold=config.google.breaker_failure_threshold,
+            breaker_reset_timeout=config.google.breaker_reset_timeout,
+            client=client
         )
         
     except Exception as e:
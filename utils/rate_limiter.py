@@ -0,0 +1,50 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Асинхронный token bucket для ограничения частоты запросов к внешним API"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute: Сколько запросов в минуту разрешено в среднем
+            capacity: Максимальный всплеск запросов (по умолчанию - минутная квота)
+        """
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+        self.throttled = 0  # Сколько запросов ждали свободного токена
+        self.total_wait_time = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    @property
+    def tokens(self) -> float:
+        """Текущий доступный бюджет запросов"""
+        self._refill()
+        return self._tokens
+
+    async def acquire(self):
+        """Дождаться токена и списать его (ожидающие обслуживаются по очереди)"""
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                wait_time = (1 - self._tokens) / self.rate
+                self.throttled += 1
+                self.total_wait_time += wait_time
+                await asyncio.sleep(wait_time)
+                self._refill()
+            self._tokens -= 1
+
+    def drain(self):
+        """Обнулить бюджет (например, после ответа 429 от API)"""
+        self._refill()
+        self._tokens = min(self._tokens, 0)
@@ -0,0 +1,288 @@
+"""
+Бэкенды Google Sheets для GoogleSheetsService
+
+Сервис работает с клиентом через подмножество API gspread: client.open_by_key(),
+spreadsheet.worksheet()/add_worksheet()/worksheets()/batch_update(), worksheet.update()/batch_update()/
+append_row()/append_rows()/batch_get()/col_values()/get_all_values()/clear()/resize()/format().
+
+- "gspread" - настоящий Google Sheets через сервисный аккаунт
+- "memory" - локальный эмулятор в памяти: задержка ответа, минутные квоты (429) и сбои сервера (503)
+  для нагрузочного тестирования выгрузки без сети и учетных данных
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List
+
+import gspread
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+logger = logging.getLogger(__name__)
+
+SHEETS_BACKENDS = ("gspread", "memory")
+
+
+class _EmulatedResponse:
+    """Ответ API в том виде, в каком его разбирает gspread.exceptions.APIError"""
+
+    def __init__(self, status_code: int, status: str, message: str):
+        self.status_code = status_code
+        self._body = {"error": {"code": status_code, "message": message, "status": status}}
+        self.text = json.dumps(self._body)
+
+    def json(self) -> Dict[str, Any]:
+        return self._body
+
+
+def _api_error(status_code: int, status: str, message: str) -> gspread.exceptions.APIError:
+    return gspread.exceptions.APIError(_EmulatedResponse(status_code, status, message))
+
+
+class InMemorySheetsClient:
+    """
+    Эмулятор Google Sheets API в памяти (совместим с используемой частью gspread.Client)
+
+    Каждый запрос выполняется синхронно, как в gspread: ждет latency (+ случайный джиттер),
+    учитывается в минутной квоте чтения или записи и с вероятностью error_rate завершается 503.
+    Таблицы создаются при первом открытии и живут, пока жив клиент.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        latency_jitter: float = 0.1,
+        read_requests_per_minute: int = 60,
+        write_requests_per_minute: int = 60,
+        error_rate: float = 0.0,
+    ):
+        """
+        Args:
+            latency: Средняя задержка ответа (секунды)
+            latency_jitter: Случайный разброс задержки (секунды)
+            read_requests_per_minute: Квота на чтение, сверх нее запросы получают 429 (0 - без квоты)
+            write_requests_per_minute: Квота на запись, сверх нее запросы получают 429 (0 - без квоты)
+            error_rate: Доля запросов, завершающихся 503 (0..1)
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.quotas = {"read": read_requests_per_minute, "write": write_requests_per_minute}
+        self.error_rate = error_rate
+
+        self._lock = threading.Lock()
+        self._requests: Dict[str, deque] = {"read": deque(), "write": deque()}
+        self._spreadsheets: Dict[str, "InMemorySpreadsheet"] = {}
+
+        # Счетчики для отчетов бенчмарков
+        self.stats = {"read": 0, "write": 0, "quota_errors": 0, "server_errors": 0}
+
+    def request(self, kind: str):
+        """Эмуляция одного HTTP-запроса: квота, сбой сервера, задержка"""
+        with self._lock:
+            now = time.monotonic()
+            window = self._requests[kind]
+            while window and now - window[0] >= 60:
+                window.popleft()
+
+            quota = self.quotas[kind]
+            if quota and len(window) >= quota:
+                self.stats["quota_errors"] += 1
+                raise _api_error(
+                    429, "RESOURCE_EXHAUSTED",
+                    f"Quota exceeded for quota metric '{kind.capitalize()} requests' "
+                    f"and limit '{kind.capitalize()} requests per minute per user'"
+                )
+            window.append(now)
+            self.stats[kind] += 1
+
+            failed = self.error_rate and random.random() < self.error_rate
+            if failed:
+                self.stats["server_errors"] += 1
+
+        time.sleep(max(0.0, self.latency + random.uniform(-self.latency_jitter, self.latency_jitter)))
+        if failed:
+            raise _api_error(503, "UNAVAILABLE", "The service is currently unavailable.")
+
+    def open_by_key(self, key: str) -> "InMemorySpreadsheet":
+        self.request("read")
+        with self._lock:
+            if key not in self._spreadsheets:
+                self._spreadsheets[key] = InMemorySpreadsheet(self, key)
+            return self._spreadsheets[key]
+
+
+class InMemorySpreadsheet:
+    """Таблица эмулятора"""
+
+    def __init__(self, client: InMemorySheetsClient, spreadsheet_id: str):
+        self.client = client
+        self.id = spreadsheet_id
+        self.title = f"In-memory spreadsheet {spreadsheet_id}"
+        self._worksheets: Dict[str, "InMemoryWorksheet"] = {}
+
+    def worksheet(self, title: str) -> "InMemoryWorksheet":
+        self.client.request("read")
+        if title not in self._worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def worksheets(self, exclude_hidden: bool = False) -> List["InMemoryWorksheet"]:
+        self.client.request("read")
+        return list(self._worksheets.values())
+
+    def add_worksheet(self, title: str, rows: int, cols: int, index: Optional[int] = None) -> "InMemoryWorksheet":
+        self.client.request("write")
+        if title in self._worksheets:
+            raise _api_error(400, "INVALID_ARGUMENT",
+                             f'Invalid requests[0].addSheet: A sheet with the name "{title}" already exists.')
+        worksheet = InMemoryWorksheet(self, title, int(rows), int(cols))
+        self._worksheets[title] = worksheet
+        return worksheet
+
+    def batch_update(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        # Форматирование эмулятор не хранит, учитывается только запрос
+        self.client.request("write")
+        return {"spreadsheetId": self.id, "replies": [{} for _ in body.get("requests", [])]}
+
+
+class InMemoryWorksheet:
+    """Лист эмулятора: значения хранятся строками, сетка ограничена row_count x col_count"""
+
+    def __init__(self, spreadsheet: InMemorySpreadsheet, title: str, rows: int, cols: int):
+        self.spreadsheet = spreadsheet
+        self.client = spreadsheet.client
+        self.title = title
+        self.row_count = rows
+        self.col_count = cols
+        self._rows: List[List[str]] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cell(value: Any) -> str:
+        return "" if value is None else str(value)
+
+    def _grid_range(self, range_name: str) -> tuple[int, int, int, int]:
+        """Диапазон A1 -> (первая строка, последняя строка + 1, первая колонка, последняя колонка + 1), с нуля"""
+        grid = a1_range_to_grid_range(range_name.split("!")[-1])
+        return (
+            grid.get("startRowIndex", 0),
+            grid.get("endRowIndex", self.row_count),
+            grid.get("startColumnIndex", 0),
+            grid.get("endColumnIndex", self.col_count),
+        )
+
+    def _write(self, start_row: int, start_col: int, values: List[List[Any]]):
+        end_row = start_row + len(values)
+        end_col = start_col + max((len(row) for row in values), default=0)
+        if end_row > self.row_count or end_col > self.col_count:
+            raise _api_error(400, "INVALID_ARGUMENT",
+                             f"Range ('{self.title}'!{rowcol_to_a1(end_row, end_col)}) exceeds grid limits. "
+                             f"Max rows: {self.row_count}, max columns: {self.col_count}")
+        while len(self._rows) < end_row:
+            self._rows.append([])
+        for offset, row in enumerate(values):
+            target = self._rows[start_row + offset]
+            if len(target) < start_col + len(row):
+                target.extend([""] * (start_col + len(row) - len(target)))
+            target[start_col:start_col + len(row)] = [self._cell(value) for value in row]
+
+    def _read(self, range_name: str) -> List[List[str]]:
+        start_row, end_row, start_col, end_col = self._grid_range(range_name)
+        values = [row[start_col:end_col] for row in self._rows[start_row:end_row]]
+        # Как и API, отбрасываем пустые строки в конце диапазона
+        while values and not any(values[-1]):
+            values.pop()
+        return values
+
+    def _updated_range(self, start_row: int, start_col: int, values: List[List[Any]]) -> str:
+        end_col = start_col + max((len(row) for row in values), default=1)
+        return (f"'{self.title}'!{rowcol_to_a1(start_row + 1, start_col + 1)}:"
+                f"{rowcol_to_a1(start_row + len(values), end_col)}")
+
+    def update(self, values: List[List[Any]], range_name: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        self.client.request("write")
+        start_row, _, start_col, _ = self._grid_range(range_name or "A1")
+        with self._lock:
+            self._write(start_row, start_col, values)
+        return {"updatedRange": self._updated_range(start_row, start_col, values), "updatedRows": len(values)}
+
+    def batch_update(self, data: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        self.client.request("write")
+        with self._lock:
+            for item in data:
+                start_row, _, start_col, _ = self._grid_range(item["range"])
+                self._write(start_row, start_col, item["values"])
+        return {"totalUpdatedRows": sum(len(item["values"]) for item in data)}
+
+    def append_rows(self, values: List[List[Any]], **kwargs) -> Dict[str, Any]:
+        self.client.request("write")
+        with self._lock:
+            # Строки добавляются после последней непустой строки, сетка расширяется
+            start_row = len(self._rows)
+            while start_row and not any(self._rows[start_row - 1]):
+                start_row -= 1
+            self.row_count = max(self.row_count, start_row + len(values))
+            self.col_count = max(self.col_count, max((len(row) for row in values), default=0))
+            self._write(start_row, 0, values)
+        return {"updates": {"updatedRange": self._updated_range(start_row, 0, values), "updatedRows": len(values)}}
+
+    def append_row(self, values: List[Any], **kwargs) -> Dict[str, Any]:
+        return self.append_rows([values], **kwargs)
+
+    def batch_get(self, ranges: List[str], **kwargs) -> List[List[List[str]]]:
+        self.client.request("read")
+        with self._lock:
+            return [self._read(range_name) for range_name in ranges]
+
+    def col_values(self, col: int, **kwargs) -> List[str]:
+        self.client.request("read")
+        with self._lock:
+            values = [row[col - 1] if len(row) >= col else "" for row in self._rows]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def get_all_values(self, range_name: Optional[str] = None, **kwargs) -> List[List[str]]:
+        self.client.request("read")
+        with self._lock:
+            if range_name:
+                return self._read(range_name)
+            width = max((len(row) for row in self._rows), default=0)
+            return [row + [""] * (width - len(row)) for row in self._rows]
+
+    def clear(self) -> Dict[str, Any]:
+        self.client.request("write")
+        with self._lock:
+            self._rows = []
+        return {}
+
+    def resize(self, rows: Optional[int] = None, cols: Optional[int] = None) -> Dict[str, Any]:
+        self.client.request("write")
+        with self._lock:
+            if rows is not None:
+                self.row_count = int(rows)
+                del self._rows[self.row_count:]
+            if cols is not None:
+                self.col_count = int(cols)
+                self._rows = [row[:self.col_count] for row in self._rows]
+        return {}
+
+    def format(self, ranges: Any, format: Dict[str, Any]) -> Dict[str, Any]:
+        self.client.request("write")
+        return {}
+
+
+def create_memory_client(config) -> InMemorySheetsClient:
+    """Эмулятор Google Sheets по настройкам GOOGLE_MEMORY_*"""
+    logger.info(f"🧪 Google Sheets: локальный эмулятор (задержка {config.google.memory_latency:.2f} с, "
+                f"квота {config.google.memory_requests_per_minute}/мин, сбои {config.google.memory_error_rate:.0%})")
+    return InMemorySheetsClient(
+        latency=config.google.memory_latency,
+        latency_jitter=config.google.memory_latency / 2,
+        read_requests_per_minute=config.google.memory_requests_per_minute,
+        write_requests_per_minute=config.google.memory_requests_per_minute,
+        error_rate=config.google.memory_error_rate,
+    )
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import random
+from typing import Optional, Dict, Any
+
+from database.db import Database
+from database.models import Application, User
+from database.repositories import SheetsExportOutboxRepository
+from utils.google_services import GoogleSheetsService, CircuitBreaker
+from utils.logging_config import log_db_operation, log_error
+
+logger = logging.getLogger(__name__)
+
+
+def build_sheets_payload(application: Application, user: User) -> Dict[str, Any]:
+    """Подготовка данных заявки для Google Sheets"""
+    return {
+        'telegram_id': user.telegram_id,
+        'telegram_username': user.telegram_username or "",
+        'full_name': application.full_name,
+        'first_name': application.first_name,
+        'last_name': application.last_name,
+        'middle_name': application.middle_name,
+        'course': application.course,
+        'is_from_vsm': application.is_from_vsm,
+        'is_from_spbu': application.is_from_spbu,
+        'university': application.university,
+        'dormitory': application.dormitory,
+        'email': application.email,
+        'phone': application.phone,
+        'personal_qualities': application.personal_qualities,
+        'motivation': application.motivation,
+        'logistics_rating': application.logistics_rating,
+        'marketing_rating': application.marketing_rating,
+        'pr_rating': application.pr_rating,
+        'program_rating': application.program_rating,
+        'partners_rating': application.partners_rating,
+        'created_at': application.created_at.isoformat(),
+        'updated_at': application.updated_at.isoformat(),
+    }
+
+
+class SheetsExportWorker:
+    """Фоновый воркер, выгружающий заявки из outbox-таблицы в Google Sheets"""
+
+    def __init__(
+        self,
+        db: Database,
+        google_sheets_service: GoogleSheetsService,
+        poll_interval: float = 2.0,
+        batch_size: int = 20,
+        max_backoff: float = 600.0,
+        max_attempts: int = 10,
+        lease: float = 600.0,
+    ):
+        """
+        Args:
+            db: Подключение к базе данных
+            google_sheets_service: Сервис Google Sheets
+            poll_interval: Пауза между опросами пустой очереди (секунды)
+            batch_size: Сколько записей забирать за один проход
+            max_backoff: Максимальная задержка между повторными попытками (секунды)
+            max_attempts: После стольких неудачных попыток выгрузка записи останавливается
+            lease: На сколько секунд забранные записи скрыты от других воркеров (дольше самой
+                долгой выгрузки порции с ожиданием квоты и повторами)
+        """
+        self.db = db
+        self.google_sheets_service = google_sheets_service
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.lease = lease
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        """Запуск воркера в фоне"""
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run(), name="sheets_export_worker")
+            logger.info("📤 Воркер выгрузки в Google Sheets запущен")
+
+    async def stop(self):
+        """Остановка воркера (текущий проход дорабатывает до конца)"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        logger.info("📤 Воркер выгрузки в Google Sheets остановлен")
+
+    def _retry_delay(self, attempts: int) -> float:
+        """Экспоненциальная задержка с джиттером"""
+        delay = min(self.max_backoff, 5 * (2 ** attempts))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _run(self):
+        breaker = self.google_sheets_service.breaker
+        while not self._stopping.is_set():
+            # Пока Google недоступен, очередь не трогаем - записи дождутся восстановления в БД
+            if breaker.is_open:
+                await self._sleep(breaker.retry_after)
+                continue
+
+            try:
+                processed = await self.process_batch()
+            except Exception as e:
+                log_error(e, "Ошибка в воркере выгрузки в Google Sheets")
+                processed = 0
+
+            # Если очередь разобрана не до конца - сразу берем следующую порцию
+            if processed >= self.batch_size:
+                continue
+            await self._sleep(self.poll_interval)
+
+    async def _sleep(self, timeout: float):
+        """Пауза, прерываемая остановкой воркера"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _export_entry(self, entry) -> Optional[str]:
+        """Выгрузить одну заявку, возвращает текст ошибки или None"""
+        application = entry.application
+        try:
+            payload = build_sheets_payload(application, application.user)
+            success = await self.google_sheets_service.add_application_to_sheet(payload)
+            return None if success else "Google Sheets export failed"
+        except Exception as e:
+            log_error(e, "Ошибка при экспорте заявки в Google Sheets", application.user.telegram_id)
+            return f"{type(e).__name__}: {e}"
+
+    async def process_batch(self) -> int:
+        """
+        Выгрузить одну порцию заявок из очереди, возвращает число обработанных записей
+
+        Записи забираются в короткой транзакции с арендой (next_attempt_at), запросы к Google
+        идут без открытой сессии, результат записывается второй короткой транзакцией:
+        ожидание квоты и повторы не держат блокировки строк и соединение из пула.
+        """
+        session = await self.db.get_session()
+        try:
+            entries = await SheetsExportOutboxRepository(session).claim_pending(self.batch_size, self.lease)
+            await session.commit()
+        finally:
+            await session.close()
+        if not entries:
+            return 0
+
+        # Выгружаем порцию параллельно: SheetsBatchWriter объединит строки в один запрос
+        errors = await asyncio.gather(*(self._export_entry(entry) for entry in entries))
+
+        session = await self.db.get_session()
+        try:
+            await self._record_results(SheetsExportOutboxRepository(session), entries, errors)
+            await session.commit()
+        finally:
+            await session.close()
+        return len(entries)
+
+    async def _record_results(self, outbox_repo: SheetsExportOutboxRepository, entries: list, errors: list):
+        """Записать результат выгрузки порции: выгружено, отложено, повтор или остановка"""
+        breaker = self.google_sheets_service.breaker
+        exported, deferred = [], []
+        for entry, error in zip(entries, errors):
+            application = entry.application
+            if error is None:
+                exported.append(entry.id)
+                log_db_operation("GOOGLE_SHEETS", "applications",
+                                 f"application exported to Google Sheets: {application.full_name}",
+                                 application.user.telegram_id)
+            elif breaker.state != CircuitBreaker.CLOSED:
+                # Ошибка из-за недоступности Google - откладываем, не расходуя попытки
+                deferred.append(entry.id)
+            elif entry.attempts + 1 >= self.max_attempts:
+                # Ошибка в самой заявке (например, 400 на некорректное значение) - повторы только тратят квоту
+                await outbox_repo.mark_failed(entry.id, error)
+                logger.error(f"❌ Выгрузка заявки {application.id} в Google Sheets остановлена "
+                             f"после {entry.attempts + 1} попыток: {error}")
+            else:
+                delay = self._retry_delay(entry.attempts)
+                await outbox_repo.schedule_retry(entry.id, error, delay)
+                logger.warning(f"⏳ Выгрузка заявки {application.id} отложена на {delay:.0f} с "
+                               f"(попытка {entry.attempts + 1}): {error}")
+
+        if exported:
+            await outbox_repo.mark_exported(exported)
+        if deferred:
+            await outbox_repo.defer(deferred, max(breaker.retry_after, self.poll_interval))
+
+
+def setup_sheets_export_worker(config, db: Database,
+                               google_sheets_service: Optional[GoogleSheetsService]) -> Optional[SheetsExportWorker]:
+    """
+    Создание воркера выгрузки в Google Sheets
+
+    Returns:
+        SheetsExportWorker или None, если Google Sheets не настроен
+    """
+    if not google_sheets_service:
+        logger.warning("Google Sheets не настроен, заявки остаются в очереди выгрузки")
+        return None
+
+    return SheetsExportWorker(
+        db=db,
+        google_sheets_service=google_sheets_service,
+        poll_interval=config.google.export_poll_interval,
+        batch_size=config.google.export_batch_size,
+        max_attempts=config.google.export_max_attempts,
+        lease=config.google.export_lease,
+    )
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from typing import Optional
+
+from database.db import Database
+from database.repositories import ApplicationRepository, SyncWatermarkRepository
+from utils.google_services import GoogleSheetsService
+from utils.logging_config import log_db_operation, log_error
+from utils.sheets_export import build_sheets_payload
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = "sheets_reconcile"
+
+
+class SheetsReconciler:
+    """
+    Периодическая сверка заявок в БД с Google Sheets
+
+    Берет заявки, измененные после сохраненной отметки (updated_at, id), сверяет их с листом
+    по колонкам User ID и Updated At и дозаписывает недостающие или устаревшие строки пачками.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        google_sheets_service: GoogleSheetsService,
+        interval: float = 300.0,
+        batch_size: int = 500,
+    ):
+        """
+        Args:
+            db: Подключение к базе данных
+            google_sheets_service: Сервис Google Sheets
+            interval: Пауза между сверками (секунды)
+            batch_size: Сколько заявок сверять за один проход
+        """
+        self.db = db
+        self.google_sheets_service = google_sheets_service
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        """Запуск периодической сверки в фоне"""
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run(), name="sheets_reconciler")
+            logger.info("🔍 Сверка БД с Google Sheets запущена")
+
+    async def stop(self):
+        """Остановка сверки"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        logger.info("🔍 Сверка БД с Google Sheets остановлена")
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                checked = await self.run_once()
+            except Exception as e:
+                log_error(e, "Ошибка сверки БД с Google Sheets")
+                checked = 0
+
+            # Если накопилось больше одной порции изменений - сразу сверяем следующую
+            if checked >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> int:
+        """Сверить одну порцию измененных заявок, возвращает число проверенных заявок"""
+        if self.google_sheets_service.breaker.is_open:
+            return 0
+
+        session = await self.db.get_session()
+        try:
+            watermark_repo = SyncWatermarkRepository(session)
+            last_updated_at, last_id = await watermark_repo.get(WATERMARK_NAME)
+
+            app_repo = ApplicationRepository(session)
+            applications = await app_repo.get_updated_since(last_updated_at, last_id, self.batch_size)
+            if not applications:
+                return 0
+
+            # Лист читаем только когда есть что сверять, и только две колонки
+            sheet_updated_at = await self.google_sheets_service.read_updated_at()
+
+            # У пользователя в листе одна строка - сверяем по последней версии заявки
+            payloads = {}
+            for application in applications:
+                payload = build_sheets_payload(application, application.user)
+                payloads[str(payload['telegram_id'])] = payload
+
+            stale = {
+                user_id: payload for user_id, payload in payloads.items()
+                if sheet_updated_at.get(user_id) != payload['updated_at']
+            }
+
+            if stale:
+                writer = self.google_sheets_service.batch_writer
+                results = await asyncio.gather(*(
+                    writer.write(user_id, self.google_sheets_service.build_row(payload))
+                    for user_id, payload in stale.items()
+                ))
+                repaired = sum(results)
+                log_db_operation("GOOGLE_SHEETS", "applications",
+                                 f"reconcile: {len(applications)} checked, {len(stale)} stale, {repaired} repaired")
+                if repaired < len(stale):
+                    # Отметку не двигаем - неисправленные строки попадут в следующую сверку
+                    logger.warning(f"⚠️ Сверка с Google Sheets: исправлено {repaired} из {len(stale)} строк")
+                    return 0
+
+            last = applications[-1]
+            await watermark_repo.set(WATERMARK_NAME, last.updated_at, last.id)
+            await session.commit()
+            return len(applications)
+        finally:
+            await session.close()
+
+
+def setup_sheets_reconciler(config, db: Database,
+                            google_sheets_service: Optional[GoogleSheetsService]) -> Optional[SheetsReconciler]:
+    """
+    Создание периодической сверки БД с Google Sheets
+
+    Returns:
+        SheetsReconciler или None, если Google Sheets не настроен или сверка отключена
+    """
+    if not google_sheets_service or config.google.reconcile_interval <= 0:
+        return None
+
+    return SheetsReconciler(
+        db=db,
+        google_sheets_service=google_sheets_service,
+        interval=config.google.reconcile_interval,
+        batch_size=config.google.reconcile_batch_size,
+    )
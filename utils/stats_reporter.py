@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Optional, Callable, Dict, Any
+
+from utils.logging_config import log_error
+
+logger = logging.getLogger(__name__)
+
+
+class StatsReporter:
+    """Периодически пишет в лог метрики компонентов бота (очереди, квоты, пулы, кеши)"""
+
+    def __init__(self, interval: float = 300.0):
+        """
+        Args:
+            interval: Пауза между отчетами (секунды, 0 - только итоговый отчет при остановке)
+        """
+        self.interval = interval
+        # Заголовок строки лога -> функция, возвращающая метрики
+        self._sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def add(self, title: str, get_stats: Callable[[], Dict[str, Any]]):
+        """Добавить источник метрик"""
+        self._sources[title] = get_stats
+
+    def report(self):
+        """Записать в лог текущие метрики всех источников"""
+        for title, get_stats in self._sources.items():
+            try:
+                logger.info(f"{title}: {get_stats()}")
+            except Exception as e:
+                log_error(e, f"Ошибка получения метрик: {title}")
+
+    def start(self):
+        """Запуск периодических отчетов в фоне"""
+        if self._task is None and self.interval > 0:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run(), name="stats_reporter")
+            logger.info(f"📈 Отчет о метриках в лог раз в {self.interval:.0f} с")
+
+    async def stop(self):
+        """Остановка периодических отчетов"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                self.report()
+
+
+def setup_stats_reporter(config) -> StatsReporter:
+    """Создание периодического отчета о метриках (источники добавляются по мере настройки компонентов)"""
+    return StatsReporter(interval=config.stats_log_interval)